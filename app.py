@@ -1,10 +1,29 @@
 # app.py
-import os
 import base64
+import time
 import streamlit as st
-from proteinphonics.midi_generation import create_evolutionary_music
-from config import MIDIS_DIR, INSTRUMENT_MAP
+from proteinphonics import metrics
+from proteinphonics.audio import audio_available
+from proteinphonics import streaming
+from proteinphonics.jobs import get_executor, submit_alignment, submit_music, CANCELLED, DONE, FAILED
+from proteinphonics.utils import configure_logging, reference_record
+from proteinphonics.warm import start_warm_worker
+from config import CLADE_SECTIONS, INSTRUMENT_MAP, METRICS_PORT, STREAM_HOST, STREAM_PORT, WARM_WORKER
 import components.html_midi_player as html_midi_player  # New html-midi-player component wrapper
+import components.midi_stream_player as midi_stream_player
+
+POLL_INTERVAL_SECONDS = 0.5
+
+# st.rerun replaced st.experimental_rerun in newer Streamlit releases.
+rerun = getattr(st, "rerun", None) or st.experimental_rerun
+
+configure_logging()
+if WARM_WORKER:
+    # Import the pipeline and preload recent alignments off the request path (once per process).
+    start_warm_worker()
+if METRICS_PORT:
+    # Prometheus text on /metrics, JSON snapshot on /metrics.json (started once per process).
+    metrics.serve_metrics(METRICS_PORT)
 
 # Set page configuration
 st.set_page_config(page_title="ProteinPhonics", layout="wide")
@@ -17,6 +36,14 @@ st.sidebar.header("User Inputs")
 gene_name = st.sidebar.text_input("Gene Name", value="MT-CO1")
 tempo_bpm = st.sidebar.number_input("Tempo (BPM)", value=120, step=10)
 time_step = st.sidebar.number_input("Time Step (seconds)", value=0.1, step=0.1)
+# Sustain repeated residues and collapse conserved columns for much smaller files.
+compact = st.sidebar.checkbox("Compact events", value=False,
+                              help="Merge repeated residues into sustained notes and play fully conserved columns once.")
+# Stream notes to the player as they are rendered instead of embedding the whole file.
+stream_playback = bool(STREAM_PORT) and st.sidebar.checkbox(
+    "Stream playback", value=False, help="Start playing before the whole MIDI file has been rendered.")
+# Offer an audio render for browsers without good Web MIDI playback.
+render_audio = audio_available() and st.sidebar.checkbox("Also render audio (WAV)", value=False)
 
 # Advanced options inside an expander
 with st.sidebar.expander("Advanced: Species & Instrument Options", expanded=False):
@@ -27,6 +54,9 @@ with st.sidebar.expander("Advanced: Species & Instrument Options", expanded=Fals
     else:
         reference_species = None
 
+    # Large panels play better as a fixed set of consensus voices than one track per species.
+    voicing = st.radio("Voices", ["One per species", "Consensus", "Consensus by clade"], index=0)
+
     st.write("### Instrument Mapping")
     instrument_mapping = {}
     for species in selected_species:
@@ -36,39 +66,99 @@ with st.sidebar.expander("Advanced: Species & Instrument Options", expanded=Fals
             min_value=0, max_value=127, value=default_instrument, step=1
         )
 
+# Optional region of interest, to preview a domain of a long protein
+with st.sidebar.expander("Region of Interest", expanded=False):
+    region_mode = st.radio("Render", ["Whole alignment", "Residue range (reference species)", "Column range"])
+    region = {}
+    if region_mode != "Whole alignment":
+        first = st.number_input("From", min_value=1, value=1, step=1)
+        last = st.number_input("To", min_value=1, value=200, step=1)
+        if region_mode == "Column range":
+            # The UI is 1-based and inclusive; the API takes a 0-based, half-open window.
+            region["columns"] = (int(first) - 1, int(last))
+        else:
+            region["residues"] = (int(first), int(last))
+
 if st.button("Generate Music"):
     if not gene_name:
         st.error("Please enter a valid gene name.")
     elif not selected_species:
         st.error("Please select at least one species.")
     else:
-        with st.spinner("Processing... This may take a few moments."):
+        render = dict(tempo_bpm=tempo_bpm, time_step=time_step, compact=compact, **region)
+        # Streaming covers per-species rendering; consensus voices and audio need the whole file.
+        streamed = stream_playback and voicing == "One per species" and not render_audio
+        if streamed:
+            # Note chunks are served from a thread of this process, started on first use.
             try:
-                midi_filename = os.path.join(MIDIS_DIR, f"{gene_name}.mid")
-                create_evolutionary_music(
-                    gene_name,
-                    selected_species,
-                    reference_species,
-                    midi_filename=midi_filename,
-                    tempo_bpm=tempo_bpm,
-                    time_step=time_step,
-                    instrument_mapping=instrument_mapping
-                )
-                st.success("MIDI file generated successfully!")
-                
-                # Provide a download button for the MIDI file
-                with open(midi_filename, "rb") as midi_file:
-                    st.download_button("Download MIDI", midi_file, file_name=f"{gene_name}.mid", mime="audio/midi")
-                
-                # Read and encode the MIDI file as a base64 data URL
-                with open(midi_filename, "rb") as f:
-                    midi_bytes = f.read()
-                midi_base64 = base64.b64encode(midi_bytes).decode("utf-8")
-                midi_data_url = f"data:audio/midi;base64,{midi_base64}"
-                # midi_data_url = midi_filename  # Use the file path directly
-                
-                st.write("### Interactive MIDI Player")
-                # Call the new html-midi-player component with the data URL
-                html_midi_player.st_html_midi_player(midi_file_url=midi_data_url, height=300)
-            except Exception as e:
-                st.error(f"An error occurred during processing: {e}")
+                streaming.serve_streams(STREAM_PORT, STREAM_HOST)
+            except OSError as exc:
+                st.warning(f"Streamed playback is unavailable ({exc}); rendering the whole file instead.")
+                streamed = False
+        if streamed:
+            # Only fetch + align run as a job; notes are rendered when the player connects.
+            job = submit_alignment(gene_name, selected_species, reference_species)
+            st.session_state["stream_params"] = dict(render, instrument_mapping=instrument_mapping,
+                                                     reference=reference_record(reference_species))
+        else:
+            # Run the pipeline on the shared background pool; this script only polls it.
+            job = submit_music(
+                gene_name,
+                selected_species,
+                reference_species,
+                instrument_mapping=instrument_mapping,
+                reduce=voicing != "One per species",
+                sections=CLADE_SECTIONS if voicing == "Consensus by clade" else None,
+                audio_format="wav" if render_audio else None,
+                **render
+            )
+        st.session_state["job_streamed"] = streamed
+        st.session_state.pop("stream_token", None)
+        st.session_state["job_id"] = job.id
+        st.session_state["job_gene"] = gene_name
+
+job = get_executor().get(st.session_state["job_id"]) if "job_id" in st.session_state else None
+if job is not None and not job.done():
+    latest = job.latest
+    if latest is not None and latest.total:
+        # st.progress only takes a label (text=) from Streamlit 1.18 on.
+        st.progress(min(latest.current / latest.total, 1.0))
+        st.caption(latest.message)
+    else:
+        st.info(latest.message if latest is not None else "Queued...")
+    if st.button("Cancel"):
+        job.cancel()
+    # Poll again shortly without holding the worker.
+    time.sleep(POLL_INTERVAL_SECONDS)
+    rerun()
+elif job is not None and job.status == DONE and st.session_state.get("job_streamed"):
+    # The job's result is the alignment file; register it with the stream server once.
+    if "stream_token" not in st.session_state:
+        st.session_state["stream_token"] = streaming.register_stream(job.result, **st.session_state["stream_params"])
+    token = st.session_state["stream_token"]
+    st.success("Alignment ready; press Play to stream.")
+    st.write("### Streaming MIDI Player")
+    midi_stream_player.st_midi_stream_player(streaming.stream_url(token), streaming.stream_url(token, "midi"))
+elif job is not None and job.status == DONE:
+    gene = st.session_state.get("job_gene", gene_name)
+    midi_bytes = job.result.midi_bytes
+    st.success("MIDI file generated successfully!")
+
+    # Provide a download button for the MIDI file
+    st.download_button("Download MIDI", midi_bytes, file_name=f"{gene}.mid", mime="audio/midi")
+
+    # Encode the MIDI bytes as a base64 data URL
+    midi_base64 = base64.b64encode(midi_bytes).decode("utf-8")
+    midi_data_url = f"data:audio/midi;base64,{midi_base64}"
+
+    st.write("### Interactive MIDI Player")
+    # Call the new html-midi-player component with the data URL
+    html_midi_player.st_html_midi_player(midi_file_url=midi_data_url, height=300)
+
+    if job.result.audio_path:
+        st.write("### Audio")
+        st.audio(job.result.audio_path, format="audio/wav")
+elif job is not None and job.status == CANCELLED:
+    st.warning("Generation was cancelled.")
+elif job is not None and job.status == FAILED:
+    st.error(f"An error occurred during processing: {job.error}")
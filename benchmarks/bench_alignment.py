@@ -0,0 +1,56 @@
+# benchmarks/bench_alignment.py
+"""
+Compare alignment backends on the bundled HOXA5 / MT-CO1 / RPLP0 panels.
+
+Usage:
+    python benchmarks/bench_alignment.py [--repeat N] [--backend NAME ...]
+
+Backends that are not available here (e.g. MUSCLE without the executable on
+PATH) are reported as skipped. Caching is bypassed: each run calls the
+backend's `align` directly on the FASTA records.
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import FASTA_DIR  # noqa: E402
+from proteinphonics.alignment import ALIGNMENT_BACKENDS  # noqa: E402
+from proteinphonics.utils import read_fasta  # noqa: E402
+
+GENES = ["HOXA5", "MT-CO1", "RPLP0"]
+
+
+def bench(backend, records, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        aligned = backend.align(records, reference=records[0][0])
+        timings.append(time.perf_counter() - start)
+    return min(timings), len(aligned[0][1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per backend and gene (best is reported).")
+    parser.add_argument("--backend", action="append", help="Backend(s) to run (default: all registered).")
+    args = parser.parse_args()
+
+    names = args.backend or list(ALIGNMENT_BACKENDS)
+    print(f"{'gene':<8} {'seqs':>4} {'max len':>7}  {'backend':<8} {'best (s)':>9} {'columns':>7}")
+    for gene in GENES:
+        records = read_fasta(os.path.join(FASTA_DIR, f"{gene}.fasta"))
+        max_len = max(len(seq) for _, seq in records)
+        for name in names:
+            backend = ALIGNMENT_BACKENDS[name]()
+            if not backend.is_available():
+                print(f"{gene:<8} {len(records):>4} {max_len:>7}  {name:<8} {'skipped':>9}")
+                continue
+            best, columns = bench(backend, records, args.repeat)
+            print(f"{gene:<8} {len(records):>4} {max_len:>7}  {name:<8} {best:>9.3f} {columns:>7}")
+
+
+if __name__ == "__main__":
+    main()
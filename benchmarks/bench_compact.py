@@ -0,0 +1,63 @@
+# benchmarks/bench_compact.py
+"""
+Measure what event compaction saves on the bundled alignments.
+
+Usage:
+    python benchmarks/bench_compact.py [--time-step S] [--repeat N]
+
+Each data/alignments/aligned_*.fasta is rendered with and without `compact`.
+Reported per gene: notes (note-on/note-off pairs), MIDI bytes, the size of
+the base64 data URL the web player receives, and the time to parse the file
+back into note objects with pretty_midi, which is what the browser player does
+(through @magenta/music) before it can start playing.
+"""
+import argparse
+import base64
+import glob
+import io
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import AA_PITCH_MAP, INSTRUMENT_MAP  # noqa: E402
+from proteinphonics.alignment import read_alignment  # noqa: E402
+from proteinphonics.midi_generation import alignment_to_matrix, matrix_to_tracks  # noqa: E402
+from proteinphonics.smf import encode_midi  # noqa: E402
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def load_time(midi_bytes, repeat):
+    import pretty_midi
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        pretty_midi.PrettyMIDI(io.BytesIO(midi_bytes))
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--time-step", type=float, default=0.1)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'gene':<8} {'mode':<8} {'notes':>7} {'bytes':>8} {'data URL':>9} {'load (ms)':>10}")
+    for path in sorted(glob.glob(os.path.join(ROOT, "data", "alignments", "aligned_*.fasta"))):
+        gene = os.path.basename(path)[len("aligned_"):-len(".fasta")]
+        ids, matrix = alignment_to_matrix(read_alignment(path))
+        for compact in (False, True):
+            tracks = matrix_to_tracks(ids, matrix, AA_PITCH_MAP, INSTRUMENT_MAP, 120, args.time_step, compact)
+            midi_bytes = encode_midi(tracks, 120)
+            notes = sum(len(track.starts) for track in tracks)
+            url = len(base64.b64encode(midi_bytes))
+            seconds = load_time(midi_bytes, args.repeat)
+            print(f"{gene:<8} {'compact' if compact else 'full':<8} {notes:>7} {len(midi_bytes):>8} {url:>9} "
+                  f"{seconds * 1000:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,309 @@
+# benchmarks/ensembl_stub.py
+"""
+Local stand-in for the Ensembl REST endpoints used by ProteinPhonics.
+
+Usage:
+    python benchmarks/ensembl_stub.py [--port 8765] [--latency 0.05] [--throttle-every 20]
+    PROTEINPHONICS_ENSEMBL_SERVER=http://127.0.0.1:8765 streamlit run app.py
+
+Responses are replayed from a recording: {gene: {species: {"protein_id", "seq"}}},
+seeded by default from the bundled data/fasta/*.fasta files (HOXA5, MT-CO1,
+RPLP0). With `synthetic=True`, unknown genes and species get deterministic
+made-up sequences, so load tests can use arbitrary gene names and panels.
+
+Served endpoints:
+    GET  /info/data
+    POST /lookup/symbol/{species}          (expand=1 adds Transcript/Translation)
+    GET  /homology/symbol/{species}/{symbol}?target_species=...  (repeatable; format=condensed)
+    POST /sequence/id                      ({"ids": [...]}, JSON list response)
+    GET  /sequence/id/{protein_id}         (FASTA)
+
+Every response waits `latency` (+ uniform `jitter`) seconds, and every
+`throttle_every`-th request is answered with 429 and a Retry-After header,
+like Ensembl's rate limiter.
+"""
+import argparse
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BUNDLED_FASTA_DIR = os.path.join(ROOT, "data", "fasta")
+RELEASE = 111
+RESIDUES = "ACDEFGHIKLMNPQRSTVWY"
+
+
+def _read_fasta(path):
+    records, name, chunks = {}, None, []
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if line.startswith(">"):
+                if name is not None:
+                    records[name] = "".join(chunks)
+                name, chunks = line[1:].split()[0], []
+            elif line:
+                chunks.append(line)
+    if name is not None:
+        records[name] = "".join(chunks)
+    return records
+
+
+def protein_id(gene, species):
+    """Deterministic stand-in for an Ensembl protein stable ID."""
+    return "ENSPSTUB" + hashlib.sha1(f"{gene}|{species}".encode()).hexdigest()[:11].upper()
+
+
+def synthetic_sequence(gene, species, length=None):
+    """
+    Deterministic made-up protein: the gene's "ancestral" sequence with
+    species-specific point mutations, so panels still align sensibly.
+    """
+    gene_rng = random.Random(f"gene:{gene}")
+    length = length or gene_rng.randint(150, 600)
+    ancestral = [gene_rng.choice(RESIDUES) for _ in range(length)]
+    rng = random.Random(f"{gene}|{species}")
+    for i in range(length):
+        if rng.random() < 0.1:
+            ancestral[i] = rng.choice(RESIDUES)
+    return "M" + "".join(ancestral[1:])
+
+
+def bundled_recordings(fasta_dir=BUNDLED_FASTA_DIR):
+    """
+    Build a recording from FASTA files named `{gene}.fasta` with `>{species}` headers.
+    Fetched panels (`{gene}.{hash}.fasta`) in the same directory are skipped.
+    """
+    recordings = {}
+    for filename in sorted(os.listdir(fasta_dir)):
+        if not filename.endswith(".fasta") or filename.count(".") != 1:
+            continue
+        gene = filename[:-len(".fasta")]
+        recordings[gene] = {species: {"protein_id": protein_id(gene, species), "seq": seq}
+                            for species, seq in _read_fasta(os.path.join(fasta_dir, filename)).items()}
+    return recordings
+
+
+class EnsemblStub:
+    """
+    Threaded HTTP server replaying recorded Ensembl responses.
+
+    Parameters:
+        recordings (dict): {gene: {species: {"protein_id": str, "seq": str}}}.
+        latency (float): Seconds added to every response.
+        jitter (float): Extra uniform random latency in [0, jitter).
+        throttle_every (int): Answer every Nth request with 429 (0 disables).
+        retry_after (float): Retry-After value sent with 429s.
+        synthetic (bool): Invent deterministic data for unknown genes/species.
+        host (str), port (int): Bind address (port 0 picks a free port).
+    """
+
+    def __init__(self, recordings=None, latency=0.0, jitter=0.0, throttle_every=0, retry_after=0.1,
+                 synthetic=False, host="127.0.0.1", port=0, seed=0):
+        self.recordings = bundled_recordings() if recordings is None else recordings
+        self.latency = latency
+        self.jitter = jitter
+        self.throttle_every = throttle_every
+        self.retry_after = retry_after
+        self.synthetic = synthetic
+        self.stats = Counter()
+        self._rng = random.Random(seed)
+        self._count = 0
+        self._lock = threading.Lock()
+        self._by_protein = {}
+        for gene, panel in self.recordings.items():
+            for species, entry in panel.items():
+                self._by_protein[entry["protein_id"]] = (gene, species)
+        self._server = ThreadingHTTPServer((host, port), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, name="ensembl-stub", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def reset_stats(self):
+        with self._lock:
+            self.stats.clear()
+            self._count = 0
+
+    # Data access ----------------------------------------------------------
+
+    def entry(self, gene, species):
+        entry = self.recordings.get(gene, {}).get(species)
+        if entry is None and self.synthetic:
+            entry = {"protein_id": protein_id(gene, species), "seq": synthetic_sequence(gene, species)}
+            with self._lock:
+                self.recordings.setdefault(gene, {})[species] = entry
+                self._by_protein[entry["protein_id"]] = (gene, species)
+        return entry
+
+    def sequence(self, pid):
+        key = self._by_protein.get(pid)
+        if key is None:
+            return None
+        gene, species = key
+        return self.recordings[gene][species]["seq"]
+
+    def gene_object(self, gene, species, expand):
+        entry = self.entry(gene, species)
+        if entry is None:
+            return None
+        gene_id = "ENSGSTUB" + entry["protein_id"][8:]
+        obj = {"id": gene_id, "display_name": gene, "species": species, "object_type": "Gene"}
+        if expand:
+            obj["Transcript"] = [{"id": "ENSTSTUB" + entry["protein_id"][8:],
+                                  "Translation": {"id": entry["protein_id"], "length": len(entry["seq"])}}]
+        return obj
+
+    def homology(self, species, symbol, target_species, condensed=False):
+        source = self.entry(symbol, species)
+        if source is None:
+            return {"data": []}
+        targets = target_species or [s for s in self.recordings.get(symbol, {}) if s != species]
+        homologies = []
+        for target in targets:
+            entry = self.entry(symbol, target)
+            if entry is not None and condensed:
+                homologies.append({"type": "ortholog_one2one", "species": target, "protein_id": entry["protein_id"],
+                                   "id": "ENSGSTUB" + entry["protein_id"][8:],
+                                   "method_link_type": "ENSEMBL_ORTHOLOGUES"})
+            elif entry is not None:
+                homologies.append({
+                    "type": "ortholog_one2one",
+                    "source": {"species": species, "protein_id": source["protein_id"]},
+                    "target": {"species": target, "protein_id": entry["protein_id"],
+                               "id": "ENSGSTUB" + entry["protein_id"][8:]},
+                })
+        return {"data": [{"id": "ENSGSTUB" + source["protein_id"][8:], "homologies": homologies}]}
+
+    # HTTP -----------------------------------------------------------------
+
+    def _admit(self, path):
+        """Apply injected latency; return False if this request should get a 429."""
+        with self._lock:
+            self._count += 1
+            throttled = bool(self.throttle_every) and self._count % self.throttle_every == 0
+            delay = self.latency + (self._rng.uniform(0, self.jitter) if self.jitter else 0.0)
+            self.stats["requests"] += 1
+            self.stats["throttled" if throttled else "served"] += 1
+            self.stats["/".join(path.split("/")[:3])] += 1
+        if delay:
+            time.sleep(delay)
+        return not throttled
+
+    def _handler_class(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def _send(self, status, body, content_type="application/json", headers=None):
+                if not isinstance(body, bytes):
+                    body = json.dumps(body).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def _route(self, method):
+                url = urlparse(self.path)
+                query = parse_qs(url.query)
+                length = int(self.headers.get("Content-Length") or 0)
+                payload = json.loads(self.rfile.read(length) or b"{}") if length else {}
+                if not stub._admit(url.path):
+                    self._send(429, {"error": "Too many requests"}, headers={"Retry-After": str(stub.retry_after)})
+                    return
+                parts = url.path.strip("/").split("/")
+                expand = query.get("expand", ["0"])[0] in ("1", "true")
+
+                if method == "GET" and parts == ["info", "data"]:
+                    self._send(200, {"releases": [RELEASE]})
+                elif method == "POST" and parts[:2] == ["lookup", "symbol"] and len(parts) == 3:
+                    self._send(200, {symbol: stub.gene_object(symbol, parts[2], expand)
+                                     for symbol in payload.get("symbols", [])})
+                elif method == "GET" and parts[:2] == ["homology", "symbol"] and len(parts) == 4:
+                    condensed = query.get("format", ["full"])[0] == "condensed"
+                    self._send(200, stub.homology(parts[2], parts[3], query.get("target_species"), condensed))
+                elif method == "POST" and parts == ["sequence", "id"]:
+                    found = [{"id": pid, "query": pid, "seq": stub.sequence(pid), "molecule": "protein"}
+                             for pid in payload.get("ids", []) if stub.sequence(pid) is not None]
+                    self._send(200, found)
+                elif method == "GET" and parts[:2] == ["sequence", "id"] and len(parts) == 3:
+                    seq = stub.sequence(parts[2])
+                    if seq is None:
+                        self._send(400, {"error": f"ID '{parts[2]}' not found"})
+                    else:
+                        self._send(200, f">{parts[2]}\n{seq}\n".encode("ascii"), content_type="text/x-fasta")
+                else:
+                    self._send(404, {"error": f"Unknown endpoint {url.path}"})
+
+            def do_GET(self):
+                self._route("GET")
+
+            def do_POST(self):
+                self._route("POST")
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds added to every response.")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Extra uniform random latency.")
+    parser.add_argument("--throttle-every", type=int, default=0, help="Answer every Nth request with 429.")
+    parser.add_argument("--retry-after", type=float, default=0.1, help="Retry-After seconds sent with 429s.")
+    parser.add_argument("--recordings", help="JSON recording file (default: bundled FASTA data).")
+    parser.add_argument("--synthetic", action="store_true", help="Invent data for unknown genes/species.")
+    parser.add_argument("--dump", metavar="PATH", help="Write the recording to PATH and exit.")
+    args = parser.parse_args()
+
+    recordings = None
+    if args.recordings:
+        with open(args.recordings) as f:
+            recordings = json.load(f)
+    stub = EnsemblStub(recordings, latency=args.latency, jitter=args.jitter, throttle_every=args.throttle_every,
+                       retry_after=args.retry_after, synthetic=args.synthetic, host=args.host, port=args.port)
+    if args.dump:
+        with open(args.dump, "w") as f:
+            json.dump(stub.recordings, f, indent=2, sort_keys=True)
+        return
+    print(f"Ensembl stub listening on {stub.url} (set PROTEINPHONICS_ENSEMBL_SERVER={stub.url})")
+    try:
+        stub._server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+# benchmarks/fixtures.py
+"""
+Deterministic inputs for the benchmark suite.
+
+- `FakeBackend`: an alignment backend that needs no MUSCLE binary. It pads
+  every sequence with trailing gaps to the longest length, so it costs O(total
+  residues) and isolates the pipeline's own overhead from aligner runtime.
+- `write_synthetic_alignment`: aligned FASTA files of any (species x columns)
+  size, written in blocks so 500 x 100k alignments never sit in memory as
+  Python strings.
+"""
+import numpy as np
+
+from config import AA_PITCH_MAP, INSTRUMENT_MAP
+from proteinphonics.alignment import AlignmentBackend, register_backend
+
+ALPHABET = np.frombuffer(b"".join(aa.encode() for aa in AA_PITCH_MAP) + b"-", dtype=np.uint8)
+FASTA_LINE = 60
+
+
+@register_backend
+class FakeBackend(AlignmentBackend):
+    """
+    Stand-in aligner: pads sequences to equal length with trailing gaps.
+    """
+    name = "fake"
+
+    def align(self, records, reference=None):
+        width = max(len(seq) for _, seq in records)
+        return [(name, seq.ljust(width, "-")) for name, seq in records]
+
+    def profile_align(self, aligned, new_records, reference=None):
+        width = max(len(aligned[0][1]), max(len(seq) for _, seq in new_records))
+        return [(name, seq.ljust(width, "-")) for name, seq in list(aligned) + list(new_records)]
+
+
+def species_ids(count):
+    """Record IDs for `count` species: the configured panel first, then numbered extras."""
+    base = [species.lower().replace(" ", "_") for species in INSTRUMENT_MAP]
+    return [base[i] if i < len(base) else f"{base[i % len(base)]}_{i}" for i in range(count)]
+
+
+def synthetic_matrix(species, columns, gap_fraction=0.1, seed=0):
+    """Random alignment matrix (uint8) with ~`gap_fraction` gaps."""
+    rng = np.random.default_rng(seed)
+    weights = np.full(len(ALPHABET), (1.0 - gap_fraction) / (len(ALPHABET) - 1))
+    weights[-1] = gap_fraction
+    return rng.choice(ALPHABET, size=(species, columns), p=weights).astype(np.uint8)
+
+
+def write_synthetic_alignment(path, species, columns, gap_fraction=0.1, seed=0):
+    """
+    Write a synthetic aligned FASTA file of `species` rows and `columns` columns.
+    Rows are generated one at a time.
+
+    Returns:
+        str: `path`.
+    """
+    ids = species_ids(species)
+    rng_seeds = np.random.SeedSequence(seed).spawn(species)
+    with open(path, "w") as f:
+        for record_id, row_seed in zip(ids, rng_seeds):
+            row = synthetic_matrix(1, columns, gap_fraction, row_seed)[0].tobytes().decode("ascii")
+            f.write(f">{record_id}\n")
+            for start in range(0, columns, FASTA_LINE):
+                f.write(row[start:start + FASTA_LINE] + "\n")
+    return path
+
+
+def unaligned_records(species, length, seed=0):
+    """Ungapped (name, sequence) records derived from one synthetic ancestor."""
+    rng = np.random.default_rng(seed)
+    residues = ALPHABET[:-1]
+    ancestor = rng.choice(residues, size=length)
+    records = []
+    for record_id in species_ids(species):
+        seq = ancestor.copy()
+        mutate = rng.random(length) < 0.1
+        seq[mutate] = rng.choice(residues, size=int(mutate.sum()))
+        # Random indels so the aligner has real work to do.
+        keep = rng.random(length) > 0.03
+        records.append((record_id, seq[keep].tobytes().decode("ascii")))
+    return records
+
@@ -0,0 +1,148 @@
+# benchmarks/load_service.py
+"""
+Load-test the headless generation API against the local Ensembl stub.
+
+Usage:
+    python benchmarks/load_service.py [--requests 200] [--concurrency 32] [--genes 8]
+                                      [--workers 2] [--max-pending 8] [--latency 0.05]
+
+Starts the Ensembl stub (synthetic data, so any gene symbol resolves) and
+`python -m proteinphonics serve` in a temporary working directory, then sends
+POST /generate requests from `concurrency` client threads. Requests cycle
+through `genes` gene symbols and two tempos, so identical requests overlap and
+exercise coalescing. 429 responses are counted, not retried, unless
+`--retry` is given, in which case clients honour Retry-After.
+
+Reported: throughput, status codes, X-Cache results (miss / coalesced / hit),
+latency percentiles of successful requests, the largest X-Queue-Depth seen,
+and the Ensembl requests the stub served.
+"""
+import argparse
+import http.client
+import itertools
+import json
+import os
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import INSTRUMENT_MAP  # noqa: E402
+from ensembl_stub import EnsemblStub  # noqa: E402
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_ready(port, process, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            sys.exit(f"The service exited with code {process.returncode}.")
+        try:
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=1)
+            conn.request("GET", "/health")
+            if conn.getresponse().status == 200:
+                return
+        except OSError:
+            time.sleep(0.1)
+    sys.exit("The service did not start in time.")
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))] if values else float("nan")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--requests", type=int, default=200, help="Total requests to send.")
+    parser.add_argument("--concurrency", type=int, default=32, help="Client threads.")
+    parser.add_argument("--genes", type=int, default=8, help="Distinct (synthetic) gene symbols.")
+    parser.add_argument("--species", type=int, default=5, help="Species per panel (from INSTRUMENT_MAP).")
+    parser.add_argument("--workers", type=int, default=2, help="Service worker processes.")
+    parser.add_argument("--max-pending", type=int, default=8, help="Service in-flight limit.")
+    parser.add_argument("--backend", default="star", help="Alignment backend for the service.")
+    parser.add_argument("--latency", type=float, default=0.05, help="Stub response latency (seconds).")
+    parser.add_argument("--retry", action="store_true", help="Retry 429s after Retry-After.")
+    args = parser.parse_args()
+
+    stub = EnsemblStub(synthetic=True, latency=args.latency).start()
+    workdir = tempfile.mkdtemp(prefix="proteinphonics-load-")
+    port = free_port()
+    env = dict(os.environ, PYTHONPATH=ROOT, PROTEINPHONICS_ENSEMBL_SERVER=stub.url,
+               PROTEINPHONICS_LOG_LEVEL=os.environ.get("PROTEINPHONICS_LOG_LEVEL", "WARNING"))
+    service = subprocess.Popen(
+        [sys.executable, "-m", "proteinphonics", "serve", "--port", str(port), "--workers", str(args.workers),
+         "--max-pending", str(args.max_pending), "--backend", args.backend], cwd=workdir, env=env)
+    species = list(INSTRUMENT_MAP)[:args.species]
+    statuses, caches, latencies = Counter(), Counter(), []
+    depth = [0]
+    lock = threading.Lock()
+    counter = itertools.count()
+
+    def client():
+        conn = http.client.HTTPConnection("127.0.0.1", port, timeout=300)
+        while True:
+            n = next(counter)
+            if n >= args.requests:
+                break
+            body = json.dumps({"gene": f"LOAD{n % args.genes}", "species": species,
+                               "tempo": 120 if (n // args.genes) % 2 else 90})
+            while True:
+                start = time.perf_counter()
+                conn.request("POST", "/generate", body, {"Content-Type": "application/json"})
+                response = conn.getresponse()
+                response.read()
+                seconds = time.perf_counter() - start
+                with lock:
+                    statuses[response.status] += 1
+                    depth[0] = max(depth[0], int(response.getheader("X-Queue-Depth") or 0))
+                    if response.status == 200:
+                        caches[response.getheader("X-Cache")] += 1
+                        latencies.append(seconds)
+                if response.status != 429 or not args.retry:
+                    break
+                time.sleep(float(response.getheader("Retry-After") or 1))
+
+    try:
+        wait_ready(port, service)
+        stub.reset_stats()
+        start = time.perf_counter()
+        threads = [threading.Thread(target=client) for _ in range(args.concurrency)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+    finally:
+        service.terminate()
+        service.wait(30)
+        stub.stop()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    ok = statuses.get(200, 0)
+    print(f"{args.requests} requests, {args.concurrency} clients, {args.genes} genes x 2 tempos, "
+          f"{args.workers} workers, max pending {args.max_pending}")
+    print(f"elapsed      {elapsed:.2f} s ({ok / elapsed:.1f} successful requests/s)")
+    print(f"status       {dict(sorted(statuses.items()))}")
+    print(f"cache        {dict(caches)}")
+    print(f"latency      p50 {percentile(latencies, 0.5) * 1000:.0f} ms, p95 {percentile(latencies, 0.95) * 1000:.0f} ms, "
+          f"max {max(latencies, default=float('nan')) * 1000:.0f} ms")
+    print(f"queue depth  max {depth[0]}")
+    print(f"ensembl      {stub.stats['requests']} requests")
+
+
+if __name__ == "__main__":
+    main()
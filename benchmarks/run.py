@@ -0,0 +1,409 @@
+# benchmarks/run.py
+"""
+Offline, reproducible benchmark suite for the generation pipeline.
+
+Usage:
+    python benchmarks/run.py [--quick] [--only startup,fetch,align,read,midi,e2e] [--output PATH]
+    python benchmarks/run.py --compare BASE.json HEAD.json [--tolerance 0.15]
+
+Nothing touches rest.ensembl.org or needs MUSCLE:
+
+- startup times module imports in fresh interpreters: what app.py imports at
+  the top (which must not pull in HEAVY_IMPORTS) and the full pipeline;
+- fetch and end-to-end runs talk to a local Ensembl stub (benchmarks/ensembl_stub.py)
+  that replays the bundled HOXA5 / MT-CO1 / RPLP0 data with injected latency and 429s;
+- alignment uses the in-process `fake` and `star` backends (and MUSCLE only if it is on PATH);
+- read_alignment, alignment_to_midi (per-species and consensus-reduced) and
+  re-rendering from a loaded feature index run on synthetic alignments from 100 to 100k columns and 2 to 500 species
+  (capped by --max-cells).
+
+Everything runs in a throwaway working directory, so the data/ caches and the
+SQLite database start empty. Results (best/mean seconds, throughput and peak
+traced memory per case) are written as stable, sorted JSON; `--compare`
+diffs two result files and exits non-zero on regressions beyond the tolerance.
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from ensembl_stub import BUNDLED_FASTA_DIR, EnsemblStub, _read_fasta  # noqa: E402
+
+BENCHMARKS = ("startup", "fetch", "align", "read", "midi", "e2e")
+FULL_COLUMNS = (100, 1_000, 10_000, 100_000)
+FULL_SPECIES = (2, 20, 100, 500)
+QUICK_COLUMNS = (100, 1_000)
+QUICK_SPECIES = (2, 20)
+
+# Import sets timed by the startup benchmark (run from the repository root).
+STARTUP_IMPORTS = {
+    "app": ["config", "proteinphonics.metrics", "proteinphonics.audio", "proteinphonics.jobs",
+            "proteinphonics.streaming", "proteinphonics.utils", "proteinphonics.warm"],
+    "cli": ["proteinphonics.__main__"],
+    "pipeline": ["proteinphonics.warm", "proteinphonics.results", "proteinphonics.batch"],
+}
+# Third-party modules the app must not import at startup.
+HEAVY_IMPORTS = ("numpy", "requests", "pretty_midi", "mido", "Bio", "sqlite3")
+
+
+def measure(fn, repeat, setup=None, memory=True):
+    """
+    Time `fn` `repeat` times (calling `setup` before each run, untimed), then
+    once more under tracemalloc for the peak traced allocation.
+    """
+    timings = []
+    result = None
+    for _ in range(repeat):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        result = fn()
+        timings.append(time.perf_counter() - start)
+    stats = {"best_s": min(timings), "mean_s": sum(timings) / len(timings), "repeat": repeat}
+    if memory:
+        if setup:
+            setup()
+        tracemalloc.start()
+        try:
+            fn()
+            stats["peak_mb"] = tracemalloc.get_traced_memory()[1] / 2 ** 20
+        finally:
+            tracemalloc.stop()
+    return stats, result
+
+
+class Suite:
+    """
+    Collects benchmark records and owns the shared fixtures (stub, work directory).
+    """
+
+    def __init__(self, args, stub, workdir):
+        self.args = args
+        self.stub = stub
+        self.workdir = workdir
+        self.results = []
+        self.columns = QUICK_COLUMNS if args.quick else FULL_COLUMNS
+        self.species = QUICK_SPECIES if args.quick else FULL_SPECIES
+
+    def record(self, benchmark, case, params, stats, work=None, unit=None, **extra):
+        entry = {"benchmark": benchmark, "case": case, "params": params}
+        entry.update({key: round(value, 6) if isinstance(value, float) else value for key, value in stats.items()})
+        if work is not None:
+            entry["work"] = work
+            entry["throughput"] = round(work / stats["best_s"], 3) if stats["best_s"] else None
+            entry["unit"] = unit
+        entry.update(extra)
+        self.results.append(entry)
+        rate = f"{entry['throughput']:>14,.0f} {unit}" if work is not None and entry["throughput"] else ""
+        print(f"{benchmark:<6} {case:<40} {stats['best_s']:>10.4f}s {stats.get('peak_mb', 0):>9.1f}MB {rate}",
+              flush=True)
+
+    def reset_state(self):
+        """Drop every on-disk cache in the work directory."""
+        assert os.path.realpath(os.getcwd()) == os.path.realpath(self.workdir)
+        shutil.rmtree("data", ignore_errors=True)
+        for name in os.listdir("."):
+            if name.startswith("proteinphonics.db"):
+                os.remove(name)
+
+    def grid(self):
+        for species in self.species:
+            for columns in self.columns:
+                if self.args.max_cells and species * columns > self.args.max_cells:
+                    continue
+                yield species, columns
+
+
+def bundled_panels():
+    """{gene: (species names, records)} from the bundled FASTA files."""
+    panels = {}
+    for filename in sorted(os.listdir(BUNDLED_FASTA_DIR)):
+        if filename.endswith(".fasta") and filename.count(".") == 1:
+            records = list(_read_fasta(os.path.join(BUNDLED_FASTA_DIR, filename)).items())
+            species = [name.replace("_", " ").capitalize() for name, _ in records]
+            panels[filename[:-len(".fasta")]] = (species, records)
+    return panels
+
+
+def _import_seconds(modules):
+    """
+    Import `modules` in a fresh interpreter; return (seconds spent importing,
+    heavy modules it loaded). Interpreter startup itself is not counted.
+    """
+    code = ("import sys, time; start = time.perf_counter()\n"
+            + "".join(f"import {name}\n" for name in modules)
+            + "print(time.perf_counter() - start); "
+            + f"print(','.join(m for m in {HEAVY_IMPORTS!r} if m in sys.modules))")
+    output = subprocess.run([sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True,
+                            check=True).stdout.splitlines()
+    return float(output[0]), [name for name in output[1].split(",") if name]
+
+
+def bench_startup(suite):
+    for case, modules in STARTUP_IMPORTS.items():
+        timings, heavy = [], []
+        for _ in range(max(suite.args.repeat, 3)):
+            seconds, heavy = _import_seconds(modules)
+            timings.append(seconds)
+        stats = {"best_s": min(timings), "mean_s": sum(timings) / len(timings), "repeat": len(timings)}
+        suite.record("startup", f"import {case}", {"modules": modules}, stats, heavy_imports=heavy)
+        if case == "app" and heavy:
+            print(f"startup: app imports pull in {', '.join(heavy)} at startup", file=sys.stderr)
+
+
+def bench_fetch(suite):
+    from proteinphonics.ensembl import TokenBucket, get_client
+    from proteinphonics.fetch import fetch_sequences
+    args, stub = suite.args, suite.stub
+    client = get_client()
+    cases = [("cold", latency, 0) for latency in args.latency]
+    if args.throttle_every:
+        cases.append(("cold-throttled", max(args.latency), args.throttle_every))
+
+    for gene, (species, _) in bundled_panels().items():
+        for label, latency, throttle_every in cases:
+            def setup():
+                suite.reset_state()
+                stub.reset_stats()
+                stub.latency, stub.throttle_every = latency, throttle_every
+                client.limiter = TokenBucket(args.rps, args.rps)
+
+            stats, _ = measure(lambda: fetch_sequences(gene, species, species[0]), args.repeat, setup)
+            suite.record("fetch", f"{gene} {label} latency={latency}", {
+                "gene": gene, "species": len(species), "latency": latency, "throttle_every": throttle_every,
+            }, stats, work=len(species), unit="species/s",
+                requests=stub.stats["requests"], throttled=stub.stats["throttled"])
+
+        stub.latency, stub.throttle_every = 0.0, 0
+        fetch_sequences(gene, species, species[0])
+        stub.reset_stats()
+        stats, _ = measure(lambda: fetch_sequences(gene, species, species[0]), args.repeat)
+        suite.record("fetch", f"{gene} warm", {"gene": gene, "species": len(species)}, stats,
+                     work=len(species), unit="species/s", requests=stub.stats["requests"])
+
+
+def bench_align(suite):
+    from fixtures import unaligned_records
+    from proteinphonics.alignment import ALIGNMENT_BACKENDS
+    args = suite.args
+    backends = [cls() for name, cls in sorted(ALIGNMENT_BACKENDS.items())]
+    backends = [backend for backend in backends if backend.is_available()]
+
+    inputs = [(gene, records, {"gene": gene}) for gene, (_, records) in bundled_panels().items()]
+    lengths = (100, 1_000) if not args.quick else (100,)
+    for species in suite.species:
+        for length in lengths:
+            inputs.append((f"synthetic {species}x{length}", unaligned_records(species, length),
+                           {"species": species, "length": length}))
+
+    for backend in backends:
+        for case, records, params in inputs:
+            residues = sum(len(seq) for _, seq in records)
+            longest = max(len(seq) for _, seq in records)
+            if backend.name != "fake" and args.max_dp_cells and len(records) * longest ** 2 > args.max_dp_cells:
+                continue
+            stats, _ = measure(lambda: backend.align(records, reference=records[0][0]), args.repeat,
+                               memory=backend.name != "muscle")
+            suite.record("align", f"{backend.name} {case}", dict(params, backend=backend.name), stats,
+                         work=residues, unit="residues/s")
+
+    # perform_alignment aligns identical sequences once: panels where half the rows are copies.
+    from proteinphonics.alignment import perform_alignment
+    from proteinphonics.utils import write_fasta
+    for species in suite.species:
+        distinct = unaligned_records(max(species // 2, 1), lengths[-1])
+        records = distinct + [(f"{name}_copy", seq) for name, seq in distinct][:species - len(distinct)]
+        path = f"duplicated_{species}.fasta"
+        write_fasta(path, records)
+        stats, _ = measure(lambda: perform_alignment(path, backend="star", reference=records[0][0]), args.repeat,
+                           suite.reset_state)
+        suite.record("align", f"star duplicated {species}x{lengths[-1]}",
+                     {"species": species, "length": lengths[-1], "distinct": len(distinct)}, stats,
+                     work=sum(len(seq) for _, seq in records), unit="residues/s")
+
+
+def _synthetic_file(species, columns):
+    from fixtures import write_synthetic_alignment
+    from proteinphonics.utils import ensure_directory_exists
+    ensure_directory_exists("synthetic")
+    path = os.path.join("synthetic", f"synthetic_{species}x{columns}.fasta")
+    if not os.path.exists(path):
+        write_synthetic_alignment(path, species, columns)
+    return path
+
+
+def bench_read(suite):
+    from proteinphonics.alignment import read_alignment
+    from proteinphonics.alignment_store import store_path
+    for species, columns in suite.grid():
+        path = _synthetic_file(species, columns)
+        size = os.path.getsize(path)
+        params = {"species": species, "columns": columns}
+
+        def drop_store():
+            if os.path.exists(store_path(path)):
+                os.remove(store_path(path))
+
+        stats, _ = measure(lambda: read_alignment(path), suite.args.repeat, drop_store)
+        suite.record("read", f"convert {species}x{columns}", params, stats, work=size, unit="bytes/s")
+        stats, _ = measure(lambda: len(read_alignment(path)), suite.args.repeat)
+        suite.record("read", f"open {species}x{columns}", params, stats)
+
+
+def bench_midi(suite):
+    import numpy as np
+    from config import AA_PITCH_MAP, INSTRUMENT_MAP
+    from proteinphonics.alignment import read_alignment
+    from proteinphonics.features import load_features, render_features
+    from proteinphonics.midi_generation import GAP, alignment_to_midi
+    for species, columns in suite.grid():
+        alignment = read_alignment(_synthetic_file(species, columns))
+        notes = int(np.count_nonzero(np.asarray(alignment.matrix) != GAP))
+        stats, midi_bytes = measure(lambda: alignment_to_midi(alignment, AA_PITCH_MAP, INSTRUMENT_MAP),
+                                    suite.args.repeat)
+        suite.record("midi", f"render {species}x{columns}", {"species": species, "columns": columns}, stats,
+                     work=notes, unit="notes/s", midi_bytes=len(midi_bytes))
+        stats, midi_bytes = measure(lambda: alignment_to_midi(alignment, AA_PITCH_MAP, INSTRUMENT_MAP, reduce=True),
+                                    suite.args.repeat)
+        suite.record("midi", f"reduce {species}x{columns}", {"species": species, "columns": columns}, stats,
+                     work=notes, unit="residues/s", midi_bytes=len(midi_bytes))
+        features = load_features(_synthetic_file(species, columns))
+        stats, midi_bytes = measure(lambda: render_features(features, INSTRUMENT_MAP, tempo_bpm=90, time_step=0.2),
+                                    suite.args.repeat)
+        suite.record("midi", f"rerender {species}x{columns}", {"species": species, "columns": columns}, stats,
+                     work=notes, unit="notes/s", midi_bytes=len(midi_bytes))
+
+
+def bench_e2e(suite):
+    from proteinphonics.ensembl import TokenBucket, get_client
+    from proteinphonics.midi_generation import create_evolutionary_music
+    args, stub = suite.args, suite.stub
+    client = get_client()
+    stub.latency, stub.throttle_every = max(args.latency), 0
+    for gene, (species, _) in bundled_panels().items():
+        def cold():
+            suite.reset_state()
+            stub.reset_stats()
+            client.limiter = TokenBucket(args.rps, args.rps)
+
+        run = lambda: create_evolutionary_music(gene, species, species[0])  # noqa: E731
+        stats, _ = measure(run, args.repeat, cold)
+        params = {"gene": gene, "species": len(species), "backend": args.backend, "latency": stub.latency}
+        suite.record("e2e", f"{gene} cold", params, stats, requests=stub.stats["requests"])
+        stats, _ = measure(run, args.repeat)
+        suite.record("e2e", f"{gene} warm", params, stats)
+
+
+def environment():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], cwd=ROOT, capture_output=True, text=True,
+                                check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    import numpy
+    return {"commit": commit, "python": platform.python_version(), "numpy": numpy.__version__,
+            "platform": platform.platform(), "cpus": os.cpu_count(),
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z")}
+
+
+def compare(base_path, head_path, tolerance):
+    """
+    Print per-case changes in best time and peak memory; return 1 on regressions.
+    """
+    with open(base_path) as f:
+        base = {(r["benchmark"], r["case"]): r for r in json.load(f)["results"]}
+    with open(head_path) as f:
+        head = {(r["benchmark"], r["case"]): r for r in json.load(f)["results"]}
+
+    regressions = 0
+    print(f"{'benchmark':<6} {'case':<40} {'base s':>10} {'head s':>10} {'time':>8} {'memory':>8}")
+    for key in sorted(base.keys() & head.keys()):
+        old, new = base[key], head[key]
+        time_change = new["best_s"] / old["best_s"] - 1 if old["best_s"] else 0.0
+        memory_change = (new["peak_mb"] / old["peak_mb"] - 1
+                         if old.get("peak_mb") and new.get("peak_mb") is not None else 0.0)
+        flag = ""
+        if time_change > tolerance or memory_change > tolerance:
+            regressions += 1
+            flag = "  REGRESSION"
+        print(f"{key[0]:<6} {key[1]:<40} {old['best_s']:>10.4f} {new['best_s']:>10.4f} "
+              f"{time_change:>+7.0%} {memory_change:>+7.0%}{flag}")
+    for key in sorted(base.keys() ^ head.keys()):
+        print(f"{key[0]:<6} {key[1]:<40} only in {'base' if key in base else 'head'}")
+    print(f"{regressions} regression(s) beyond {tolerance:.0%}.")
+    return 1 if regressions else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--only", help=f"Comma-separated subset of: {','.join(BENCHMARKS)}.")
+    parser.add_argument("--quick", action="store_true", help="Small grid for a fast smoke run.")
+    parser.add_argument("--repeat", type=int, default=3, help="Timed runs per case (best is reported).")
+    parser.add_argument("--max-cells", type=int, default=5_000_000,
+                        help="Skip synthetic species x columns cases above this size (0 = no limit).")
+    parser.add_argument("--max-dp-cells", type=int, default=100_000_000,
+                        help="Skip real-aligner cases above species x length^2 (0 = no limit).")
+    parser.add_argument("--latency", type=float, nargs="+", default=[0.0, 0.05],
+                        help="Stub response latencies (seconds) for the fetch benchmark.")
+    parser.add_argument("--throttle-every", type=int, default=4,
+                        help="Also run a fetch case where every Nth request gets a 429 (0 disables).")
+    parser.add_argument("--rps", type=float, default=15, help="Client token-bucket rate for stub runs.")
+    parser.add_argument("--backend", default="fake", help="Alignment backend for end-to-end runs.")
+    parser.add_argument("--output", help="Result JSON path (default: benchmarks/results/<commit>.json).")
+    parser.add_argument("--compare", nargs=2, metavar=("BASE", "HEAD"), help="Diff two result files.")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="Allowed slowdown/memory growth.")
+    args = parser.parse_args()
+
+    if args.compare:
+        return compare(*args.compare, args.tolerance)
+
+    selected = args.only.split(",") if args.only else list(BENCHMARKS)
+    unknown = set(selected) - set(BENCHMARKS)
+    if unknown:
+        parser.error(f"Unknown benchmark(s): {', '.join(sorted(unknown))}")
+
+    stub = EnsemblStub(retry_after=0.05).start()
+    # config reads these at import time, so set them before anything imports it.
+    os.environ["PROTEINPHONICS_ENSEMBL_SERVER"] = stub.url
+    os.environ["PROTEINPHONICS_ALIGNMENT_BACKEND"] = args.backend
+    os.environ.setdefault("PROTEINPHONICS_LOG_LEVEL", "ERROR")
+    import fixtures  # noqa: F401  (registers the fake backend)
+    from proteinphonics.utils import configure_logging
+    configure_logging()
+
+    meta = environment()
+    workdir = tempfile.mkdtemp(prefix="proteinphonics-bench-")
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    suite = Suite(args, stub, workdir)
+    try:
+        for name in selected:
+            globals()[f"bench_{name}"](suite)
+    finally:
+        os.chdir(cwd)
+        stub.stop()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    output = args.output or os.path.join(ROOT, "benchmarks", "results", f"{(meta['commit'] or 'unknown')[:12]}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    settings = {key: value for key, value in vars(args).items() if key not in ("output", "compare", "tolerance")}
+    results = sorted(suite.results, key=lambda r: (r["benchmark"], r["case"]))
+    with open(output, "w") as f:
+        json.dump({"meta": meta, "settings": settings, "results": results}, f, indent=2, sort_keys=True)
+        f.write("\n")
+    print(f"Results written to {output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,12 @@
+import streamlit.components.v1 as components
+import os
+
+def st_midi_stream_player(stream_url, midi_url=None, height=120):
+    base_dir = os.path.dirname(__file__)
+    html_path = os.path.join(base_dir, "midi_stream_player.html")
+    with open(html_path, "r", encoding="utf-8") as f:
+        html_content = f.read()
+    # The player fetches the note stream itself; only the URLs are embedded.
+    html_content = html_content.replace("%%STREAM_URL%%", stream_url)
+    html_content = html_content.replace("%%MIDI_URL%%", midi_url or "")
+    return components.html(html_content, height=height)
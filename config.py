@@ -4,28 +4,97 @@ Configuration settings for ProteinPhonics.
 This includes API endpoints, file paths for persistent storage,
 database settings, and default mappings.
 """
+import os
 
 # Ensembl API configuration
-ENSEMBL_REST_SERVER = "https://rest.ensembl.org"
+# Override with PROTEINPHONICS_ENSEMBL_SERVER to point at a mirror or a local stub.
+ENSEMBL_REST_SERVER = os.environ.get("PROTEINPHONICS_ENSEMBL_SERVER", "https://rest.ensembl.org")
 ENSEMBL_HEADERS_JSON = {"Content-Type": "application/json"}
 ENSEMBL_HEADERS_FASTA = {"Content-Type": "text/x-fasta"}
 
+# Ensembl allows 55,000 requests per hour (~15 per second) per client.
+ENSEMBL_REQUESTS_PER_SECOND = 15
+ENSEMBL_BURST = 15
+ENSEMBL_MAX_WORKERS = 8          # Pooled connections / concurrent lookups
+ENSEMBL_MAX_RETRIES = 5          # Retries on 429 and transient 5xx responses
+ENSEMBL_TIMEOUT = 30             # Seconds per request
+ENSEMBL_SEQUENCE_BATCH_SIZE = 50     # Max IDs per POST /sequence/id
+ENSEMBL_SYMBOL_BATCH_SIZE = 1000     # Max symbols per POST /lookup/symbol
+ENSEMBL_RELEASE = None           # Pin an Ensembl release; None means "current release"
+ENSEMBL_RELEASE_TTL = 24 * 3600  # Seconds before the current release number is re-checked
+
 # Directory paths for persistent storage
 DATA_DIR = "data"
 FASTA_DIR = f"{DATA_DIR}/fasta"
 ALIGNMENTS_DIR = f"{DATA_DIR}/alignments"
+UNIQUE_ALIGNMENTS_DIR = f"{ALIGNMENTS_DIR}/unique"  # Alignments of distinct sequences, shared by all panels
 MIDIS_DIR = f"{DATA_DIR}/midis"
 AUDIO_DIR = f"{DATA_DIR}/audio"
 
+# In-memory result caches (shared by all sessions in the process)
+RESULT_CACHE_MAX_ENTRIES = 64                 # Rendered MIDI files kept in memory
+RESULT_CACHE_MAX_BYTES = 256 * 1024 * 1024    # Total size bound for rendered MIDI
+ALIGNMENT_MEMO_MAX_ENTRIES = 256              # (gene, species, reference) -> alignment file
+
+# Background jobs for the web UI
+JOB_WORKERS = 8                  # Pipeline runs executing at once across all sessions
+JOB_RETENTION_SECONDS = 3600     # How long finished jobs stay available for polling
+JOB_MAX_RETAINED = 1000          # Upper bound on remembered jobs
+
+# Progressive playback (proteinphonics.streaming): the app serves note chunks to the
+# browser player from a small local HTTP server.
+STREAM_PORT = int(os.environ.get("PROTEINPHONICS_STREAM_PORT", "8502") or 0) or None  # Empty disables streaming
+STREAM_HOST = os.environ.get("PROTEINPHONICS_STREAM_HOST", "127.0.0.1")
+STREAM_PUBLIC_URL = os.environ.get("PROTEINPHONICS_STREAM_URL")  # Browser-facing base URL, if not 127.0.0.1:STREAM_PORT
+STREAM_CHUNK_SECONDS = 5.0       # Music per streamed chunk
+STREAM_MAX_REGISTERED = 256      # Registered streams remembered (oldest are dropped)
+
+# Headless generation API (proteinphonics.service, `python -m proteinphonics serve`)
+SERVICE_HOST = os.environ.get("PROTEINPHONICS_SERVICE_HOST", "127.0.0.1")
+SERVICE_PORT = int(os.environ.get("PROTEINPHONICS_SERVICE_PORT", "8503"))
+SERVICE_WORKERS = None           # Processes aligning and rendering at once; None = CPU count
+SERVICE_MAX_PENDING = 32         # Distinct generations in flight before new ones are refused with 429
+SERVICE_MAX_BODY = 1024 * 1024   # Largest accepted request body (bytes)
+SERVICE_READ_TIMEOUT = 30        # Seconds to wait for a request on an open connection
+
+# App startup: heavy modules load lazily; the warm-up worker (proteinphonics.warm)
+# imports them and preloads recent alignments in the background.
+WARM_WORKER = os.environ.get("PROTEINPHONICS_WARM_WORKER", "1") != "0"
+WARM_PRELOAD_ALIGNMENTS = 8      # Most recent alignments whose feature indexes are loaded
+
 # Path to the SoundFont file for MIDI to audio conversion
 SOUNDFONT_PATH = "soundfonts/FluidR3_GM.sf2"  # Ensure this file exists in the specified location
 
+# Offline audio rendering (proteinphonics.audio)
+AUDIO_SAMPLE_RATE = 44100
+AUDIO_WORKERS = None             # Processes synthesizing tracks in parallel; None = CPU count
+AUDIO_CHUNK_FRAMES = 65536       # Frames synthesized / mixed per step
+AUDIO_TAIL_SECONDS = 1.0         # Release time appended after the last note
+
+# Logging and instrumentation (proteinphonics.metrics)
+LOG_LEVEL = os.environ.get("PROTEINPHONICS_LOG_LEVEL", "INFO")
+METRICS_PORT = int(os.environ["PROTEINPHONICS_METRICS_PORT"]) if os.environ.get("PROTEINPHONICS_METRICS_PORT") else None
+METRICS_SAMPLE_WINDOW = 500      # Recent MUSCLE runs etc. kept for the JSON snapshot
+PROFILE_DIR = f"{DATA_DIR}/profiles"
+PROFILE_RUNS = bool(os.environ.get("PROTEINPHONICS_PROFILE"))  # cProfile every pipeline run
+
+# Local proteome / ortholog index built from Ensembl bulk dumps (proteinphonics.local_index)
+LOCAL_INDEX_DIR = f"{DATA_DIR}/index"
+LOCAL_INDEX_PATH = f"{LOCAL_INDEX_DIR}/proteome.db"
+USE_LOCAL_INDEX = True           # Resolve panels from the index before calling Ensembl REST
+
 # Database configuration
 DATABASE_URI = "sqlite:///proteinphonics.db"
 
 # MUSCLE executable configuration (MUSCLE should be in your PATH)
 MUSCLE_EXECUTABLE = "muscle"
 
+# Alignment backend: "muscle", "star" (in-process, reference-anchored), or "auto"
+# (MUSCLE when the executable is on PATH, otherwise star).
+ALIGNMENT_BACKEND = os.environ.get("PROTEINPHONICS_ALIGNMENT_BACKEND", "auto")
+ALIGNMENT_WORKERS = None                 # Process-pool size for the star backend; None = CPU count
+STAR_PARALLEL_MIN_CELLS = 2_000_000      # Below this many DP cells the star backend stays single-process
+
 # Amino acid to MIDI pitch mapping
 AA_PITCH_MAP = {
     'A': 60, 'V': 61, 'I': 62, 'L': 63, 'M': 64,
@@ -47,3 +116,13 @@ INSTRUMENT_MAP = {
     'Caenorhabditis elegans': 114,     # Steel Drums
     'Saccharomyces cerevisiae': 21,    # Accordion
 }
+
+# Clade sections for consensus reduction (proteinphonics.reduction): each section
+# is reduced to its own consensus voices on one instrument.
+CLADE_SECTIONS = {
+    'Mammals': {'program': 0, 'species': ['Homo sapiens', 'Mus musculus', 'Canis lupus familiaris']},
+    'Other vertebrates': {'program': 68, 'species': ['Gallus gallus', 'Xenopus tropicalis', 'Danio rerio',
+                                                    'Anolis carolinensis']},
+    'Invertebrates': {'program': 12, 'species': ['Drosophila melanogaster', 'Caenorhabditis elegans']},
+    'Fungi': {'program': 21, 'species': ['Saccharomyces cerevisiae']},
+}
@@ -0,0 +1,140 @@
+# proteinphonics/__main__.py
+"""
+Command-line entry point: `python -m proteinphonics <command> ...`
+(run from the repository root so `config.py` is importable).
+"""
+import argparse
+import json
+import sys
+
+from config import INSTRUMENT_MAP, SERVICE_HOST, SERVICE_MAX_PENDING, SERVICE_PORT, SERVICE_WORKERS
+from proteinphonics import metrics
+from proteinphonics.utils import configure_logging, write_file_atomic
+
+
+def _read_genes(args):
+    genes = list(args.genes)
+    if args.genes_file:
+        with open(args.genes_file) as f:
+            for line in f:
+                line = line.split("#", 1)[0].strip()
+                if line:
+                    genes.append(line)
+    return genes
+
+
+def _batch(args):
+    from proteinphonics.batch import run_batch
+    genes = _read_genes(args)
+    if not genes:
+        sys.exit("No genes given; pass symbols or --genes-file.")
+    species = args.species or list(INSTRUMENT_MAP)
+    sections = None
+    if args.sections:
+        with open(args.sections) as f:
+            sections = json.load(f)
+    with metrics.profile_run("batch", enabled=args.profile):
+        manifest = run_batch(
+            genes, species, reference_species=args.reference, output_dir=args.output_dir,
+            manifest_path=args.manifest, tempo_bpm=args.tempo, time_step=args.time_step,
+            backend=args.backend, fetch_workers=args.fetch_workers, align_workers=args.align_workers,
+            render_workers=args.render_workers, compact=args.compact,
+            reduce=args.reduce or bool(sections), sections=sections,
+        )
+    return 1 if manifest.summary().get("failed") else 0
+
+
+def _import_index(args):
+    from proteinphonics.local_index import LocalIndex
+    if not args.peptides and not args.homologies:
+        sys.exit("Nothing to import; pass --peptides and/or --homologies files.")
+    if args.species and len(args.peptides) != 1:
+        sys.exit("--species can only be used with a single --peptides file.")
+    index = LocalIndex(args.index) if args.index else LocalIndex()
+    for path in args.peptides:
+        index.import_peptides(path, species=args.species)
+    for path in args.homologies:
+        index.import_homologies(path, orthologs_only=not args.all_homologies)
+    print(f"Local index {index.path}: " + ", ".join(f"{n} {table}" for table, n in index.stats().items()))
+    return 0
+
+
+def _serve(args):
+    from proteinphonics.service import run_service
+    run_service(host=args.host, port=args.port, workers=args.workers, max_pending=args.max_pending,
+                backend=args.backend)
+    return 0
+
+
+def _write_metrics(path):
+    if path == "-":
+        sys.stdout.write(metrics.prometheus_text())
+    else:
+        write_file_atomic(path, json.dumps(metrics.snapshot(), indent=2))
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="python -m proteinphonics", description="ProteinPhonics command line.")
+    parser.add_argument("--log-level", help="Logging level (default: LOG_LEVEL from config).")
+    parser.add_argument("--metrics", metavar="PATH",
+                        help="Write a JSON metrics snapshot to PATH on exit ('-' prints Prometheus text).")
+    parser.add_argument("--profile", action="store_true", help="Run under cProfile; stats go to PROFILE_DIR.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    batch = commands.add_parser("batch", help="Generate MIDI for a list of genes across a species panel.")
+    batch.add_argument("genes", nargs="*", help="Gene symbols.")
+    batch.add_argument("--genes-file", help="File with one gene symbol per line ('#' starts a comment).")
+    batch.add_argument("--species", action="append",
+                       help="Species in the panel (repeatable; default: all species in INSTRUMENT_MAP).")
+    batch.add_argument("--reference", help="Reference species (default: the first species).")
+    batch.add_argument("--output-dir", default="data/midis/batch", help="Directory for {gene}.mid outputs.")
+    batch.add_argument("--manifest", help="Manifest path (default: OUTPUT_DIR/manifest.json).")
+    batch.add_argument("--tempo", type=float, default=120, help="Tempo in BPM.")
+    batch.add_argument("--time-step", type=float, default=0.5, help="Seconds per alignment column.")
+    batch.add_argument("--backend", help="Alignment backend (default: ALIGNMENT_BACKEND).")
+    batch.add_argument("--fetch-workers", type=int, default=8, help="Concurrent gene fetches.")
+    batch.add_argument("--align-workers", type=int, help="Core budget for alignment (default: CPU count).")
+    batch.add_argument("--render-workers", type=int, default=2, help="Concurrent MIDI renders.")
+    batch.add_argument("--compact", action="store_true",
+                       help="Sustain repeated residues and collapse fully conserved columns into one voice.")
+    batch.add_argument("--reduce", action="store_true",
+                       help="Render consensus, runner-up and gap-density voices instead of one track per species.")
+    batch.add_argument("--sections", metavar="JSON",
+                       help='Clade sections for --reduce: {"name": {"program": N, "species": [...]}} (implies --reduce).')
+    batch.set_defaults(func=_batch)
+
+    index = commands.add_parser("import-index",
+                                help="Index Ensembl peptide FASTA and Compara homology TSV dumps for offline lookups.")
+    index.add_argument("--peptides", nargs="+", default=[], metavar="FILE",
+                       help="Peptide FASTA files, e.g. Homo_sapiens.GRCh38.pep.all.fa.gz.")
+    index.add_argument("--homologies", nargs="+", default=[], metavar="FILE",
+                       help="Compara homology TSV files, e.g. Compara.111.protein_default.homologies.tsv.gz.")
+    index.add_argument("--species", help="Species of the peptide file (default: taken from its file name).")
+    index.add_argument("--index", help="Index database path (default: LOCAL_INDEX_PATH).")
+    index.add_argument("--all-homologies", action="store_true", help="Also keep paralogues.")
+    index.set_defaults(func=_import_index)
+
+    serve = commands.add_parser("serve", help="Serve the headless HTTP generation API.")
+    serve.add_argument("--host", default=SERVICE_HOST, help="Interface to listen on.")
+    serve.add_argument("--port", type=int, default=SERVICE_PORT, help="Port to listen on.")
+    serve.add_argument("--workers", type=int, default=SERVICE_WORKERS,
+                       help="Processes aligning and rendering at once (default: CPU count).")
+    serve.add_argument("--max-pending", type=int, default=SERVICE_MAX_PENDING,
+                       help="Distinct generations in flight before new requests get 429.")
+    serve.add_argument("--backend", help="Alignment backend (default: ALIGNMENT_BACKEND).")
+    serve.set_defaults(func=_serve)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    configure_logging(args.log_level)
+    try:
+        return args.func(args)
+    finally:
+        if args.metrics:
+            _write_metrics(args.metrics)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
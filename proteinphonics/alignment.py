@@ -1,58 +1,482 @@
 # proteinphonics/alignment.py
+import hashlib
+import logging
 import os
+import shutil
 import subprocess
-from config import MUSCLE_EXECUTABLE, ALIGNMENTS_DIR
-from proteinphonics.utils import ensure_directory_exists
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from config import (
+    MUSCLE_EXECUTABLE, ALIGNMENTS_DIR, ALIGNMENT_BACKEND, ALIGNMENT_WORKERS, STAR_PARALLEL_MIN_CELLS,
+    UNIQUE_ALIGNMENTS_DIR,
+)
+from proteinphonics import database, metrics
+from proteinphonics.alignment_store import load_alignment
+from proteinphonics.utils import ensure_directory_exists, read_fasta, write_fasta, sequence_hash
+from proteinphonics.warm import worker_context
 
-def perform_alignment(input_fasta):
+logger = logging.getLogger(__name__)
+
+def sequence_set_hash(records):
+    """
+    Hash an exact set of (name, sequence) records, independent of their order.
+    """
+    digest = hashlib.sha256()
+    for name, sequence in sorted(records):
+        digest.update(f"{name}\t{sequence}\n".encode("ascii"))
+    return digest.hexdigest()
+
+def _run_muscle(args, records=()):
+    """
+    Run MUSCLE with the given arguments, raising with the captured logs on failure.
+    `records` (the sequences being aligned) is only used for runtime metrics.
+    """
+    cmd = [MUSCLE_EXECUTABLE] + args
+    logger.debug("Running MUSCLE alignment: %s", " ".join(cmd))
+    start = time.perf_counter()
+    result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    seconds = time.perf_counter() - start
+    lengths = [len(seq.replace("-", "")) for _, seq in records]
+    metrics.observe("muscle_seconds", seconds)
+    metrics.sample("muscle_runs", seconds=seconds, sequences=len(lengths),
+                   max_length=max(lengths, default=0), residues=sum(lengths), returncode=result.returncode)
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("MUSCLE stdout: %s", result.stdout.decode())
+        logger.debug("MUSCLE stderr: %s", result.stderr.decode())
+    if result.returncode != 0:
+        logger.error("MUSCLE failed (exit %d): %s", result.returncode, result.stderr.decode()[-2000:])
+    result.check_returncode()  # This will raise an error with the captured logs if MUSCLE fails.
+
+def unique_records(records):
+    """
+    Collapse records with identical sequences.
+
+    Returns:
+        tuple: (unique (sequence hash, sequence) records in order of first
+               occurrence, the sequence hash of every input record in input order).
+    """
+    hashes = [sequence_hash(seq) for _, seq in records]
+    unique = {}
+    for seq_hash, (_, seq) in zip(hashes, records):
+        unique.setdefault(seq_hash, seq)
+    return list(unique.items()), hashes
+
+def expand_alignment(aligned, names, hashes):
+    """
+    Expand an alignment of unique sequences (rows named by sequence hash) back
+    to one row per record.
+
+    Returns:
+        list: (name, aligned_sequence) tuples in the order of `names`.
+    """
+    rows = dict(aligned)
+    return [(name, rows[seq_hash]) for name, seq_hash in zip(names, hashes)]
+
+def _order_rows(aligned, names):
+    """
+    Return aligned rows in the order of `names`.
+    """
+    rows = dict(aligned)
+    return [(name, rows[name]) for name in names]
+
+def project_alignment(aligned, names):
+    """
+    Project an alignment down to a subset of its rows.
+    Rows not in `names` are dropped, then columns that are gaps in every remaining row.
+
+    Parameters:
+        aligned (list): (name, aligned_sequence) tuples.
+        names (list): Names of the rows to keep, in output order.
+
+    Returns:
+        list: (name, aligned_sequence) tuples.
+    """
+    rows = _order_rows(aligned, names)
+    keep = [i for i, column in enumerate(zip(*(seq for _, seq in rows))) if any(c != "-" for c in column)]
+    return [(name, "".join(seq[i] for i in keep)) for name, seq in rows]
+
+class AlignmentBackend:
+    """
+    Interface for multiple sequence alignment backends.
+    Subclasses set `name`, implement `align`, and may override `profile_align`
+    and `is_available`. Register them with `register_backend`. Backends whose
+    output depends on the reference record set `uses_reference`.
+    """
+    name = None
+    uses_reference = False
+
+    def is_available(self):
+        """Return True if the backend can run in this environment."""
+        return True
+
+    def cache_key(self, records, reference=None):
+        """
+        Return the key alignments of `records` are cached under (in place of `name`).
+        For backends that use a reference, the effective reference (the first
+        record when `reference` is not among them) is folded in, so alignments
+        anchored on different records are never shared, projected or extended.
+        """
+        if not self.uses_reference:
+            return self.name
+        names = [name for name, _ in records]
+        anchor = reference if reference in names else names[0]
+        return f"{self.name}-{hashlib.sha256(anchor.encode('utf-8')).hexdigest()[:12]}"
+
+    def align(self, records, reference=None):
+        """
+        Align (name, sequence) records from scratch.
+
+        Parameters:
+            records (list): (name, sequence) tuples.
+            reference (str): Name of the reference record, if the backend uses one.
+
+        Returns:
+            list: (name, aligned_sequence) tuples in input order.
+        """
+        raise NotImplementedError
+
+    def profile_align(self, aligned, new_records, reference=None):
+        """
+        Add new sequences to an existing alignment.
+        The default realigns everything; backends with a profile mode override this.
+
+        Returns:
+            list: (name, aligned_sequence) tuples, existing rows first.
+        """
+        records = [(name, seq.replace("-", "")) for name, seq in aligned] + list(new_records)
+        return self.align(records, reference=reference)
+
+
+class MuscleBackend(AlignmentBackend):
+    """
+    Runs the external MUSCLE executable (v3 command-line syntax).
+    """
+    name = "muscle"
+
+    def is_available(self):
+        return shutil.which(MUSCLE_EXECUTABLE) is not None
+
+    def align(self, records, reference=None):
+        if len(records) == 1:
+            return list(records)
+        with tempfile.TemporaryDirectory() as tmp:
+            in_file = os.path.join(tmp, "in.fasta")
+            out_file = os.path.join(tmp, "out.fasta")
+            write_fasta(in_file, records)
+            _run_muscle(["-in", in_file, "-out", out_file], records)
+            return _order_rows(read_fasta(out_file), [name for name, _ in records])
+
+    def profile_align(self, aligned, new_records, reference=None):
+        """
+        The new sequences are aligned among themselves, then merged into the
+        existing alignment with MUSCLE's profile-profile mode, so the existing
+        rows are never realigned.
+        """
+        new_aligned = self.align(new_records)
+        with tempfile.TemporaryDirectory() as tmp:
+            in1 = os.path.join(tmp, "existing.fasta")
+            in2 = os.path.join(tmp, "new.fasta")
+            out_file = os.path.join(tmp, "out.fasta")
+            write_fasta(in1, aligned)
+            write_fasta(in2, new_aligned)
+            _run_muscle(["-profile", "-in1", in1, "-in2", in2, "-out", out_file], aligned + new_aligned)
+            names = [name for name, _ in aligned] + [name for name, _ in new_records]
+            return _order_rows(read_fasta(out_file), names)
+
+
+_SCORING_ALPHABET = set("ARNDCQEGHILKMFPSTWYVBZX*")
+_aligner = None
+_pool = None
+_pool_lock = threading.Lock()
+
+def _get_aligner():
+    """
+    Build (once per process) the global pairwise aligner used by the star backend.
+    """
+    global _aligner
+    if _aligner is None:
+        from Bio.Align import PairwiseAligner, substitution_matrices
+        _aligner = PairwiseAligner(mode="global")
+        _aligner.substitution_matrix = substitution_matrices.load("BLOSUM62")
+        _aligner.open_gap_score = -10
+        _aligner.extend_gap_score = -0.5
+    return _aligner
+
+def _pairwise(reference_seq, seq):
+    """
+    Globally align `seq` to `reference_seq`.
+    Residues outside the BLOSUM62 alphabet (e.g. U) are scored as X.
+
+    Returns:
+        tuple: (gapped reference, gapped sequence).
+    """
+    def scorable(s):
+        return "".join(c if c in _SCORING_ALPHABET else "X" for c in s)
+
+    alignment = _get_aligner().align(scorable(reference_seq), scorable(seq))[0]
+    return _restore(alignment[0], reference_seq), _restore(alignment[1], seq)
+
+def _restore(gapped, original):
+    """
+    Put the original residues back into a gapped string aligned on a sanitized copy.
+    """
+    residues = iter(original)
+    return "".join(c if c == "-" else next(residues) for c in gapped)
+
+def _get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=ALIGNMENT_WORKERS, mp_context=worker_context())
+    return _pool
+
+def merge_star(reference_seq, pairwise):
+    """
+    Merge pairwise alignments against a common reference into one MSA.
+    Each column of the reference is kept; insertions relative to the reference
+    are padded to the longest insertion at that position across all pairs.
+
+    Parameters:
+        reference_seq (str): Ungapped reference sequence.
+        pairwise (list): (gapped reference, gapped sequence) tuples.
+
+    Returns:
+        tuple: (aligned reference, list of aligned sequences).
+    """
+    length = len(reference_seq)
+    # For each pair, split the aligned sequence into the insertion block before
+    # each reference residue (index `length` holds the trailing insertion) and
+    # the character aligned to that residue.
+    split_pairs = []
+    max_insert = [0] * (length + 1)
+    for gapped_ref, gapped_seq in pairwise:
+        inserts = [[] for _ in range(length + 1)]
+        matched = []
+        position = 0
+        for r, c in zip(gapped_ref, gapped_seq):
+            if r == "-":
+                inserts[position].append(c)
+            else:
+                matched.append(c)
+                position += 1
+        for i, block in enumerate(inserts):
+            if len(block) > max_insert[i]:
+                max_insert[i] = len(block)
+        split_pairs.append((inserts, matched))
+
+    reference_row = "".join("-" * max_insert[i] + reference_seq[i] for i in range(length)) + "-" * max_insert[length]
+    rows = []
+    for inserts, matched in split_pairs:
+        parts = []
+        for i in range(length):
+            parts.append("".join(inserts[i]).ljust(max_insert[i], "-"))
+            parts.append(matched[i])
+        parts.append("".join(inserts[length]).ljust(max_insert[length], "-"))
+        rows.append("".join(parts))
+    return reference_row, rows
+
+
+class StarBackend(AlignmentBackend):
+    """
+    In-process, reference-anchored ("star") alignment.
+    Every sequence is globally aligned to the reference with Biopython's
+    PairwiseAligner (BLOSUM62) and the pairs are merged into one MSA. Pairwise
+    jobs fan out over a process pool once the panel is large enough to pay for it.
+    """
+    name = "star"
+    uses_reference = True
+
+    def align(self, records, reference=None):
+        if len(records) == 1:
+            return list(records)
+        sequences = dict(records)
+        reference = reference if reference in sequences else records[0][0]
+        reference_seq = sequences[reference]
+        others = [(name, seq) for name, seq in records if name != reference]
+
+        cells = len(reference_seq) * sum(len(seq) for _, seq in others)
+        if cells >= STAR_PARALLEL_MIN_CELLS and len(others) > 1:
+            futures = [_get_pool().submit(_pairwise, reference_seq, seq) for _, seq in others]
+            pairwise = [future.result() for future in futures]
+        else:
+            pairwise = [_pairwise(reference_seq, seq) for _, seq in others]
+
+        reference_row, rows = merge_star(reference_seq, pairwise)
+        aligned = dict(zip((name for name, _ in others), rows))
+        aligned[reference] = reference_row
+        return [(name, aligned[name]) for name, _ in records]
+
+
+ALIGNMENT_BACKENDS = {}
+
+def register_backend(backend_class):
+    """
+    Register an AlignmentBackend subclass under its `name`.
+    """
+    ALIGNMENT_BACKENDS[backend_class.name] = backend_class
+    return backend_class
+
+register_backend(MuscleBackend)
+register_backend(StarBackend)
+
+def get_backend(name=None):
+    """
+    Return an alignment backend instance.
+
+    Parameters:
+        name (str): Registered backend name, or "auto"/None for ALIGNMENT_BACKEND
+                    (where "auto" prefers MUSCLE when it is installed).
+    """
+    name = name or ALIGNMENT_BACKEND
+    if name == "auto":
+        muscle = MuscleBackend()
+        return muscle if muscle.is_available() else StarBackend()
+    if name not in ALIGNMENT_BACKENDS:
+        raise ValueError(f"Unknown alignment backend '{name}'. Available: {', '.join(ALIGNMENT_BACKENDS)}")
+    backend = ALIGNMENT_BACKENDS[name]()
+    if not backend.is_available():
+        raise RuntimeError(f"Alignment backend '{name}' is not available in this environment.")
+    return backend
+
+def _cached_alignment(records, members, backend, reference, key):
+    """
+    Try to build the alignment for `records` from cached alignments of other
+    panels stored under the same cache `key`.
+    Returns None if no overlapping alignment is usable.
+    """
+    names = [name for name, _ in records]
+
+    # Subset of a cached panel: project it down, no aligner call at all.
+    for set_hash, path, size in database.find_containing_alignments(members, key):
+        if os.path.exists(path):
+            logger.info("Projecting cached alignment %s (%d rows) onto %d rows.", path, size, len(records))
+            metrics.increment("alignment_cache_total", result="projected", backend=backend.name)
+            return project_alignment(read_fasta(path), names)
+
+    # Superset of a cached panel: profile-align only the new sequences.
+    for set_hash, path, size in database.find_contained_alignments(members, key):
+        if size < 2 or not os.path.exists(path):
+            continue
+        cached = read_fasta(path)
+        cached_names = {name for name, _ in cached}
+        new_records = [(name, seq) for name, seq in records if name not in cached_names]
+        logger.info("Extending cached alignment %s (%d rows) with %d new sequences.", path, size, len(new_records))
+        metrics.increment("alignment_cache_total", result="extended", backend=backend.name)
+        return _order_rows(backend.profile_align(cached, new_records, reference=reference), names)
+    return None
+
+def _align_records(records, members, backend, incremental, reference, key):
+    """
+    Align `records`, from overlapping cached alignments under `key` when
+    `incremental` allows, otherwise from scratch.
+    """
+    aligned = _cached_alignment(records, members, backend, reference, key) if incremental else None
+    if aligned is None:
+        metrics.increment("alignment_cache_total", result="miss", backend=backend.name)
+        aligned = backend.align(records, reference=reference)
+    return aligned
+
+def align_unique(unique, backend, incremental=True, reference=None):
+    """
+    Align distinct sequences, named by their sequence hash, reusing earlier work.
+
+    The alignment is saved under UNIQUE_ALIGNMENTS_DIR and cached by the hash of
+    the sequence set and the backend's `cache_key` alone, so every panel and
+    gene name that reduces to the same sequences (and reference) shares it.
+    With `incremental`, a subset of a cached set is projected from it and a
+    superset only profile-aligns the new sequences.
+
+    Returns:
+        list: (sequence hash, aligned_sequence) tuples in input order.
+    """
+    set_hash = sequence_set_hash(unique)
+    key = backend.cache_key(unique, reference)
+    cached_path = database.get_alignment(set_hash, key)
+    if cached_path and os.path.exists(cached_path):
+        logger.info("Sharing alignment %s of %d distinct sequences.", cached_path, len(unique))
+        metrics.increment("alignment_cache_total", result="shared", backend=backend.name)
+        return _order_rows(read_fasta(cached_path), [name for name, _ in unique])
+
+    members = [(seq_hash, seq_hash) for seq_hash, _ in unique]
+    aligned = _align_records(unique, members, backend, incremental, reference, key)
+    path = os.path.join(UNIQUE_ALIGNMENTS_DIR, f"{set_hash[:16]}.{key}.fasta")
+    write_fasta(path, aligned)
+    database.register_alignment(set_hash, key, path, members)
+    return aligned
+
+def perform_alignment(input_fasta, incremental=True, backend=None, reference=None):
     """
-    Perform multiple sequence alignment using MUSCLE.
+    Perform multiple sequence alignment (MUSCLE or another registered backend).
     The aligned sequences are written to a file in ALIGNMENTS_DIR.
-    
+
+    Records with identical sequences are aligned once: the distinct sequences
+    are aligned (or taken from cache) by `align_unique` and the result is
+    expanded back to one row per record. A panel without duplicates is aligned
+    as is, so its file is the only copy. Panel files are cached by the hash of
+    their exact (name, sequence) set and the backend's `cache_key`.
+
     Parameters:
         input_fasta (str): Path to the input FASTA file.
-        
+        incremental (bool): Reuse overlapping cached alignments.
+        backend (str): Alignment backend name; defaults to ALIGNMENT_BACKEND.
+        reference (str): Record name of the reference sequence (used by the star backend).
+
     Returns:
         output_file (str): Path to the alignment file.
     """
     ensure_directory_exists(ALIGNMENTS_DIR)
-    
-    # Create an output file name based on the input file name.
-    base_name = os.path.basename(input_fasta)
-    output_file = os.path.join(ALIGNMENTS_DIR, f"aligned_{base_name}")
-    
-    # If alignment already exists, skip the alignment step.
-    if os.path.exists(output_file):
-        print(f"Alignment file {output_file} already exists. Using cached version.")
-        return output_file
-    
-    # Build the MUSCLE command.
-    cmd = [MUSCLE_EXECUTABLE, "-in", input_fasta, "-out", output_file]
-    print("Running MUSCLE alignment:")
-    print(" ".join(cmd))
-    
-    # Run the command; raises an error if MUSCLE fails.
-    # subprocess.run(cmd, check=True)
-    
-    result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
-    print("MUSCLE stdout:", result.stdout.decode())
-    print("MUSCLE stderr:", result.stderr.decode())
-    result.check_returncode()  # This will raise an error with the captured logs if MUSCLE fails.
+    backend = get_backend(backend)
+
+    records = read_fasta(input_fasta)
+    if not records:
+        raise ValueError(f"No sequences found in {input_fasta}.")
+    set_hash = sequence_set_hash(records)
+    key = backend.cache_key(records, reference)
+    output_file = os.path.join(ALIGNMENTS_DIR, f"aligned_{set_hash[:16]}.{key}.fasta")
+
+    # If this exact sequence set was aligned before, skip the alignment step.
+    cached_path = database.get_alignment(set_hash, key)
+    if cached_path and os.path.exists(cached_path):
+        logger.info("Alignment file %s already exists. Using cached version.", cached_path)
+        metrics.increment("alignment_cache_total", result="hit", backend=backend.name)
+        return cached_path
 
-    print(f"Alignment complete. Output written to {output_file}")
+    names = [name for name, _ in records]
+    unique, hashes = unique_records(records)
+    if len(unique) == len(records):
+        # Nothing to collapse: the panel file takes part in overlap reuse itself.
+        members = list(zip(names, hashes))
+        aligned = _align_records(records, members, backend, incremental, reference, key)
+    else:
+        logger.info("Aligning %d distinct sequences for %d records.", len(unique), len(records))
+        metrics.increment("alignment_duplicate_rows_total", len(records) - len(unique))
+        unique_reference = hashes[names.index(reference)] if reference in names else None
+        aligned = expand_alignment(align_unique(unique, backend, incremental, unique_reference), names, hashes)
+        # Overlap reuse happens on the distinct sequences, so the expanded file has no members.
+        members = []
+
+    write_fasta(output_file, aligned)
+    database.register_alignment(set_hash, key, output_file, members)
+    logger.info("Alignment complete. Output written to %s", output_file)
     return output_file
 
 def read_alignment(alignment_file, file_format="fasta"):
     """
-    Read an alignment file using Biopython's AlignIO.
-    
+    Read an alignment file.
+    Aligned FASTA files are served from the memory-mapped binary store next to
+    them (converted on first use); other formats are parsed with Biopython's AlignIO.
+
     Parameters:
         alignment_file (str): Path to the alignment file.
         file_format (str): Format of the alignment file (default is "fasta").
-        
+
     Returns:
-        alignment: A Biopython alignment object.
+        alignment: A StoredAlignment for FASTA input, otherwise a Biopython alignment object.
     """
+    if file_format == "fasta":
+        return load_alignment(alignment_file)
     from Bio import AlignIO
     alignment = AlignIO.read(alignment_file, file_format)
     return alignment
@@ -0,0 +1,237 @@
+# proteinphonics/alignment_store.py
+"""
+Compact binary alignment store.
+
+An aligned FASTA file `aligned_x.fasta` is converted (lazily, on first read)
+to `aligned_x.ppaln`:
+
+    8 bytes   magic "PPALN001"
+    4 bytes   header length (big-endian uint32)
+    N bytes   JSON header: rows, columns, species ids, source hash/size/mtime
+    padding   up to a 64-byte boundary
+    R x C     row-major uint8 residue matrix
+
+The matrix is opened with `numpy.memmap`, so loading is O(1) and column
+slices only touch the pages they need.
+
+A residue -> column coordinate index is kept next to it in
+`aligned_x.coords.npy` (int32: rows + 1 offsets, then the column of every
+residue of every row, row by row). It is built on first use and memory-mapped,
+so mapping a residue range of any species to a column window reads only a few
+entries.
+"""
+import hashlib
+import io
+import json
+import logging
+import os
+import struct
+from collections import namedtuple
+
+import numpy as np
+
+from proteinphonics.utils import read_fasta, write_file_atomic
+
+MAGIC = b"PPALN001"
+STORE_EXTENSION = ".ppaln"
+COORDS_EXTENSION = ".coords.npy"
+GAP = ord("-")
+_ALIGN = 64
+
+logger = logging.getLogger(__name__)
+
+# Lightweight stand-in for a Biopython SeqRecord: just `.id` and `.seq`.
+AlignedRecord = namedtuple("AlignedRecord", ["id", "seq"])
+
+
+class StoredAlignment:
+    """
+    A memory-mapped alignment.
+
+    Attributes:
+        ids (list): Record IDs (species index), in row order.
+        matrix (numpy.memmap): uint8 array of shape (rows, columns).
+        source_hash (str): SHA-256 of the aligned FASTA it was converted from.
+    """
+
+    def __init__(self, path, ids, matrix, source_hash):
+        self.path = path
+        self.ids = ids
+        self.matrix = matrix
+        self.source_hash = source_hash
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __getitem__(self, index):
+        return AlignedRecord(self.ids[index], self.matrix[index].tobytes().decode("ascii"))
+
+    def __iter__(self):
+        for index in range(len(self.ids)):
+            yield self[index]
+
+    def get_alignment_length(self):
+        return self.matrix.shape[1]
+
+    def row_index(self, record_id):
+        """Return the row number of `record_id`."""
+        return self.ids.index(record_id)
+
+    def columns(self, start, stop):
+        """
+        Return the (rows, stop - start) sub-matrix for a column window without
+        reading the rest of the file.
+        """
+        return self.matrix[:, start:stop]
+
+    def residue_columns(self, record_id):
+        """
+        Return the alignment column of every residue of `record_id`, in order
+        (entry i is the column of residue i + 1), from the coordinate index.
+        """
+        coords = load_coordinates(self.path, self.matrix)
+        row = self.row_index(record_id)
+        start, stop = coords[row], coords[row + 1]
+        return coords[start:stop]
+
+    def residue_window(self, record_id, first, last):
+        """
+        Map a 1-based, inclusive residue range of `record_id` to a half-open
+        column window (start, stop) covering it.
+        """
+        return residue_window(self.residue_columns(record_id), first, last, record_id)
+
+
+def store_path(fasta_path):
+    """
+    Return the binary store path that sits next to an aligned FASTA file.
+    """
+    return os.path.splitext(fasta_path)[0] + STORE_EXTENSION
+
+def _file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def write_store(fasta_path, path=None):
+    """
+    Convert an aligned FASTA file to the binary store format.
+
+    Returns:
+        str: Path of the written store.
+    """
+    path = path or store_path(fasta_path)
+    records = read_fasta(fasta_path)
+    if not records:
+        raise ValueError(f"No sequences found in {fasta_path}.")
+    lengths = {len(seq) for _, seq in records}
+    if len(lengths) != 1:
+        raise ValueError(f"{fasta_path} is not an alignment: rows have lengths {sorted(lengths)}.")
+    stat = os.stat(fasta_path)
+    header = json.dumps({
+        "rows": len(records),
+        "columns": lengths.pop(),
+        "ids": [name for name, _ in records],
+        "source_hash": _file_hash(fasta_path),
+        "source_size": stat.st_size,
+        "source_mtime_ns": stat.st_mtime_ns,
+    }).encode("utf-8")
+    prefix = MAGIC + struct.pack(">I", len(header)) + header
+    prefix += b"\0" * (-len(prefix) % _ALIGN)
+    body = "".join(seq for _, seq in records).encode("ascii")
+    write_file_atomic(path, prefix + body)
+    return path
+
+def _read_header(path):
+    with open(path, "rb") as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} is not an alignment store.")
+        (length,) = struct.unpack(">I", f.read(4))
+        header = json.loads(f.read(length).decode("utf-8"))
+    offset = len(MAGIC) + 4 + length
+    offset += -offset % _ALIGN
+    return header, offset
+
+def open_store(path):
+    """
+    Memory-map an alignment store.
+
+    Returns:
+        StoredAlignment: The mapped alignment.
+    """
+    header, offset = _read_header(path)
+    shape = (header["rows"], header["columns"])
+    matrix = np.memmap(path, dtype=np.uint8, mode="r", offset=offset, shape=shape)
+    return StoredAlignment(path, header["ids"], matrix, header["source_hash"])
+
+def _is_current(path, fasta_path):
+    """
+    Check (by size and mtime, without hashing) that a store matches its FASTA source.
+    """
+    if not os.path.exists(path):
+        return False
+    try:
+        header, _ = _read_header(path)
+    except ValueError:
+        return False
+    stat = os.stat(fasta_path)
+    return header.get("source_size") == stat.st_size and header.get("source_mtime_ns") == stat.st_mtime_ns
+
+def coordinates_path(path):
+    """
+    Return the coordinate index path that sits next to a binary store.
+    """
+    return os.path.splitext(path)[0] + COORDS_EXTENSION
+
+def build_coordinates(matrix):
+    """
+    Build the residue -> column index for an alignment matrix, one row at a time.
+
+    Returns:
+        numpy.ndarray: int32 array of rows + 1 offsets followed by the residue columns.
+    """
+    rows = matrix.shape[0]
+    per_row = [np.flatnonzero(np.asarray(row) != GAP) for row in matrix]
+    offsets = np.cumsum([0] + [len(columns) for columns in per_row], dtype=np.int64) + rows + 1
+    dtype = np.int32 if offsets[-1] < 2 ** 31 else np.int64
+    return np.concatenate([offsets] + per_row).astype(dtype)
+
+def load_coordinates(path, matrix):
+    """
+    Memory-map the coordinate index for the store at `path`, (re)building it
+    first if it is missing or older than the store.
+    """
+    coords_file = coordinates_path(path)
+    if not os.path.exists(coords_file) or os.stat(coords_file).st_mtime_ns < os.stat(path).st_mtime_ns:
+        logger.info("Building coordinate index %s", coords_file)
+        buffer = io.BytesIO()
+        np.save(buffer, build_coordinates(matrix))
+        write_file_atomic(coords_file, buffer.getvalue())
+    return np.load(coords_file, mmap_mode="r")
+
+def residue_window(residue_columns, first, last, record_id="reference"):
+    """
+    Map a 1-based inclusive residue range to a half-open column window, given
+    the column of every residue of the reference row. `last` is clamped to the
+    sequence length.
+    """
+    count = len(residue_columns)
+    if first < 1 or last < first:
+        raise ValueError(f"Invalid residue range {first}-{last}; expected 1 <= first <= last.")
+    if first > count:
+        raise ValueError(f"Residue {first} is past the end of {record_id} ({count} residues).")
+    last = min(last, count)
+    return int(residue_columns[first - 1]), int(residue_columns[last - 1]) + 1
+
+def load_alignment(fasta_path):
+    """
+    Open the binary store for an aligned FASTA file, converting it on first use
+    or when the FASTA has changed since the last conversion.
+    """
+    path = store_path(fasta_path)
+    if not _is_current(path, fasta_path):
+        logger.info("Converting %s to binary alignment store %s", fasta_path, path)
+        write_store(fasta_path, path)
+    return open_store(path)
@@ -0,0 +1,285 @@
+# proteinphonics/audio.py
+"""
+Offline MIDI -> audio rendering with FluidSynth.
+
+Each instrument track is synthesized in a worker process of a shared pool of
+AUDIO_WORKERS processes (one FluidSynth instance per track) into a temporary
+raw PCM file, chunk by chunk. The tracks
+are then mixed with NumPy, again chunk by chunk, straight into the output file,
+so a long protein never needs a full uncompressed buffer in memory.
+
+Renders are cached under AUDIO_DIR by the hash of (MIDI bytes, soundfont
+contents, sample rate, format); re-requesting the same piece returns the
+cached file immediately.
+"""
+import hashlib
+import io
+import logging
+import os
+import tempfile
+import threading
+import wave
+import weakref
+from concurrent.futures import ProcessPoolExecutor
+
+from config import (
+    AUDIO_DIR,
+    SOUNDFONT_PATH,
+    AUDIO_SAMPLE_RATE,
+    AUDIO_WORKERS,
+    AUDIO_CHUNK_FRAMES,
+    AUDIO_TAIL_SECONDS,
+)
+from proteinphonics import metrics
+from proteinphonics.utils import ensure_directory_exists
+from proteinphonics.warm import worker_context
+
+AUDIO_FORMATS = ("wav", "ogg")
+
+logger = logging.getLogger(__name__)
+
+_soundfont_hashes = {}
+# A key's lock lives only while a render holds it.
+_render_locks = weakref.WeakValueDictionary()
+_render_locks_guard = threading.Lock()
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def audio_available(soundfont=SOUNDFONT_PATH):
+    """
+    Return True if FluidSynth can be imported and the soundfont exists.
+    """
+    try:
+        import fluidsynth  # noqa: F401
+    except (ImportError, OSError):
+        return False
+    return os.path.exists(soundfont)
+
+def _soundfont_hash(soundfont):
+    """
+    Content hash of a soundfont, memoized per (path, size, mtime) since files are large.
+    """
+    stat = os.stat(soundfont)
+    key = (os.path.abspath(soundfont), stat.st_size, stat.st_mtime_ns)
+    if key not in _soundfont_hashes:
+        digest = hashlib.sha256()
+        with open(soundfont, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+        _soundfont_hashes[key] = digest.hexdigest()
+    return _soundfont_hashes[key]
+
+def render_key(midi_bytes, soundfont=SOUNDFONT_PATH, sample_rate=AUDIO_SAMPLE_RATE, audio_format="wav"):
+    """
+    Cache key for a render: hash of MIDI bytes, soundfont contents, sample rate and format.
+    """
+    digest = hashlib.sha256()
+    digest.update(hashlib.sha256(midi_bytes).digest())
+    digest.update(_soundfont_hash(soundfont).encode("ascii"))
+    digest.update(f"{int(sample_rate)}:{audio_format}".encode("ascii"))
+    return digest.hexdigest()
+
+def _tempo_map(midi):
+    """
+    Return (ticks, seconds, tempos) arrays describing every tempo segment.
+    """
+    import numpy as np
+    changes = {0: 500000}  # MIDI default: 120 BPM
+    for track in midi.tracks:
+        tick = 0
+        for message in track:
+            tick += message.time
+            if message.type == "set_tempo":
+                changes[tick] = message.tempo
+    ticks = np.array(sorted(changes), dtype=np.int64)
+    tempos = np.array([changes[t] for t in ticks], dtype=np.float64)
+    seconds = np.zeros(len(ticks))
+    seconds[1:] = np.cumsum(np.diff(ticks) * tempos[:-1] / 1e6 / midi.ticks_per_beat)
+    return ticks, seconds, tempos
+
+def _ticks_to_seconds(ticks, tempo_map, ticks_per_beat):
+    import numpy as np
+    map_ticks, map_seconds, tempos = tempo_map
+    segment = np.searchsorted(map_ticks, ticks, side="right") - 1
+    return map_seconds[segment] + (ticks - map_ticks[segment]) * tempos[segment] / 1e6 / ticks_per_beat
+
+def split_tracks(midi_bytes, sample_rate=AUDIO_SAMPLE_RATE):
+    """
+    Parse a MIDI file into per-track event lists timed in sample frames.
+
+    Returns:
+        list: One list per track with notes, each of (frame, kind, channel, a, b)
+              tuples where kind is "program", "on" or "off".
+    """
+    import mido
+    import numpy as np
+    midi = mido.MidiFile(file=io.BytesIO(midi_bytes))
+    tempo_map = _tempo_map(midi)
+    tracks = []
+    for track in midi.tracks:
+        tick = 0
+        raw = []
+        for message in track:
+            tick += message.time
+            if message.type == "program_change":
+                raw.append((tick, "program", message.channel, message.program, 0))
+            elif message.type == "note_on" and message.velocity > 0:
+                raw.append((tick, "on", message.channel, message.note, message.velocity))
+            elif message.type in ("note_on", "note_off"):
+                raw.append((tick, "off", message.channel, message.note, 0))
+        if not any(kind == "on" for _, kind, _, _, _ in raw):
+            continue
+        seconds = _ticks_to_seconds(np.array([e[0] for e in raw], dtype=np.int64), tempo_map, midi.ticks_per_beat)
+        frames = np.round(seconds * sample_rate).astype(np.int64)
+        tracks.append([(int(frame),) + event[1:] for frame, event in zip(frames, raw)])
+    return tracks
+
+def _synthesize_track(events, soundfont, sample_rate, out_path, chunk_frames, tail_frames):
+    """
+    Synthesize one track to a raw interleaved int16 stereo file (worker process).
+
+    Returns:
+        int: Number of frames written.
+    """
+    import fluidsynth
+    import numpy as np
+    synth = fluidsynth.Synth(samplerate=float(sample_rate))
+    try:
+        sfid = synth.sfload(soundfont)
+        written = 0
+        with open(out_path, "wb") as out:
+            def advance(to_frame):
+                nonlocal written
+                while written < to_frame:
+                    frames = min(chunk_frames, to_frame - written)
+                    out.write(np.asarray(synth.get_samples(frames), dtype=np.int16).tobytes())
+                    written += frames
+
+            for frame, kind, channel, a, b in events:
+                advance(frame)
+                if kind == "program":
+                    synth.program_select(channel, sfid, 0, a)
+                elif kind == "on":
+                    synth.noteon(channel, a, b)
+                else:
+                    synth.noteoff(channel, a)
+            # Let the last notes ring out.
+            advance(written + tail_frames)
+        return written
+    finally:
+        synth.delete()
+
+def _write_mix(track_files, frame_counts, out_path, audio_format, sample_rate, chunk_frames):
+    """
+    Mix raw track files chunk by chunk into a WAV or OGG file.
+    """
+    import numpy as np
+    total = max(frame_counts)
+    sources = [np.memmap(path, dtype=np.int16, mode="r").reshape(-1, 2) if count else None
+               for path, count in zip(track_files, frame_counts)]
+    # Scale by 1/sqrt(tracks) to leave headroom for simultaneous voices.
+    gain = 1.0 / np.sqrt(max(len(sources), 1))
+
+    if audio_format == "ogg":
+        try:
+            import soundfile
+        except ImportError as exc:
+            raise RuntimeError("OGG output requires the optional 'soundfile' package.") from exc
+        writer = soundfile.SoundFile(out_path, mode="w", samplerate=int(sample_rate), channels=2,
+                                     format="OGG", subtype="VORBIS")
+        write = writer.write
+    else:
+        writer = wave.open(out_path, "wb")
+        writer.setnchannels(2)
+        writer.setsampwidth(2)
+        writer.setframerate(int(sample_rate))
+        write = lambda block: writer.writeframes(block.tobytes())  # noqa: E731
+
+    try:
+        for start in range(0, total, chunk_frames):
+            stop = min(start + chunk_frames, total)
+            mix = np.zeros((stop - start, 2), dtype=np.float64)
+            for source in sources:
+                if source is not None and start < len(source):
+                    block = source[start:stop]
+                    mix[:len(block)] += block
+            write(np.clip(mix * gain, -32768, 32767).astype(np.int16))
+    finally:
+        writer.close()
+
+def _render_lock(key):
+    with _render_locks_guard:
+        lock = _render_locks.get(key)
+        if lock is None:
+            lock = _render_locks[key] = threading.Lock()
+        return lock
+
+def _get_pool():
+    """
+    Return the process pool shared by all renders, created on first use.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=AUDIO_WORKERS, mp_context=worker_context())
+    return _pool
+
+def render_audio(midi_bytes, audio_format="wav", soundfont=SOUNDFONT_PATH, sample_rate=AUDIO_SAMPLE_RATE,
+                 progress=None):
+    """
+    Render MIDI bytes to an audio file under AUDIO_DIR, reusing a cached render if present.
+
+    Parameters:
+        midi_bytes (bytes): The MIDI file contents.
+        audio_format (str): "wav" or "ogg" (OGG needs the optional `soundfile` package).
+        soundfont (str): Path to the SoundFont (.sf2).
+        sample_rate (int): Output sample rate in Hz.
+        progress (callable): Optional `progress(stage, message, current=None, total=None)` callback.
+
+    Returns:
+        str: Path to the rendered audio file.
+    """
+    if audio_format not in AUDIO_FORMATS:
+        raise ValueError(f"Unsupported audio format '{audio_format}'. Use one of: {', '.join(AUDIO_FORMATS)}")
+    if not os.path.exists(soundfont):
+        raise FileNotFoundError(f"SoundFont not found at {soundfont}; set SOUNDFONT_PATH in config.py.")
+
+    ensure_directory_exists(AUDIO_DIR)
+    key = render_key(midi_bytes, soundfont, sample_rate, audio_format)
+    out_path = os.path.join(AUDIO_DIR, f"{key[:16]}.{audio_format}")
+
+    # One render per key at a time; later callers find the finished file.
+    with _render_lock(key):
+        if os.path.exists(out_path):
+            logger.info("Audio render %s already exists. Using cached version.", out_path)
+            metrics.increment("audio_cache_total", result="hit")
+            return out_path
+        metrics.increment("audio_cache_total", result="miss")
+
+        with metrics.stage("audio"):
+            tracks = split_tracks(midi_bytes, sample_rate)
+            chunk_frames = AUDIO_CHUNK_FRAMES
+            tail_frames = int(AUDIO_TAIL_SECONDS * sample_rate)
+            with tempfile.TemporaryDirectory(dir=AUDIO_DIR) as tmp:
+                track_files = [os.path.join(tmp, f"track{n}.raw") for n in range(len(tracks))]
+                futures = [_get_pool().submit(_synthesize_track, events, soundfont, sample_rate, path,
+                                              chunk_frames, tail_frames)
+                           for events, path in zip(tracks, track_files)]
+                try:
+                    frame_counts = []
+                    for n, future in enumerate(futures, 1):
+                        frame_counts.append(future.result())
+                        if progress:
+                            progress("audio", f"Synthesized track {n}/{len(futures)}", n, len(futures))
+                finally:
+                    # Don't leave queued tracks writing into the removed temporary directory.
+                    for future in futures:
+                        future.cancel()
+
+                tmp_out = os.path.join(tmp, f"mix.{audio_format}")
+                _write_mix(track_files, frame_counts or [0], tmp_out, audio_format, sample_rate, chunk_frames)
+                os.replace(tmp_out, out_path)
+
+    logger.info("Audio written to: %s", out_path)
+    return out_path
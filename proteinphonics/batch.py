@@ -0,0 +1,195 @@
+# proteinphonics/batch.py
+"""
+Batch generation across many genes.
+
+Genes flow through three overlapping stages:
+
+    fetch   - network-bound, on a thread pool
+    align   - CPU-bound, on a process pool capped by a core budget
+    render  - on a small thread pool, overlapped with both
+
+A JSON manifest records per-gene status and stage timings and is rewritten
+atomically after every change, so an interrupted run can be resumed: genes
+already marked done (with their MIDI present) are skipped, and everything
+else is cheap to redo because fetches and alignments are cached.
+"""
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+
+from config import AA_PITCH_MAP, INSTRUMENT_MAP
+from proteinphonics import metrics
+from proteinphonics.fetch import fetch_sequences
+from proteinphonics.midi_generation import render_alignment
+from proteinphonics.utils import ensure_directory_exists, write_file_atomic
+from proteinphonics.warm import worker_context
+
+PENDING = "pending"
+DONE = "done"
+FAILED = "failed"
+
+logger = logging.getLogger(__name__)
+
+
+def init_align_worker():
+    """
+    Keep each alignment worker single-process so the pool respects the core budget.
+    """
+    from proteinphonics import alignment
+    alignment.STAR_PARALLEL_MIN_CELLS = float("inf")
+
+def _align_job(fasta_file, reference_record, backend):
+    """
+    Align one gene in a worker process.
+
+    Returns:
+        tuple: (alignment file path, wall seconds, CPU seconds).
+    """
+    from proteinphonics.alignment import perform_alignment
+    wall, cpu = time.perf_counter(), time.process_time()
+    path = perform_alignment(fasta_file, backend=backend, reference=reference_record)
+    return path, time.perf_counter() - wall, time.process_time() - cpu
+
+
+class Manifest:
+    """
+    Per-gene status and timings, persisted as JSON after every update.
+    """
+
+    def __init__(self, path, params):
+        self.path = path
+        self.params = params
+        self.genes = {}
+        self._lock = threading.Lock()
+        if os.path.exists(path):
+            with open(path) as f:
+                data = json.load(f)
+            if data.get("params") == params:
+                self.genes = data.get("genes", {})
+            else:
+                logger.warning("Manifest %s was written with different parameters; starting fresh.", path)
+
+    def is_done(self, gene):
+        entry = self.genes.get(gene)
+        return bool(entry and entry.get("status") == DONE and entry.get("midi")
+                    and os.path.exists(entry["midi"]))
+
+    def update(self, gene, **fields):
+        with self._lock:
+            entry = self.genes.setdefault(gene, {"status": PENDING, "timings": {}})
+            timings = fields.pop("timings", None)
+            if timings:
+                entry["timings"].update(timings)
+            entry.update(fields)
+            self._save()
+
+    def _save(self):
+        data = {"params": self.params, "genes": self.genes, "updated_at": time.time()}
+        write_file_atomic(self.path, json.dumps(data, indent=2, sort_keys=True))
+
+    def summary(self):
+        counts = {}
+        for entry in self.genes.values():
+            counts[entry["status"]] = counts.get(entry["status"], 0) + 1
+        return counts
+
+
+def run_batch(genes, species_list, reference_species=None, output_dir="data/midis/batch", manifest_path=None,
+              tempo_bpm=120, time_step=0.5, instrument_mapping=None, backend=None,
+              fetch_workers=8, align_workers=None, render_workers=2, compact=False,
+              reduce=False, sections=None):
+    """
+    Generate MIDI files for many genes with overlapping fetch/align/render stages.
+
+    Parameters:
+        genes (list): Gene symbols.
+        species_list (list): Species panel shared by all genes.
+        reference_species (str): Reference species (defaults to the first species).
+        output_dir (str): Directory for `{gene}.mid` outputs.
+        manifest_path (str): Manifest JSON path (defaults to output_dir/manifest.json).
+        tempo_bpm (int), time_step (float): Musical parameters.
+        instrument_mapping (dict): Species to MIDI program; defaults to INSTRUMENT_MAP.
+        backend (str): Alignment backend name.
+        fetch_workers (int): Concurrent gene fetches.
+        align_workers (int): Core budget for alignment processes (default: CPU count).
+        render_workers (int): Concurrent renders.
+        compact (bool): Render compacted MIDI (see `alignment_to_midi`).
+        reduce (bool), sections (dict): Render consensus voices per clade section
+                                        (see `proteinphonics.reduction`).
+
+    Returns:
+        Manifest: The final manifest.
+    """
+    reference_species = reference_species or species_list[0]
+    reference_record = reference_species.lower().replace(" ", "_")
+    instrument_mapping = instrument_mapping or INSTRUMENT_MAP
+    align_workers = align_workers or os.cpu_count() or 1
+    ensure_directory_exists(output_dir)
+    manifest_path = manifest_path or os.path.join(output_dir, "manifest.json")
+    params = {"species": list(species_list), "reference": reference_species, "tempo_bpm": tempo_bpm,
+              "time_step": time_step, "instruments": instrument_mapping, "backend": backend,
+              "pitch_map": AA_PITCH_MAP, "compact": compact,
+              "reduce": reduce, "sections": sections}
+    manifest = Manifest(manifest_path, params)
+
+    todo = []
+    for gene in dict.fromkeys(genes):
+        if manifest.is_done(gene):
+            logger.info("[%s] already done, skipping.", gene)
+        else:
+            manifest.update(gene, status=PENDING, error=None)
+            todo.append(gene)
+
+    def fetch(gene):
+        start = time.perf_counter()
+        with metrics.stage("fetch"):
+            fasta_file = fetch_sequences(gene, species_list, reference_species)
+        return fasta_file, time.perf_counter() - start
+
+    def render(gene, alignment_file):
+        start = time.perf_counter()
+        midi_filename = os.path.join(output_dir, f"{gene}.mid")
+        render_alignment(alignment_file, midi_filename, tempo_bpm, time_step, instrument_mapping, compact=compact,
+                         reduce=reduce, sections=sections)
+        return midi_filename, time.perf_counter() - start
+
+    with ThreadPoolExecutor(fetch_workers, thread_name_prefix="fetch") as fetch_pool, \
+            ProcessPoolExecutor(align_workers, mp_context=worker_context(), initializer=init_align_worker) as align_pool, \
+            ThreadPoolExecutor(render_workers, thread_name_prefix="render") as render_pool:
+        # Map each in-flight future to (stage, gene, submit time).
+        inflight = {fetch_pool.submit(fetch, gene): ("fetch", gene, time.perf_counter()) for gene in todo}
+        while inflight:
+            finished, _ = wait(inflight, return_when=FIRST_COMPLETED)
+            for future in finished:
+                stage, gene, submitted = inflight.pop(future)
+                try:
+                    result = future.result()
+                except Exception as exc:
+                    logger.error("[%s] %s failed: %s", gene, stage, exc)
+                    manifest.update(gene, status=FAILED, error=f"{stage}: {exc}")
+                    continue
+
+                if stage == "fetch":
+                    fasta_file, seconds = result
+                    manifest.update(gene, timings={"fetch": seconds})
+                    next_future = align_pool.submit(_align_job, fasta_file, reference_record, backend)
+                    inflight[next_future] = ("align", gene, time.perf_counter())
+                elif stage == "align":
+                    alignment_file, seconds, cpu_seconds = result
+                    # Alignment ran in a worker process; record its timings here.
+                    metrics.observe("stage_wall_seconds", seconds, stage="align")
+                    metrics.observe("stage_cpu_seconds", cpu_seconds, stage="align")
+                    manifest.update(gene, timings={"align_queue": time.perf_counter() - submitted - seconds,
+                                                   "align": seconds, "align_cpu": cpu_seconds})
+                    next_future = render_pool.submit(render, gene, alignment_file)
+                    inflight[next_future] = ("render", gene, time.perf_counter())
+                else:
+                    midi_filename, seconds = result
+                    manifest.update(gene, status=DONE, midi=midi_filename, timings={"render": seconds})
+                    logger.info("[%s] done -> %s", gene, midi_filename)
+
+    logger.info("Batch finished: %s (manifest: %s)", manifest.summary(), manifest_path)
+    return manifest
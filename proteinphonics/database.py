@@ -0,0 +1,261 @@
+# proteinphonics/database.py
+"""
+SQLite-backed sequence and alignment cache.
+
+Sequences are stored once, addressed by their SHA-256 hash. Each protein row
+records which sequence a (gene, species, reference species, Ensembl release)
+resolved to; a NULL protein ID records that Ensembl has no ortholog, so the
+lookup is not repeated, and a protein ID resolved again for another gene or
+panel reuses the stored sequence. The ortholog map keeps every protein ID a
+homology request resolved for (gene, reference species, release), whether or
+not its sequence was fetched, so new panels for a gene do not repeat homology
+requests. Alignments are indexed by the hash of their exact (name, sequence)
+member set so panels that overlap can reuse each other; alignments of distinct
+sequences use the sequence hash as the member name, so reuse does not depend
+on species or gene names.
+"""
+import os
+import sqlite3
+import time
+from contextlib import closing
+from config import DATABASE_URI
+from proteinphonics.utils import ensure_directory_exists, sequence_hash
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sequences (
+    seq_hash TEXT PRIMARY KEY,
+    sequence TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS proteins (
+    gene TEXT NOT NULL,
+    species TEXT NOT NULL,
+    reference_species TEXT NOT NULL,
+    release INTEGER NOT NULL,
+    protein_id TEXT,
+    seq_hash TEXT REFERENCES sequences(seq_hash),
+    fetched_at REAL NOT NULL,
+    PRIMARY KEY (gene, species, reference_species, release)
+);
+CREATE TABLE IF NOT EXISTS orthologs (
+    gene TEXT NOT NULL,
+    reference_species TEXT NOT NULL,
+    release INTEGER NOT NULL,
+    species TEXT NOT NULL,
+    protein_id TEXT,
+    resolved_at REAL NOT NULL,
+    PRIMARY KEY (gene, reference_species, release, species)
+);
+CREATE TABLE IF NOT EXISTS alignments (
+    set_hash TEXT NOT NULL,
+    backend TEXT NOT NULL,
+    path TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    PRIMARY KEY (set_hash, backend)
+);
+CREATE TABLE IF NOT EXISTS alignment_members (
+    set_hash TEXT NOT NULL,
+    name TEXT NOT NULL,
+    seq_hash TEXT NOT NULL,
+    PRIMARY KEY (set_hash, name)
+);
+CREATE INDEX IF NOT EXISTS proteins_by_protein_id ON proteins (protein_id, release);
+CREATE INDEX IF NOT EXISTS alignment_members_by_member ON alignment_members (name, seq_hash);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL,
+    updated_at REAL NOT NULL
+);
+"""
+
+def database_path(uri=DATABASE_URI):
+    """
+    Translate a `sqlite:///path` URI into a filesystem path.
+    """
+    prefix = "sqlite:///"
+    if not uri.startswith(prefix):
+        raise ValueError(f"Unsupported database URI '{uri}'; expected '{prefix}<path>'.")
+    return uri[len(prefix):]
+
+def connect(uri=DATABASE_URI):
+    """
+    Open a connection to the cache database, creating the schema if needed.
+    Connections are cheap; callers open one per operation so threads never share one.
+    """
+    path = database_path(uri)
+    directory = os.path.dirname(path)
+    if directory:
+        ensure_directory_exists(directory)
+    conn = sqlite3.connect(path, timeout=30)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.executescript(SCHEMA)
+    return conn
+
+def get_meta(key, max_age=None, uri=DATABASE_URI):
+    """
+    Return a cached metadata value, or None if it is missing or older than `max_age` seconds.
+    """
+    with closing(connect(uri)) as conn:
+        row = conn.execute("SELECT value, updated_at FROM meta WHERE key = ?", (key,)).fetchone()
+    if row is None:
+        return None
+    value, updated_at = row
+    if max_age is not None and time.time() - updated_at > max_age:
+        return None
+    return value
+
+def set_meta(key, value, uri=DATABASE_URI):
+    with closing(connect(uri)) as conn, conn:
+        conn.execute("INSERT OR REPLACE INTO meta (key, value, updated_at) VALUES (?, ?, ?)",
+                     (key, str(value), time.time()))
+
+def get_proteins(gene, species_list, reference_species, release, uri=DATABASE_URI):
+    """
+    Look up cached proteins for the given species.
+
+    Returns:
+        dict: Mapping of species to (protein_id, sequence). Species with a cached
+              "no ortholog" entry map to (None, None); uncached species are absent.
+    """
+    if not species_list:
+        return {}
+    placeholders = ",".join("?" for _ in species_list)
+    query = f"""
+        SELECT p.species, p.protein_id, s.sequence
+        FROM proteins p LEFT JOIN sequences s ON s.seq_hash = p.seq_hash
+        WHERE p.gene = ? AND p.reference_species = ? AND p.release = ?
+          AND p.species IN ({placeholders})
+    """
+    with closing(connect(uri)) as conn:
+        rows = conn.execute(query, (gene, reference_species, release, *species_list)).fetchall()
+    return {species: (protein_id, sequence) for species, protein_id, sequence in rows}
+
+def store_proteins(gene, reference_species, release, entries, uri=DATABASE_URI):
+    """
+    Store resolved proteins in a single transaction.
+
+    Parameters:
+        entries (dict): Mapping of species to (protein_id, sequence); use (None, None)
+                        to record that no ortholog exists.
+    """
+    now = time.time()
+    with closing(connect(uri)) as conn, conn:
+        for species, (protein_id, sequence) in entries.items():
+            seq_hash = None
+            if sequence is not None:
+                seq_hash = sequence_hash(sequence)
+                conn.execute("INSERT OR IGNORE INTO sequences (seq_hash, sequence) VALUES (?, ?)",
+                             (seq_hash, sequence))
+            conn.execute(
+                "INSERT OR REPLACE INTO proteins "
+                "(gene, species, reference_species, release, protein_id, seq_hash, fetched_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (gene, species, reference_species, release, protein_id, seq_hash, now))
+
+def get_protein_sequences(protein_ids, release, uri=DATABASE_URI):
+    """
+    Look up cached sequences of protein IDs resolved for any gene or panel in `release`.
+
+    Returns:
+        dict: Mapping of protein ID to sequence; uncached IDs are absent.
+    """
+    if not protein_ids:
+        return {}
+    placeholders = ",".join("?" for _ in protein_ids)
+    query = f"""
+        SELECT DISTINCT p.protein_id, s.sequence
+        FROM proteins p JOIN sequences s ON s.seq_hash = p.seq_hash
+        WHERE p.release = ? AND p.protein_id IN ({placeholders})
+    """
+    with closing(connect(uri)) as conn:
+        return dict(conn.execute(query, (release, *protein_ids)).fetchall())
+
+def get_orthologs(gene, reference_species, release, species_list, uri=DATABASE_URI):
+    """
+    Look up persisted ortholog protein IDs for the given species.
+
+    Returns:
+        dict: Mapping of species to protein ID (None for a recorded "no ortholog");
+              species that were never resolved are absent.
+    """
+    if not species_list:
+        return {}
+    placeholders = ",".join("?" for _ in species_list)
+    query = f"""
+        SELECT species, protein_id FROM orthologs
+        WHERE gene = ? AND reference_species = ? AND release = ? AND species IN ({placeholders})
+    """
+    with closing(connect(uri)) as conn:
+        rows = conn.execute(query, (gene, reference_species, release, *species_list)).fetchall()
+    return dict(rows)
+
+def store_orthologs(gene, reference_species, release, protein_ids, uri=DATABASE_URI):
+    """
+    Persist resolved ortholog protein IDs ({species: protein_id or None}) in one transaction.
+    """
+    now = time.time()
+    with closing(connect(uri)) as conn, conn:
+        conn.executemany(
+            "INSERT OR REPLACE INTO orthologs (gene, reference_species, release, species, protein_id, resolved_at) "
+            "VALUES (?, ?, ?, ?, ?, ?)",
+            [(gene, reference_species, release, species, protein_id, now)
+             for species, protein_id in protein_ids.items()])
+
+def register_alignment(set_hash, backend, path, members, uri=DATABASE_URI):
+    """
+    Record an alignment file produced by `backend` and its members.
+
+    Parameters:
+        members (list): (name, seq_hash) tuples of the ungapped input sequences.
+    """
+    with closing(connect(uri)) as conn, conn:
+        conn.execute("INSERT OR REPLACE INTO alignments (set_hash, backend, path, size, created_at) "
+                     "VALUES (?, ?, ?, ?, ?)", (set_hash, backend, path, len(members), time.time()))
+        conn.executemany("INSERT OR IGNORE INTO alignment_members (set_hash, name, seq_hash) VALUES (?, ?, ?)",
+                         [(set_hash, name, seq_hash) for name, seq_hash in members])
+
+def get_alignment(set_hash, backend, uri=DATABASE_URI):
+    """
+    Return the path of the `backend` alignment for exactly this member set, or None.
+    """
+    with closing(connect(uri)) as conn:
+        row = conn.execute("SELECT path FROM alignments WHERE set_hash = ? AND backend = ?",
+                           (set_hash, backend)).fetchone()
+    return row[0] if row else None
+
+def _overlapping_alignments(members, backend, conn):
+    # Join the members as a VALUES table so the lookup uses alignment_members_by_member.
+    keys = list(dict.fromkeys((name, seq_hash) for name, seq_hash in members))
+    if not keys:
+        return []
+    placeholders = ",".join("(?, ?)" for _ in keys)
+    query = f"""
+        WITH wanted (name, seq_hash) AS (VALUES {placeholders})
+        SELECT a.set_hash, a.path, a.size, COUNT(*) AS shared
+        FROM wanted
+        JOIN alignment_members m ON m.name = wanted.name AND m.seq_hash = wanted.seq_hash
+        JOIN alignments a ON a.set_hash = m.set_hash
+        WHERE a.backend = ?
+        GROUP BY a.set_hash
+    """
+    return conn.execute(query, (*(value for key in keys for value in key), backend)).fetchall()
+
+def find_containing_alignments(members, backend, uri=DATABASE_URI):
+    """
+    Return (set_hash, path, size) of cached `backend` alignments that contain
+    every member, smallest first.
+    """
+    with closing(connect(uri)) as conn:
+        rows = _overlapping_alignments(members, backend, conn)
+    return sorted(((h, p, size) for h, p, size, shared in rows if shared == len(members)),
+                  key=lambda row: row[2])
+
+def find_contained_alignments(members, backend, uri=DATABASE_URI):
+    """
+    Return (set_hash, path, size) of cached `backend` alignments whose members
+    are all in `members`, largest first.
+    """
+    with closing(connect(uri)) as conn:
+        rows = _overlapping_alignments(members, backend, conn)
+    return sorted(((h, p, size) for h, p, size, shared in rows if shared == size),
+                  key=lambda row: -row[2])
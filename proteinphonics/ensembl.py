@@ -0,0 +1,324 @@
+# proteinphonics/ensembl.py
+"""
+Shared, rate-limited client for the Ensembl REST API.
+
+All Ensembl traffic goes through one keep-alive `requests.Session` with a
+connection pool, a token-bucket limiter tuned to Ensembl's published limits
+(55,000 requests/hour, ~15 requests/second) and automatic back-off on
+`Retry-After`. Batch POST endpoints are used wherever Ensembl offers them.
+Homology responses are parsed as they stream in, one homology at a time.
+"""
+import codecs
+import json
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from proteinphonics import metrics
+from config import (
+    ENSEMBL_REST_SERVER,
+    ENSEMBL_REQUESTS_PER_SECOND,
+    ENSEMBL_BURST,
+    ENSEMBL_MAX_WORKERS,
+    ENSEMBL_MAX_RETRIES,
+    ENSEMBL_TIMEOUT,
+    ENSEMBL_SEQUENCE_BATCH_SIZE,
+    ENSEMBL_SYMBOL_BATCH_SIZE,
+)
+
+JSON_HEADERS = {"Content-Type": "application/json", "Accept": "application/json"}
+FASTA_HEADERS = {"Content-Type": "text/x-fasta"}
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket.
+
+    Parameters:
+        rate (float): Tokens added per second.
+        capacity (int): Maximum number of tokens (burst size).
+    """
+
+    def __init__(self, rate, capacity):
+        self.rate = float(rate)
+        self.capacity = float(capacity)
+        self._tokens = float(capacity)
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """Block until a token is available, then consume it."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                if now < self._paused_until:
+                    wait = self._paused_until - now
+                else:
+                    elapsed = now - self._updated
+                    self._tokens = min(self.capacity, self._tokens + elapsed * self.rate)
+                    self._updated = now
+                    if self._tokens >= 1.0:
+                        self._tokens -= 1.0
+                        return
+                    wait = (1.0 - self._tokens) / self.rate
+            time.sleep(wait)
+
+    def pause(self, seconds):
+        """Stop handing out tokens for `seconds` (used when the server says Retry-After)."""
+        with self._lock:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+            self._tokens = 0.0
+            self._updated = self._paused_until
+
+
+class EnsemblClient:
+    """
+    Pooled, rate-limited Ensembl REST client.
+
+    Parameters:
+        server (str): Base URL of the REST server (override to point at a local stub).
+        requests_per_second (float): Sustained request rate.
+        burst (int): Token-bucket capacity.
+        max_workers (int): Size of the connection pool and of the lookup thread pool.
+        max_retries (int): Retries for 429/5xx responses, connection errors and timeouts.
+        timeout (float): Per-request timeout in seconds.
+    """
+
+    def __init__(self, server=ENSEMBL_REST_SERVER, requests_per_second=ENSEMBL_REQUESTS_PER_SECOND,
+                 burst=ENSEMBL_BURST, max_workers=ENSEMBL_MAX_WORKERS,
+                 max_retries=ENSEMBL_MAX_RETRIES, timeout=ENSEMBL_TIMEOUT):
+        self.server = server.rstrip("/")
+        self.max_retries = max_retries
+        self.timeout = timeout
+        self.max_workers = max_workers
+        self.limiter = TokenBucket(requests_per_second, burst)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=max_workers, pool_maxsize=max_workers)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self._executor = None
+        self._executor_lock = threading.Lock()
+
+    @property
+    def executor(self):
+        """Thread pool used to run independent lookups concurrently."""
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers,
+                                                    thread_name_prefix="ensembl")
+            return self._executor
+
+    def close(self):
+        """Shut down the thread pool and release pooled connections."""
+        with self._executor_lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=True)
+                self._executor = None
+        self.session.close()
+
+    def request(self, method, ext, headers=JSON_HEADERS, **kwargs):
+        """
+        Issue a rate-limited request, retrying on 429, transient 5xx errors,
+        connection errors (e.g. a reset pooled keep-alive connection) and timeouts.
+
+        Parameters:
+            method (str): HTTP method.
+            ext (str): Path relative to the server, e.g. "/lookup/symbol/homo_sapiens/HOXA5".
+            headers (dict): Request headers.
+            **kwargs: Passed through to `requests.Session.request`.
+
+        Returns:
+            response: The successful `requests.Response`.
+        """
+        url = self.server + ext
+        endpoint = endpoint_name(ext)
+        kwargs.setdefault("timeout", self.timeout)
+        for attempt in range(self.max_retries + 1):
+            self.limiter.acquire()
+            start = time.perf_counter()
+            try:
+                response = self.session.request(method, url, headers=headers, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as exc:
+                metrics.increment("ensembl_requests_total", endpoint=endpoint, status="error")
+                if attempt == self.max_retries:
+                    raise
+                delay = 2 ** attempt
+                logger.warning("Ensembl %s failed (%s); retrying in %.1fs", endpoint, exc, delay)
+                # Only this request backs off; the server did not ask everyone to slow down.
+                time.sleep(delay)
+                continue
+            metrics.observe("ensembl_request_seconds", time.perf_counter() - start, endpoint=endpoint)
+            metrics.increment("ensembl_requests_total", endpoint=endpoint, status=response.status_code)
+            if response.status_code == 429 or response.status_code in (502, 503, 504):
+                if attempt == self.max_retries:
+                    break
+                retry_after = _retry_after_seconds(response, default=2 ** attempt)
+                logger.warning("Ensembl %s returned %d; retrying in %.1fs", endpoint, response.status_code,
+                               retry_after)
+                self.limiter.pause(retry_after)
+                response.close()  # Release the connection of a streamed response.
+                continue
+            break
+        response.raise_for_status()
+        return response
+
+    def get_json(self, ext, params=None):
+        return self.request("GET", ext, params=params).json()
+
+    def post_json(self, ext, payload, params=None):
+        return self.request("POST", ext, json=payload, params=params).json()
+
+    def lookup_symbols(self, species, symbols, expand=True):
+        """
+        Look up many gene symbols in one species using the batch POST endpoint.
+
+        Returns:
+            dict: Mapping of symbol to the decoded gene object (missing symbols are omitted).
+        """
+        params = {"expand": 1} if expand else None
+        results = {}
+        for batch in _chunks(list(symbols), ENSEMBL_SYMBOL_BATCH_SIZE):
+            decoded = self.post_json(f"/lookup/symbol/{species}", {"symbols": batch}, params=params)
+            results.update({symbol: gene for symbol, gene in decoded.items() if gene})
+        return results
+
+    def homology(self, species, symbol, target_species):
+        """Fetch orthologues of `symbol` in `target_species` (single-target GET)."""
+        ext = f"/homology/symbol/{species}/{symbol}"
+        params = {"target_species": target_species, "type": "orthologues"}
+        return self.get_json(ext, params=params)
+
+    def homologies(self, species, symbol, target_species):
+        """
+        Stream the orthologues of `symbol` in all `target_species` from one request,
+        in the condensed format without sequences.
+
+        Yields:
+            dict: Condensed homology entries ("type", "species", "id", "protein_id", ...).
+        """
+        ext = f"/homology/symbol/{species}/{symbol}"
+        params = {"target_species": list(target_species), "type": "orthologues", "format": "condensed",
+                  "sequence": "none"}
+        response = self.request("GET", ext, params=params, stream=True)
+        try:
+            yield from iter_json_array(response.iter_content(chunk_size=1 << 16), "homologies")
+        finally:
+            response.close()
+
+    def sequences(self, ids, seq_type="protein"):
+        """
+        Fetch many sequences with the batch POST form of /sequence/id.
+
+        Returns:
+            dict: Mapping of stable ID to sequence string.
+        """
+        results = {}
+        for batch in _chunks(list(dict.fromkeys(ids)), ENSEMBL_SEQUENCE_BATCH_SIZE):
+            decoded = self.post_json("/sequence/id", {"ids": batch}, params={"type": seq_type})
+            for entry in decoded:
+                # `query` is the ID we asked for; `id` can carry a version suffix.
+                results[entry.get("query", entry["id"])] = entry["seq"]
+        return results
+
+    def release(self):
+        """Return the current Ensembl release number served by this server."""
+        decoded = self.get_json("/info/data")
+        return max(int(r) for r in decoded["releases"])
+
+    def map(self, fn, iterable):
+        """Run `fn` over `iterable` on the client's thread pool, preserving order."""
+        return list(self.executor.map(fn, iterable))
+
+
+def endpoint_name(ext):
+    """
+    Reduce a request path to its endpoint for metrics, dropping IDs and symbols
+    (e.g. "/homology/symbol/homo_sapiens/HOXA5" -> "/homology/symbol").
+    """
+    return "/" + "/".join(ext.strip("/").split("/")[:2])
+
+
+def iter_json_array(chunks, key):
+    """
+    Incrementally decode a streamed JSON document, yielding the elements of every
+    array stored under `key` as soon as each element is complete (its closing
+    "," or "]" has arrived, so a number split across chunks is not cut short).
+    Only the current element is ever held in memory as text.
+
+    Parameters:
+        chunks (iterable): The document as bytes chunks.
+        key (str): Object key of the arrays to extract.
+    """
+    decoder = json.JSONDecoder()
+    utf8 = codecs.getincrementaldecoder("utf-8")()
+    marker = f'"{key}"'
+    buffer = ""
+    in_array = False
+    for chunk in chunks:
+        buffer += utf8.decode(chunk)
+        while True:
+            if not in_array:
+                found = buffer.find(marker)
+                if found < 0:
+                    buffer = buffer[-len(marker):]  # Keep a possible partial marker.
+                    break
+                start = buffer.find("[", found + len(marker))
+                if start < 0:
+                    buffer = buffer[found:]
+                    break
+                buffer = buffer[start + 1:]
+                in_array = True
+            buffer = buffer.lstrip(" \t\r\n,")
+            if not buffer:
+                break
+            if buffer[0] == "]":
+                buffer = buffer[1:]
+                in_array = False
+                continue
+            try:
+                element, end = decoder.raw_decode(buffer)
+            except json.JSONDecodeError:
+                break  # Incomplete element; wait for more data.
+            rest = buffer[end:].lstrip(" \t\r\n")
+            if not rest:
+                break  # No delimiter yet: a scalar such as 12 may continue as 1234.
+            buffer = rest
+            yield element
+    if in_array:
+        raise ValueError(f"Truncated JSON array '{key}'.")
+
+
+def _retry_after_seconds(response, default):
+    value = response.headers.get("Retry-After")
+    if value is None:
+        # Ensembl also reports the reset window explicitly.
+        value = response.headers.get("X-RateLimit-Reset")
+    try:
+        return max(float(value), 0.0)
+    except (TypeError, ValueError):
+        return float(default)
+
+
+def _chunks(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+_default_client = None
+_default_client_lock = threading.Lock()
+
+
+def get_client():
+    """Return the process-wide shared EnsemblClient, creating it on first use."""
+    global _default_client
+    with _default_client_lock:
+        if _default_client is None:
+            _default_client = EnsemblClient()
+        return _default_client
@@ -0,0 +1,264 @@
+# proteinphonics/features.py
+"""
+Precomputed alignment feature index for fast re-rendering.
+
+Everything about an alignment that does not depend on tempo, time step or
+instruments is computed once and saved next to its binary store as
+`aligned_x.<pitch map>.features.npz`:
+
+    offsets       rows + 1 offsets into the per-note arrays
+    positions     alignment column of every residue, row by row
+    pitches       MIDI pitch of every residue under the pitch map
+    run_starts    whether a note starts a new run of one pitch in adjacent columns
+    gap_mask      packed (rows, columns) gap bitmap
+    gap_fraction  per column, fraction of rows with a gap
+    conservation  per column, fraction of rows carrying the most frequent residue
+    entropy       per column, Shannon entropy (bits) of the residues
+    conserved     per column, whether every row has the same residue
+
+`render_features` turns an index into MIDI with array slicing and the SMF
+encoder only, so changing musical parameters does not touch the alignment.
+Loaded indexes stay resident in the process.
+"""
+import hashlib
+import io
+import json
+import logging
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from config import AA_PITCH_MAP
+from proteinphonics.alignment_store import load_alignment, residue_window
+from proteinphonics.midi_generation import (
+    CONSERVED_VELOCITY, DEFAULT_VELOCITY, GAP, conserved_columns, finish_midi, pitch_lookup_table, species_name,
+)
+from proteinphonics.reduction import residue_profile, symbol_codes
+from proteinphonics.smf import NoteTrack, channel_for_track, seconds_to_ticks
+from proteinphonics.utils import write_file_atomic
+
+FEATURES_VERSION = 1
+FEATURES_EXTENSION = ".features.npz"
+RESIDENT_FEATURES = 32  # Feature indexes kept loaded in memory
+
+logger = logging.getLogger(__name__)
+
+
+class AlignmentFeatures:
+    """
+    The feature index of one alignment (see the module docstring for the arrays).
+
+    Attributes:
+        ids (list): Record IDs, in row order.
+        columns (int): Alignment length.
+    """
+
+    def __init__(self, ids, columns, arrays):
+        self.ids = ids
+        self.columns = columns
+        for name, value in arrays.items():
+            setattr(self, name, value)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def row(self, index):
+        """Return (positions, pitches, run_starts) of the residues of row `index`."""
+        start, stop = self.offsets[index], self.offsets[index + 1]
+        return self.positions[start:stop], self.pitches[start:stop], self.run_starts[start:stop]
+
+    def gaps(self, index):
+        """Return the boolean gap mask of row `index`."""
+        return np.unpackbits(self.gap_mask[index], count=self.columns).astype(bool)
+
+
+def pitch_map_fingerprint(aa_pitch_map):
+    """
+    Short stable hash of a pitch map, used to name its feature files.
+    """
+    encoded = json.dumps(aa_pitch_map, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()[:12]
+
+def features_path(alignment_path, aa_pitch_map=AA_PITCH_MAP):
+    """
+    Return the feature index path for an alignment file (FASTA or binary store).
+    """
+    return f"{os.path.splitext(alignment_path)[0]}.{pitch_map_fingerprint(aa_pitch_map)}{FEATURES_EXTENSION}"
+
+def compute_features(ids, matrix, aa_pitch_map=AA_PITCH_MAP):
+    """
+    Compute the feature index of an alignment matrix.
+
+    Returns:
+        AlignmentFeatures: The index.
+    """
+    matrix = np.asarray(matrix)
+    rows, columns = matrix.shape
+    gaps = matrix == GAP
+    per_row = [np.flatnonzero(~row) for row in gaps]
+    offsets = np.cumsum([0] + [len(p) for p in per_row], dtype=np.int64)
+    positions = np.concatenate(per_row).astype(np.int32) if rows else np.zeros(0, dtype=np.int32)
+    pitches = pitch_lookup_table(aa_pitch_map)[matrix[~gaps]]  # Row-major, same order as positions
+
+    # A note starts a run unless the previous note of its row is in the previous column with the same pitch.
+    run_starts = np.ones(len(positions), dtype=bool)
+    if len(positions) > 1:
+        run_starts[1:] = (np.diff(positions) != 1) | (np.diff(pitches.astype(np.int16)) != 0)
+    run_starts[offsets[:-1][offsets[:-1] < len(positions)]] = True
+
+    table, _ = symbol_codes(aa_pitch_map)
+    symbols = len(aa_pitch_map) + 2
+    counts = residue_profile(matrix, table, symbols)
+    residue_counts = counts[:, :-1]
+    residues = residue_counts.sum(axis=1)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        p = residue_counts / np.maximum(residues, 1)[:, None]
+        entropy = np.abs(np.where(p > 0, p * np.log2(p), 0.0).sum(axis=1))
+
+    return AlignmentFeatures(list(ids), columns, {
+        "offsets": offsets,
+        "positions": positions,
+        "pitches": pitches,
+        "run_starts": run_starts,
+        "gap_mask": np.packbits(gaps, axis=1),
+        "gap_fraction": (counts[:, -1] / max(rows, 1)).astype(np.float32),
+        "conservation": (residue_counts.max(axis=1) / max(rows, 1)).astype(np.float32),
+        "entropy": entropy.astype(np.float32),
+        "conserved": conserved_columns(matrix),
+    })
+
+def save_features(features, path):
+    buffer = io.BytesIO()
+    header = json.dumps({"version": FEATURES_VERSION, "ids": features.ids, "columns": features.columns})
+    arrays = {name: value for name, value in vars(features).items() if isinstance(value, np.ndarray)}
+    np.savez(buffer, header=np.frombuffer(header.encode("utf-8"), dtype=np.uint8), **arrays)
+    write_file_atomic(path, buffer.getvalue())
+
+def _read_features(path):
+    with np.load(path) as data:
+        header = json.loads(data["header"].tobytes().decode("utf-8"))
+        if header.get("version") != FEATURES_VERSION:
+            return None
+        arrays = {name: data[name] for name in data.files if name != "header"}
+    return AlignmentFeatures(header["ids"], header["columns"], arrays)
+
+_resident = OrderedDict()
+_resident_lock = threading.Lock()
+
+def load_features(alignment_file, aa_pitch_map=AA_PITCH_MAP):
+    """
+    Return the feature index of an aligned FASTA file, computing and saving it
+    on first use or when the alignment has changed since.
+
+    Returns:
+        AlignmentFeatures: The index (shared; treat its arrays as read-only).
+    """
+    alignment = load_alignment(alignment_file)
+    path = features_path(alignment.path, aa_pitch_map)
+    key = (path, os.stat(alignment.path).st_mtime_ns)
+    with _resident_lock:
+        if key in _resident:
+            _resident.move_to_end(key)
+            return _resident[key]
+
+    features = None
+    if os.path.exists(path) and os.stat(path).st_mtime_ns >= key[1]:
+        features = _read_features(path)
+    if features is None:
+        logger.info("Building feature index %s", path)
+        features = compute_features(alignment.ids, alignment.matrix, aa_pitch_map)
+        save_features(features, path)
+
+    with _resident_lock:
+        _resident[key] = features
+        while len(_resident) > RESIDENT_FEATURES:
+            _resident.popitem(last=False)
+    return features
+
+def _merge(positions, pitches, velocities, starts):
+    """Collapse notes into runs beginning where `starts` is True."""
+    if not len(positions):
+        return positions, positions + 1, pitches, velocities
+    firsts = np.flatnonzero(starts)
+    lasts = np.append(firsts[1:] - 1, len(positions) - 1)
+    return positions[firsts], positions[lasts] + 1, pitches[firsts], velocities[firsts]
+
+def features_to_tracks(features, species_instrument_map, tempo_bpm=120, time_step=0.5, start=0, stop=None,
+                       compact=False):
+    """
+    Build one NoteTrack per row from a feature index, for columns [start, stop).
+    Produces the same tracks as `matrix_to_tracks` on the same window.
+    """
+    stop = features.columns if stop is None else stop
+    boundaries = seconds_to_ticks(np.arange(stop - start + 1) * time_step, tempo_bpm)
+    conserved = features.conserved[start:stop]
+    tracks = []
+    for n, record_id in enumerate(features.ids):
+        species = species_name(record_id)
+        positions, pitches, run_starts = features.row(n)
+        first, last = np.searchsorted(positions, (start, stop))
+        positions = positions[first:last] - start
+        pitches = pitches[first:last]
+        velocities = np.full(len(positions), DEFAULT_VELOCITY, dtype=np.uint8)
+        stops = positions + 1
+        if compact and len(positions):
+            starts = run_starts[first:last].copy()
+            starts[0] = True
+            held = conserved[positions]
+            if n == 0:
+                velocities[held] = CONSERVED_VELOCITY
+                starts[1:] |= held[1:] != held[:-1]
+            else:
+                keep = ~held
+                positions, pitches, velocities, starts = positions[keep], pitches[keep], velocities[keep], starts[keep]
+                if len(positions):
+                    starts[0] = True
+                    starts[1:] |= np.diff(positions) != 1
+            positions, stops, pitches, velocities = _merge(positions, pitches, velocities, starts)
+        tracks.append(NoteTrack(
+            name=species,
+            program=species_instrument_map.get(species, 0),
+            channel=channel_for_track(n),
+            starts=boundaries[positions],
+            ends=boundaries[stops],
+            pitches=pitches,
+            velocities=velocities,
+        ))
+    return tracks
+
+def resolve_window(features, columns=None, residues=None, reference=None):
+    """
+    Resolve a column window or reference residue range (see `alignment_to_midi`)
+    to a half-open column window of a feature index.
+
+    Returns:
+        tuple: (start, stop); the whole alignment when neither is given.
+    """
+    if columns is not None and residues is not None:
+        raise ValueError("Pass either a column window or a residue range, not both.")
+    if residues is not None:
+        reference = reference or features.ids[0]
+        if reference not in features.ids:
+            raise ValueError(f"Reference '{reference}' is not in the alignment.")
+        return residue_window(features.row(features.ids.index(reference))[0], *residues, reference)
+    if columns is not None:
+        start, stop = max(int(columns[0]), 0), min(int(columns[1]), features.columns)
+        if start >= stop:
+            raise ValueError(f"Empty column window {columns} for an alignment of {features.columns} columns.")
+        return start, stop
+    return 0, features.columns
+
+def render_features(features, species_instrument_map, midi_filename=None, tempo_bpm=120, time_step=0.5,
+                    columns=None, residues=None, reference=None, compact=False):
+    """
+    Render MIDI from a feature index. Takes the same window and `compact`
+    options as `alignment_to_midi` and returns the same bytes.
+
+    Returns:
+        bytes: The MIDI file contents.
+    """
+    start, stop = resolve_window(features, columns, residues, reference)
+    tracks = features_to_tracks(features, species_instrument_map, tempo_bpm, time_step, start, stop, compact)
+    return finish_midi(tracks, tempo_bpm, midi_filename)
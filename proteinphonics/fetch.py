@@ -1,99 +1,300 @@
 # proteinphonics/fetch.py
+import hashlib
+import itertools
+import logging
 import os
-import time
 import requests
-from config import ENSEMBL_REST_SERVER, ENSEMBL_HEADERS_JSON, ENSEMBL_HEADERS_FASTA, FASTA_DIR
-from proteinphonics.utils import ensure_directory_exists
+from config import ENSEMBL_HEADERS_FASTA, ENSEMBL_RELEASE, ENSEMBL_RELEASE_TTL, FASTA_DIR, USE_LOCAL_INDEX
+from proteinphonics import database, metrics
+from proteinphonics.ensembl import get_client
+from proteinphonics.local_index import get_local_index
+from proteinphonics.utils import ensure_directory_exists, write_file_atomic
 
-def fetch_ensembl_protein_id(gene_name, species):
+logger = logging.getLogger(__name__)
+
+def _longest_translation_id(gene):
+    """
+    Return the representative protein (Translation) ID of an expanded gene lookup:
+    the longest translation, ties broken by the lowest protein ID. This is the
+    rule `LocalIndex.protein_for_symbol` applies, so both paths pick the same protein.
+    """
+    translations = [transcript['Translation'] for transcript in gene.get('Transcript', [])
+                    if (transcript.get('Translation') or {}).get('id')]
+    if not translations:
+        return None
+    return min(translations, key=lambda t: (-(t.get('length') or 0), t['id']))['id']
+
+def fetch_ensembl_protein_id(gene_name, species, client=None):
     """
     Fetch the Ensembl protein ID for a given gene in the specified species.
     """
-    ext = f"/lookup/symbol/{species}/{gene_name}?expand=1"
-    url = ENSEMBL_REST_SERVER + ext
-    response = requests.get(url, headers=ENSEMBL_HEADERS_JSON)
-    response.raise_for_status()
-    decoded = response.json()
-    transcripts = decoded.get('Transcript', [])
-    for transcript in transcripts:
-        protein_id = transcript.get('Translation', {}).get('id')
-        if protein_id:
-            return protein_id
-    return None
+    client = client or get_client()
+    genes = client.lookup_symbols(species, [gene_name])
+    gene = genes.get(gene_name)
+    if gene is None:
+        return None
+    return _longest_translation_id(gene)
+
+def _ortholog_rank(homology):
+    """
+    Sort key for choosing between several orthologs in one species: one-to-one
+    orthologs first, then the lowest protein ID, so the choice is stable across
+    requests. `LocalIndex.ortholog` ranks the same way.
+    """
+    return homology.get('type') != 'ortholog_one2one', homology.get('protein_id') or ''
+
+def best_orthologs(homologies):
+    """
+    Pick one ortholog protein ID per target species from condensed homology entries.
+
+    Returns:
+        dict: Mapping of species query name (e.g. "mus_musculus") to protein ID.
+    """
+    best = {}
+    for homology in homologies:
+        if homology.get('protein_id') and homology.get('species'):
+            current = best.get(homology['species'])
+            if current is None or _ortholog_rank(homology) < _ortholog_rank(current):
+                best[homology['species']] = homology
+    return {species: homology['protein_id'] for species, homology in best.items()}
+
+def fetch_ensembl_ortholog_protein_ids(reference_gene, reference_species, target_species, client=None):
+    """
+    Fetch the ortholog protein IDs of a reference gene in many target species
+    with a single homology request.
+
+    Returns:
+        dict: Mapping of every target species query name to a protein ID (None if no ortholog).
+    """
+    client = client or get_client()
+    found = best_orthologs(client.homologies(reference_species, reference_gene, target_species))
+    return {species: found.get(species) for species in target_species}
 
-def fetch_ensembl_ortholog_protein_id(reference_gene, reference_species, target_species):
+def fetch_ensembl_ortholog_protein_id(reference_gene, reference_species, target_species, client=None):
     """
     Fetch the Ensembl protein ID for an ortholog in the target species based on a reference gene.
     """
-    ext = f"/homology/symbol/{reference_species}/{reference_gene}?target_species={target_species}&type=orthologues&content-type=application/json"
-    url = ENSEMBL_REST_SERVER + ext
-    response = requests.get(url, headers=ENSEMBL_HEADERS_JSON)
-    response.raise_for_status()
-    decoded = response.json()
-    data = decoded.get('data', [])
-    if data:
-        homologies = data[0].get('homologies', [])
-        if homologies:
-            protein_id = homologies[0]['target'].get('protein_id')
-            return protein_id
-    return None
-
-def fetch_ensembl_protein_sequence(protein_id):
+    return fetch_ensembl_ortholog_protein_ids(reference_gene, reference_species, [target_species],
+                                              client=client)[target_species]
+
+def fetch_ensembl_protein_sequence(protein_id, client=None):
     """
     Fetch the protein sequence in FASTA format for a given protein ID.
     """
-    ext = f"/sequence/id/{protein_id}?type=protein"
-    url = ENSEMBL_REST_SERVER + ext
-    print(f"Fetching protein sequence for ID: {protein_id}")
-    response = requests.get(url, headers=ENSEMBL_HEADERS_FASTA)
-    if not response.ok:
-        response.raise_for_status()
+    client = client or get_client()
+    logger.debug("Fetching protein sequence for ID: %s", protein_id)
+    response = client.request("GET", f"/sequence/id/{protein_id}", headers=ENSEMBL_HEADERS_FASTA,
+                              params={"type": "protein"})
     return response.text
 
-def fetch_sequences(gene_name, species_list, reference_species=None):
+def fetch_ensembl_protein_sequences(protein_ids, client=None):
+    """
+    Fetch many protein sequences in as few round-trips as possible.
+
+    Returns:
+        dict: Mapping of protein ID to its amino-acid sequence.
+    """
+    client = client or get_client()
+    logger.debug("Fetching %d protein sequences", len(protein_ids))
+    return client.sequences(protein_ids, seq_type="protein")
+
+def resolve_protein_ids(gene_name, species_list, reference_species, client=None, progress=None, release=None):
+    """
+    Resolve the protein ID of `gene_name` in every species of the panel.
+
+    With a `release`, IDs are first taken from the persisted ortholog map of
+    (gene, reference species, release). The remaining targets are resolved with
+    one multi-species homology request, concurrently with the reference lookup,
+    and the results (including "no ortholog") are added to the map, so later
+    panels for the same gene skip the homology endpoint for these species.
+    `progress(stage, message, current, total)` is called as species resolve.
+
+    Returns:
+        dict: Mapping of species name to protein ID (None if not found).
+    """
+    client = client or get_client()
+    reference_species_query = reference_species.lower().replace(" ", "_")
+    known = database.get_orthologs(gene_name, reference_species, release, species_list) if release else {}
+    metrics.increment("ortholog_map_total", len(known), result="hit")
+    metrics.increment("ortholog_map_total", len(species_list) - len(known), result="miss")
+    queries = {species: species.lower().replace(" ", "_")
+               for species in species_list if species not in known and species != reference_species}
+    completed = itertools.count(len(known) + 1)
+
+    def resolve(task):
+        if task is not None:
+            found = {reference_species: fetch_ensembl_protein_id(gene_name, reference_species_query, client=client)}
+        else:
+            by_query = fetch_ensembl_ortholog_protein_ids(gene_name, reference_species_query,
+                                                          list(queries.values()), client=client)
+            found = {species: by_query[query] for species, query in queries.items()}
+        if progress:
+            for species in found:
+                progress("fetching", f"Fetched {species}", next(completed), len(species_list))
+        return found
+
+    # The reference lookup and the homology request (task None) run concurrently.
+    tasks = [reference_species] if reference_species in species_list and reference_species not in known else []
+    if queries:
+        tasks.append(None)
+    resolved = {}
+    for found in client.map(resolve, tasks):
+        resolved.update(found)
+    if release and resolved:
+        database.store_orthologs(gene_name, reference_species, release, resolved)
+    resolved.update(known)
+    return {species: resolved[species] for species in species_list}
+
+def current_release(client=None):
+    """
+    Return the Ensembl release that new lookups are cached under.
+    Uses ENSEMBL_RELEASE if pinned, otherwise the server's current release,
+    remembered in the cache database for ENSEMBL_RELEASE_TTL seconds. If the
+    server cannot be reached, the last known release is used.
+    """
+    if ENSEMBL_RELEASE is not None:
+        return int(ENSEMBL_RELEASE)
+    release = database.get_meta("ensembl_release", max_age=ENSEMBL_RELEASE_TTL)
+    if release is not None:
+        return int(release)
+    try:
+        release = (client or get_client()).release()
+    except requests.RequestException:
+        release = database.get_meta("ensembl_release")
+        if release is None:
+            raise
+        return int(release)
+    database.set_meta("ensembl_release", release)
+    return release
+
+def assemble_fasta(gene_name, species_list, reference_species, release, local=None):
+    """
+    Write a FASTA file for `species_list` purely from `local` (proteins resolved
+    from the local index) and the local sequence cache.
+
+    Returns:
+        tuple: (FASTA path, species that are not cached yet); nothing is written
+               and the path is None if any are missing.
+    """
+    local = local or {}
+    cached = database.get_proteins(gene_name, [s for s in species_list if s not in local], reference_species,
+                                   release)
+    cached.update(local)
+    missing = [species for species in species_list if species not in cached]
+    if missing:
+        return None, missing
+    return write_panel_fasta(gene_name, species_list, cached), []
+
+def write_panel_fasta(gene_name, species_list, proteins):
+    """
+    Write the FASTA file for a panel from a {species: (protein_id, sequence)} mapping.
+    The file is named by the gene and a hash of its contents, so panels of one
+    gene that differ in species or sequences never share (or overwrite) a file.
+
+    Returns:
+        str: Path of the FASTA file under FASTA_DIR.
+
+    Raises:
+        ValueError: If the gene name is not a plain file name.
+    """
+    if gene_name in ("", ".", "..") or any(sep and sep in gene_name for sep in (os.sep, os.altsep, "/")):
+        raise ValueError(f"Gene name {gene_name!r} cannot be used as a file name.")
+    entries = []
+    for species in species_list:
+        protein_id, sequence = proteins[species]
+        if sequence:
+            # Use the species name as the header for clarity
+            species_query = species.lower().replace(" ", "_")
+            entries.append(f">{species_query}\n{sequence}\n")
+        else:
+            logger.warning("No sequence found for %s in %s.", gene_name, species)
+    content = "".join(entries)
+    digest = hashlib.sha256(content.encode("ascii")).hexdigest()
+    fasta_file = os.path.join(FASTA_DIR, f"{gene_name}.{digest[:16]}.fasta")
+    if not os.path.exists(fasta_file):
+        write_file_atomic(fasta_file, content)
+    return fasta_file
+
+def resolve_locally(gene_name, species_list, reference_species):
+    """
+    Resolve as much of the panel as possible from the local Ensembl dump index
+    (see `proteinphonics.local_index`). Returns {} when no index has been imported.
+    """
+    index = get_local_index() if USE_LOCAL_INDEX else None
+    if index is None:
+        return {}
+    local = index.resolve_panel(gene_name, species_list, reference_species)
+    metrics.increment("local_index_total", len(local), result="hit")
+    metrics.increment("local_index_total", len(species_list) - len(local), result="miss")
+    return local
+
+def fetch_sequences(gene_name, species_list, reference_species=None, client=None, release=None, progress=None):
     """
     Fetch protein sequences for a given gene across a list of species.
-    The resulting sequences are stored in a FASTA file located under FASTA_DIR.
-    If the file already exists, fetching is skipped.
+    The resulting sequences are stored in a FASTA file located under FASTA_DIR,
+    named by the gene and a hash of the panel's sequences (see `write_panel_fasta`).
+
+    If a local index of Ensembl dumps has been imported, the panel is resolved
+    from it first; a fully covered panel never touches the network or the
+    request cache. Otherwise sequences are cached per protein in the SQLite
+    database, keyed by (gene, species, reference species, Ensembl release); only
+    species that are neither indexed nor cached hit the network. Protein IDs come
+    from the persisted ortholog map or a single multi-species homology request
+    (see `resolve_protein_ids`) and sequences are pulled with batched requests.
+    `progress(stage, message, current, total)`, if given, receives per-species updates.
     """
     # Ensure the FASTA directory exists
     ensure_directory_exists(FASTA_DIR)
-    
-    fasta_file = os.path.join(FASTA_DIR, f"{gene_name}.fasta")
-    
-    if os.path.exists(fasta_file):
-        print(f"{fasta_file} already exists, skipping fetch.")
-        return fasta_file
-    
+
     if not reference_species:
         reference_species = species_list[0]
     if reference_species not in species_list:
         raise ValueError(f"Reference species '{reference_species}' must be in species_list.")
-    
-    # Standardize species names for API queries
-    reference_species_query = reference_species.lower().replace(" ", "_")
-    
-    with open(fasta_file, "w") as fasta_file_obj:
-        for species in species_list:
-            species_query = species.lower().replace(" ", "_")
-            if species == reference_species:
-                protein_id = fetch_ensembl_protein_id(gene_name, species_query)
-            else:
-                protein_id = fetch_ensembl_ortholog_protein_id(gene_name, reference_species_query, species_query)
-            
-            if protein_id:
-                fasta_data = fetch_ensembl_protein_sequence(protein_id)
-                fasta_lines = fasta_data.strip().split("\n")
-                # Replace header with species name for clarity
-                fasta_lines[0] = f">{species_query}"
-                fasta_entry = "\n".join(fasta_lines)
-                print(f"Writing FASTA entry for {species}:\n{fasta_entry}\n")
-                fasta_file_obj.write(fasta_entry + "\n")
-                fasta_file_obj.flush()
-            else:
-                print(f"Warning: No sequence found for {gene_name} in {species}.")
-            # Pause to avoid hitting rate limits
-            time.sleep(0.5)
-    
-    print(f"FASTA file written to: {fasta_file}")
+
+    local = resolve_locally(gene_name, species_list, reference_species)
+    if len(local) == len(species_list):
+        logger.info("Resolved %s for all %d species from the local index.", gene_name, len(species_list))
+        return write_panel_fasta(gene_name, species_list, local)
+
+    if release is None:
+        release = current_release(client)
+    # Partly indexed: the indexed species join the REST results in the panel, but
+    # are not stored in the request cache, which is keyed by the current release
+    # rather than the release of the dumps.
+    fasta_file, missing = assemble_fasta(gene_name, species_list, reference_species, release, local)
+    metrics.increment("sequence_cache_total", len(species_list) - len(local) - len(missing), result="hit")
+    metrics.increment("sequence_cache_total", len(missing), result="miss")
+    if not missing:
+        logger.info("All sequences for %s are cached; FASTA assembled locally.", gene_name)
+        return fasta_file
+
+    client = client or get_client()
+    logger.info("Fetching %s for %d uncached species", gene_name, len(missing))
+    if progress:
+        progress("fetching", f"Fetching {gene_name} for {len(missing)} species", 0, len(missing))
+    protein_ids = resolve_protein_ids(gene_name, missing, reference_species, client=client, progress=progress,
+                                      release=release)
+    # Proteins already stored for another gene or panel (e.g. paralog symbols) are not fetched again.
+    wanted = sorted({pid for pid in protein_ids.values() if pid})
+    sequences = database.get_protein_sequences(wanted, release)
+    remaining = [pid for pid in wanted if pid not in sequences]
+    metrics.increment("protein_sequence_reuse_total", len(wanted) - len(remaining))
+    if remaining:
+        sequences.update(fetch_ensembl_protein_sequences(remaining, client=client))
+
+    entries = {}
+    for species, protein_id in protein_ids.items():
+        if protein_id is None:
+            entries[species] = (None, None)
+        elif protein_id in sequences:
+            entries[species] = (protein_id, sequences[protein_id])
+        else:
+            logger.warning("Sequence for %s (%s) was not returned; it will be retried.", protein_id, species)
+    database.store_proteins(gene_name, reference_species, release, entries)
+
+    fasta_file, missing = assemble_fasta(gene_name, species_list, reference_species, release, local)
+    if missing:
+        raise RuntimeError(f"Could not fetch {gene_name} sequences for: {', '.join(missing)}")
+
+    logger.info("FASTA file written to: %s", fasta_file)
     return fasta_file
@@ -0,0 +1,227 @@
+# proteinphonics/jobs.py
+"""
+Background job execution for the web UI.
+
+A process-wide JobExecutor owns a bounded worker pool. Submitted work receives
+a `progress` callback that records per-stage events (fetching species N/M,
+aligning, rendering) on the Job and doubles as a cancellation checkpoint, so
+the UI can poll status without blocking and cancel a running job.
+"""
+import itertools
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from config import JOB_WORKERS, JOB_RETENTION_SECONDS, JOB_MAX_RETAINED
+
+ProgressEvent = namedtuple("ProgressEvent", ["stage", "message", "current", "total", "timestamp"])
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+FINISHED_STATES = (DONE, FAILED, CANCELLED)
+
+
+class JobCancelled(Exception):
+    """Raised at a progress checkpoint when the job has been cancelled."""
+
+
+class Job:
+    """
+    A unit of work submitted to a JobExecutor.
+
+    Attributes:
+        id (str): Job identifier.
+        status (str): One of queued, running, done, failed, cancelled.
+        events (list): ProgressEvents reported so far.
+        result: The return value once the job is done.
+        error (BaseException): The exception if the job failed.
+    """
+
+    def __init__(self, job_id):
+        self.id = job_id
+        self.status = QUEUED
+        self.events = []
+        self.result = None
+        self.error = None
+        self.submitted_at = time.time()
+        self.finished_at = None
+        self._cancel = threading.Event()
+        self._finished = threading.Event()
+        self._lock = threading.Lock()
+
+    def report(self, stage, message, current=None, total=None):
+        """
+        Record a progress event. Raises JobCancelled if cancellation was requested.
+        """
+        if self._cancel.is_set():
+            raise JobCancelled(f"Job {self.id} was cancelled.")
+        with self._lock:
+            self.events.append(ProgressEvent(stage, message, current, total, time.time()))
+
+    def cancel(self):
+        """
+        Request cancellation; the job stops at its next progress checkpoint.
+        """
+        self._cancel.set()
+
+    @property
+    def cancelled(self):
+        return self._cancel.is_set()
+
+    @property
+    def latest(self):
+        """The most recent ProgressEvent, or None."""
+        with self._lock:
+            return self.events[-1] if self.events else None
+
+    def events_since(self, index):
+        """Return events recorded after the first `index` events."""
+        with self._lock:
+            return self.events[index:]
+
+    def done(self):
+        return self.status in FINISHED_STATES
+
+    def wait(self, timeout=None):
+        """Block until the job finishes; returns True if it did."""
+        return self._finished.wait(timeout)
+
+    def _run(self, fn, args, kwargs):
+        if self._cancel.is_set():
+            self._finish(CANCELLED)
+            return
+        self.status = RUNNING
+        try:
+            self.result = fn(*args, progress=self.report, **kwargs)
+        except JobCancelled as exc:
+            self.error = exc
+            self._finish(CANCELLED)
+        except BaseException as exc:
+            self.error = exc
+            self._finish(FAILED)
+        else:
+            self._finish(DONE)
+
+    def _finish(self, status):
+        self.finished_at = time.time()
+        self.status = status
+        self._finished.set()
+
+
+class JobExecutor:
+    """
+    Bounded worker pool shared by all sessions of the process.
+
+    Parameters:
+        max_workers (int): Number of jobs that may run at once; the rest queue.
+        retention (float): Seconds to keep finished jobs for polling.
+        max_retained (int): Upper bound on remembered jobs.
+    """
+
+    def __init__(self, max_workers=JOB_WORKERS, retention=JOB_RETENTION_SECONDS, max_retained=JOB_MAX_RETAINED):
+        self.retention = retention
+        self.max_retained = max_retained
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="job")
+        self._jobs = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def submit(self, fn, *args, **kwargs):
+        """
+        Queue `fn(*args, progress=job.report, **kwargs)` on the pool.
+
+        Returns:
+            Job: The handle to poll or cancel.
+        """
+        with self._lock:
+            self._prune()
+            job = Job(f"job-{next(self._ids)}")
+            self._jobs[job.id] = job
+        self._pool.submit(job._run, fn, args, kwargs)
+        return job
+
+    def get(self, job_id):
+        """Return the Job with this ID, or None if unknown or expired."""
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def cancel(self, job_id):
+        job = self.get(job_id)
+        if job is not None:
+            job.cancel()
+        return job
+
+    def pending(self):
+        """Number of jobs queued or running."""
+        with self._lock:
+            return sum(1 for job in self._jobs.values() if not job.done())
+
+    def shutdown(self, wait=True):
+        with self._lock:
+            for job in self._jobs.values():
+                job.cancel()
+        self._pool.shutdown(wait=wait)
+
+    def _prune(self):
+        now = time.time()
+        expired = [job_id for job_id, job in self._jobs.items()
+                   if job.done() and now - job.finished_at > self.retention]
+        for job_id in expired:
+            del self._jobs[job_id]
+        if len(self._jobs) >= self.max_retained:
+            finished = sorted((job for job in self._jobs.values() if job.done()), key=lambda job: job.finished_at)
+            for job in finished[:len(self._jobs) - self.max_retained + 1]:
+                del self._jobs[job.id]
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+def get_executor():
+    """Return the process-wide JobExecutor, creating it on first use."""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = JobExecutor()
+        return _executor
+
+def _music_job(gene_name, species_list, reference_species, audio_format=None, progress=None, **kwargs):
+    from proteinphonics.results import generate_music
+    music = generate_music(gene_name, species_list, reference_species, progress=progress, **kwargs)
+    if audio_format:
+        from proteinphonics.audio import render_audio
+        music = music._replace(audio_path=render_audio(music.midi_bytes, audio_format, progress=progress))
+    return music
+
+def submit_music(gene_name, species_list, reference_species, audio_format=None, **kwargs):
+    """
+    Submit a memoized music generation (see `proteinphonics.results.generate_music`),
+    optionally followed by an audio render in `audio_format` ("wav" or "ogg").
+
+    Returns:
+        Job: Its result is a GeneratedMusic tuple.
+    """
+    return get_executor().submit(_music_job, gene_name, species_list, reference_species,
+                                 audio_format=audio_format, **kwargs)
+
+def _alignment_job(gene_name, species_list, reference_species, progress=None):
+    from proteinphonics.features import load_features
+    from proteinphonics.results import cached_alignment
+    alignment_file = cached_alignment(gene_name, species_list, reference_species, progress=progress)
+    # Build (or load) the feature index now so the first streamed chunk is cheap.
+    load_features(alignment_file)
+    return alignment_file
+
+def submit_alignment(gene_name, species_list, reference_species):
+    """
+    Submit only the memoized fetch + align stages, for streamed playback
+    (see `proteinphonics.streaming`).
+
+    Returns:
+        Job: Its result is the alignment file path.
+    """
+    return get_executor().submit(_alignment_job, gene_name, species_list, reference_species)
@@ -0,0 +1,348 @@
+# proteinphonics/local_index.py
+"""
+Local proteome / ortholog index built from Ensembl bulk dumps.
+
+`import_peptides` scans an Ensembl peptide FASTA (`*.pep.all.fa[.gz]`) once and
+records, for every protein, the byte offset and length of its sequence in the
+file together with its gene ID and symbol. `import_homologies` loads a Compara
+homology TSV (`*.homologies.tsv[.gz]`) into a gene -> ortholog table. Both
+live in a separate SQLite file (LOCAL_INDEX_PATH), so the bulk data never
+bloats the request cache.
+
+Lookups are indexed SQL queries followed by a single seek + read per sequence;
+no FASTA file is ever parsed at query time. Gzipped FASTA files are
+decompressed once into LOCAL_INDEX_DIR during import, since offsets need a
+seekable file.
+"""
+import csv
+import gzip
+import logging
+import os
+import shutil
+import sqlite3
+import threading
+import time
+from contextlib import closing
+
+from config import LOCAL_INDEX_DIR, LOCAL_INDEX_PATH
+from proteinphonics.utils import ensure_directory_exists
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    file_id INTEGER PRIMARY KEY,
+    path TEXT NOT NULL UNIQUE,
+    kind TEXT NOT NULL,
+    species TEXT,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    imported_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS peptides (
+    protein_id TEXT PRIMARY KEY,
+    species TEXT NOT NULL,
+    gene_id TEXT,
+    symbol TEXT,
+    file_id INTEGER NOT NULL REFERENCES files(file_id),
+    offset INTEGER NOT NULL,
+    length INTEGER NOT NULL,
+    residues INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS peptides_by_symbol ON peptides (species, symbol COLLATE NOCASE);
+CREATE INDEX IF NOT EXISTS peptides_by_gene ON peptides (gene_id);
+CREATE TABLE IF NOT EXISTS orthologs (
+    gene_id TEXT NOT NULL,
+    protein_id TEXT,
+    species TEXT NOT NULL,
+    target_species TEXT NOT NULL,
+    target_gene_id TEXT NOT NULL,
+    target_protein_id TEXT NOT NULL,
+    homology_type TEXT NOT NULL,
+    identity REAL,
+    file_id INTEGER NOT NULL REFERENCES files(file_id),
+    PRIMARY KEY (gene_id, target_species, target_protein_id)
+);
+"""
+
+BATCH_SIZE = 10_000
+HOMOLOGY_COLUMNS = ("gene_stable_id", "protein_stable_id", "species", "homology_type",
+                    "homology_gene_stable_id", "homology_protein_stable_id", "homology_species")
+
+
+def unversioned(stable_id):
+    """Strip the version suffix from an Ensembl stable ID (ENSP0001.4 -> ENSP0001)."""
+    return stable_id.split(".", 1)[0] if stable_id else stable_id
+
+def species_from_filename(path):
+    """Ensembl dump names start with the species: Homo_sapiens.GRCh38.pep.all.fa -> homo_sapiens."""
+    return os.path.basename(path).split(".", 1)[0].lower()
+
+def _open_text(path):
+    return gzip.open(path, "rt", newline="") if path.endswith(".gz") else open(path, newline="")
+
+def _header_fields(header):
+    """
+    Parse an Ensembl peptide header:
+    `ENSP... pep chromosome:... gene:ENSG... transcript:ENST... gene_symbol:HOXA5 ...`
+    """
+    parts = header.split()
+    fields = {"id": parts[0]}
+    for part in parts[1:]:
+        key, sep, value = part.partition(":")
+        if sep and key in ("gene", "transcript", "gene_symbol"):
+            fields[key] = value
+    return fields
+
+
+class LocalIndex:
+    """
+    Read-side handle on the local index. Cheap to create; every query opens
+    its own connection so instances can be shared across threads.
+    """
+
+    def __init__(self, path=LOCAL_INDEX_PATH):
+        self.path = path
+        self._file_paths = {}
+
+    def connect(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            ensure_directory_exists(directory)
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(SCHEMA)
+        return conn
+
+    def _session(self, conn=None):
+        """Use the caller's connection if given, otherwise open (and later close) one."""
+        return _borrowed(conn) if conn is not None else closing(self.connect())
+
+    def _file_path(self, conn, file_id):
+        if file_id not in self._file_paths:
+            self._file_paths[file_id] = conn.execute("SELECT path FROM files WHERE file_id = ?",
+                                                     (file_id,)).fetchone()[0]
+        return self._file_paths[file_id]
+
+    def stats(self):
+        """Row counts per table, for the import command's summary."""
+        with closing(self.connect()) as conn:
+            return {table: conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+                    for table in ("files", "peptides", "orthologs")}
+
+    # Queries --------------------------------------------------------------
+
+    def protein_for_symbol(self, species, symbol, conn=None):
+        """
+        Representative protein of a gene symbol: the longest peptide of the gene
+        (ties broken by protein ID), or None if the symbol is not indexed.
+        """
+        query = """
+            SELECT protein_id FROM peptides
+            WHERE species = ? AND symbol = ? COLLATE NOCASE
+            ORDER BY residues DESC, protein_id LIMIT 1
+        """
+        with self._session(conn) as conn:
+            row = conn.execute(query, (species, symbol)).fetchone()
+        return row[0] if row else None
+
+    def ortholog(self, reference_species, symbol, target_species, conn=None):
+        """
+        Best ortholog protein of `symbol` in `target_species`: one-to-one orthologs
+        first, then the lowest protein ID. This is the REST ranking
+        (`fetch._ortholog_rank`); the condensed homology format has no identity.
+        """
+        query = """
+            SELECT target_protein_id FROM orthologs
+            WHERE gene_id IN (SELECT gene_id FROM peptides WHERE species = ? AND symbol = ? COLLATE NOCASE)
+              AND target_species = ?
+            ORDER BY homology_type = 'ortholog_one2one' DESC, target_protein_id
+            LIMIT 1
+        """
+        with self._session(conn) as conn:
+            row = conn.execute(query, (reference_species, symbol, target_species)).fetchone()
+        return row[0] if row else None
+
+    def sequences(self, protein_ids, conn=None):
+        """
+        Read sequences by protein ID with one seek + read each, grouped per file
+        in offset order. IDs that are not indexed are omitted.
+
+        Returns:
+            dict: Mapping of protein ID to sequence.
+        """
+        ids = [unversioned(pid) for pid in dict.fromkeys(protein_ids)]
+        if not ids:
+            return {}
+        with self._session(conn) as conn:
+            placeholders = ",".join("?" for _ in ids)
+            rows = conn.execute(f"SELECT protein_id, file_id, offset, length FROM peptides "
+                                f"WHERE protein_id IN ({placeholders}) ORDER BY file_id, offset", ids).fetchall()
+            paths = {file_id: self._file_path(conn, file_id) for _, file_id, _, _ in rows}
+        results = {}
+        for file_id in dict.fromkeys(file_id for _, file_id, _, _ in rows):
+            with open(paths[file_id], "rb") as f:
+                for protein_id, row_file, offset, length in rows:
+                    if row_file == file_id:
+                        f.seek(offset)
+                        results[protein_id] = f.read(length).replace(b"\n", b"").replace(b"\r", b"").decode("ascii")
+        return results
+
+    def resolve_panel(self, gene_name, species_list, reference_species):
+        """
+        Resolve a gene across a species panel entirely from the index.
+
+        Parameters:
+            species_list (list): Species names as used by the app ("Homo sapiens").
+            reference_species (str): Species whose symbol anchors the ortholog lookups.
+
+        Returns:
+            dict: Mapping of species to (protein_id, sequence) for every species the
+                  index can answer; the rest are left for the REST fallback.
+        """
+        reference_query = reference_species.lower().replace(" ", "_")
+        with closing(self.connect()) as conn:
+            protein_ids = {}
+            for species in species_list:
+                species_query = species.lower().replace(" ", "_")
+                if species == reference_species:
+                    protein_id = self.protein_for_symbol(species_query, gene_name, conn=conn)
+                else:
+                    protein_id = self.ortholog(reference_query, gene_name, species_query, conn=conn)
+                if protein_id:
+                    protein_ids[species] = protein_id
+            sequences = self.sequences(protein_ids.values(), conn=conn)
+        return {species: (protein_id, sequences[protein_id])
+                for species, protein_id in protein_ids.items() if protein_id in sequences}
+
+    # Import ---------------------------------------------------------------
+
+    def _register_file(self, conn, path, kind, species):
+        """Insert (or replace) a file row and drop rows previously imported from it."""
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        row = conn.execute("SELECT file_id FROM files WHERE path = ?", (path,)).fetchone()
+        if row:
+            conn.execute("DELETE FROM peptides WHERE file_id = ?", row)
+            conn.execute("DELETE FROM orthologs WHERE file_id = ?", row)
+            conn.execute("DELETE FROM files WHERE file_id = ?", row)
+        cursor = conn.execute(
+            "INSERT INTO files (path, kind, species, size, mtime_ns, imported_at) VALUES (?, ?, ?, ?, ?, ?)",
+            (path, kind, species, stat.st_size, stat.st_mtime_ns, time.time()))
+        self._file_paths.pop(cursor.lastrowid, None)
+        return cursor.lastrowid
+
+    def import_peptides(self, path, species=None):
+        """
+        Index an Ensembl peptide FASTA file (decompressing it first if gzipped).
+
+        Returns:
+            int: Number of proteins indexed.
+        """
+        species = species or species_from_filename(path)
+        if path.endswith(".gz"):
+            ensure_directory_exists(LOCAL_INDEX_DIR)
+            target = os.path.join(LOCAL_INDEX_DIR, os.path.basename(path)[:-len(".gz")])
+            logger.info("Decompressing %s to %s", path, target)
+            with gzip.open(path, "rb") as src, open(target + ".tmp", "wb") as dst:
+                shutil.copyfileobj(src, dst, 1 << 20)
+            os.replace(target + ".tmp", target)
+            path = target
+
+        count = 0
+        with closing(self.connect()) as conn, conn:
+            file_id = self._register_file(conn, path, "peptides", species)
+            rows = []
+            current = None
+
+            def finish(end):
+                start, fields, residues = current
+                rows.append((unversioned(fields["id"]), species, unversioned(fields.get("gene")),
+                             fields.get("gene_symbol"), file_id, start, end - start, residues))
+
+            offset = 0
+            with open(path, "rb") as f:
+                for line in f:
+                    if line.startswith(b">"):
+                        if current is not None:
+                            finish(offset)
+                            count += 1
+                        current = [offset + len(line), _header_fields(line[1:].decode("ascii", "replace")), 0]
+                        if len(rows) >= BATCH_SIZE:
+                            conn.executemany("INSERT OR REPLACE INTO peptides VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows)
+                            rows.clear()
+                    elif current is not None:
+                        current[2] += len(line.rstrip(b"\r\n"))
+                    offset += len(line)
+            if current is not None:
+                finish(offset)
+                count += 1
+            conn.executemany("INSERT OR REPLACE INTO peptides VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows)
+        logger.info("Indexed %d %s proteins from %s", count, species, path)
+        return count
+
+    def import_homologies(self, path, orthologs_only=True):
+        """
+        Load a Compara homology TSV (gene_stable_id, protein_stable_id, species,
+        identity, homology_type, homology_gene_stable_id, homology_protein_stable_id,
+        homology_species, ...).
+
+        Returns:
+            int: Number of homology rows stored.
+        """
+        count = 0
+        with closing(self.connect()) as conn, conn, _open_text(path) as f:
+            reader = csv.DictReader(f, delimiter="\t")
+            missing = [column for column in HOMOLOGY_COLUMNS if column not in (reader.fieldnames or [])]
+            if missing:
+                raise ValueError(f"{path} is not a Compara homology TSV (missing columns: {', '.join(missing)}).")
+            file_id = self._register_file(conn, path, "homologies", None)
+            rows = []
+            for record in reader:
+                homology_type = record["homology_type"]
+                if orthologs_only and not homology_type.startswith("ortholog"):
+                    continue
+                identity = record.get("identity")
+                rows.append((unversioned(record["gene_stable_id"]), unversioned(record["protein_stable_id"]),
+                             record["species"], record["homology_species"],
+                             unversioned(record["homology_gene_stable_id"]),
+                             unversioned(record["homology_protein_stable_id"]), homology_type,
+                             float(identity) if identity not in (None, "", "NULL") else None, file_id))
+                if len(rows) >= BATCH_SIZE:
+                    conn.executemany("INSERT OR REPLACE INTO orthologs VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+                    count += len(rows)
+                    rows.clear()
+            conn.executemany("INSERT OR REPLACE INTO orthologs VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+            count += len(rows)
+        logger.info("Loaded %d homologies from %s", count, path)
+        return count
+
+
+class _borrowed:
+    """Context manager that hands back a caller-owned connection without closing it."""
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        return self.conn
+
+    def __exit__(self, *exc):
+        return False
+
+
+_default_index = None
+_default_index_lock = threading.Lock()
+
+def get_local_index(path=LOCAL_INDEX_PATH):
+    """
+    Return the shared LocalIndex if an index has been imported, else None
+    (a missing index file costs one stat call).
+    """
+    global _default_index
+    if not os.path.exists(path):
+        return None
+    with _default_index_lock:
+        if _default_index is None or _default_index.path != path:
+            _default_index = LocalIndex(path)
+        return _default_index
@@ -0,0 +1,249 @@
+# proteinphonics/metrics.py
+"""
+In-process instrumentation for the generation pipeline.
+
+A process-wide registry collects:
+
+    counters    - monotonically increasing totals (HTTP requests, cache hits, notes)
+    summaries   - count/sum/min/max of observed values (stage wall/CPU seconds,
+                  HTTP latency per Ensembl endpoint)
+    samples     - a bounded window of recent structured records (MUSCLE runtime
+                  versus sequence count and length)
+
+Every series is identified by a name and a set of labels. `snapshot()` returns
+the whole registry as JSON-serializable data and `prometheus_text()` renders it
+in the Prometheus text exposition format; `serve_metrics()` exposes both over
+HTTP on /metrics and /metrics.json. `profile_run()` is an opt-in cProfile hook
+for a single pipeline run.
+"""
+import contextlib
+import cProfile
+import itertools
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from config import METRICS_SAMPLE_WINDOW, PROFILE_DIR
+
+logger = logging.getLogger(__name__)
+
+PREFIX = "proteinphonics_"
+
+
+def _label_key(labels):
+    return tuple(sorted((str(k), str(v)) for k, v in labels.items()))
+
+
+class MetricsRegistry:
+    """
+    Thread-safe store of counters, summaries and sample windows.
+
+    Parameters:
+        sample_window (int): Records kept per sample series.
+    """
+
+    def __init__(self, sample_window=METRICS_SAMPLE_WINDOW):
+        self.sample_window = sample_window
+        self._counters = {}
+        self._summaries = {}
+        self._samples = {}
+        self._lock = threading.Lock()
+
+    def increment(self, name, value=1, **labels):
+        """Add `value` to the counter `name{labels}`."""
+        key = (name, _label_key(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, value, **labels):
+        """Record one observation of `name{labels}` (count, sum, min, max)."""
+        key = (name, _label_key(labels))
+        with self._lock:
+            summary = self._summaries.get(key)
+            if summary is None:
+                self._summaries[key] = [1, value, value, value]
+            else:
+                summary[0] += 1
+                summary[1] += value
+                summary[2] = min(summary[2], value)
+                summary[3] = max(summary[3], value)
+
+    def sample(self, name, **fields):
+        """Append a structured record to the bounded sample window `name`."""
+        with self._lock:
+            window = self._samples.get(name)
+            if window is None:
+                window = self._samples[name] = deque(maxlen=self.sample_window)
+            window.append(dict(fields, timestamp=time.time()))
+
+    @contextlib.contextmanager
+    def stage(self, name, **labels):
+        """
+        Time a pipeline stage, recording wall and CPU seconds (CPU time is for the
+        calling thread; work done in other processes is not included).
+        """
+        wall, cpu = time.perf_counter(), time.thread_time()
+        status = "ok"
+        try:
+            yield
+        except BaseException:
+            status = "error"
+            raise
+        finally:
+            self.observe("stage_wall_seconds", time.perf_counter() - wall, stage=name, **labels)
+            self.observe("stage_cpu_seconds", time.thread_time() - cpu, stage=name, **labels)
+            self.increment("stage_runs_total", stage=name, status=status, **labels)
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._summaries.clear()
+            self._samples.clear()
+
+    def snapshot(self):
+        """
+        Return the registry as JSON-serializable data.
+        """
+        with self._lock:
+            counters = [{"name": name, "labels": dict(labels), "value": value}
+                        for (name, labels), value in sorted(self._counters.items())]
+            summaries = [{"name": name, "labels": dict(labels), "count": s[0], "sum": s[1],
+                          "min": s[2], "max": s[3]}
+                         for (name, labels), s in sorted(self._summaries.items())]
+            samples = {name: list(window) for name, window in sorted(self._samples.items())}
+        return {"timestamp": time.time(), "counters": counters, "summaries": summaries, "samples": samples}
+
+    def prometheus_text(self):
+        """
+        Render counters and summaries in the Prometheus text exposition format.
+        Sample windows are only included in the JSON snapshot.
+        """
+        snapshot = self.snapshot()
+        lines = []
+        declared = set()
+
+        def declare(name, kind):
+            if name not in declared:
+                declared.add(name)
+                lines.append(f"# TYPE {name} {kind}")
+
+        for counter in snapshot["counters"]:
+            name = PREFIX + counter["name"]
+            declare(name, "counter")
+            lines.append(f"{name}{_format_labels(counter['labels'])} {counter['value']}")
+        families = {}
+        for summary in snapshot["summaries"]:
+            families.setdefault(PREFIX + summary["name"], []).append(summary)
+        # Each family's lines must be contiguous, so min/max gauges follow the summary.
+        for name, summaries in families.items():
+            declare(name, "summary")
+            for summary in summaries:
+                labels = _format_labels(summary["labels"])
+                lines.append(f"{name}_count{labels} {summary['count']}")
+                lines.append(f"{name}_sum{labels} {summary['sum']:.6f}")
+            for suffix in ("min", "max"):
+                declare(f"{name}_{suffix}", "gauge")
+                lines.extend(f"{name}_{suffix}{_format_labels(summary['labels'])} {summary[suffix]:.6f}"
+                             for summary in summaries)
+        return "\n".join(lines) + "\n"
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for v in labels.values())
+    return "{" + ",".join(f'{k}="{v}"' for k, v in zip(labels, escaped)) + "}"
+
+
+registry = MetricsRegistry()
+
+# Module-level shortcuts onto the process-wide registry.
+increment = registry.increment
+observe = registry.observe
+sample = registry.sample
+stage = registry.stage
+snapshot = registry.snapshot
+prometheus_text = registry.prometheus_text
+
+
+_profile_lock = threading.Lock()
+_profile_counter = itertools.count(1)
+
+
+@contextlib.contextmanager
+def profile_run(name, enabled=True, directory=PROFILE_DIR):
+    """
+    Opt-in cProfile hook for one pipeline run. With `enabled`, the block is
+    profiled and the stats are written to `{directory}/{name}-{timestamp}-{pid}-{n}.prof`
+    (open with `python -m pstats` or snakeviz). Yields the output path, or None.
+
+    Only one profiler can be active per process (Python 3.12+ raises otherwise),
+    so a run that starts while another is being profiled runs unprofiled.
+    """
+    if not enabled:
+        yield None
+        return
+    if not _profile_lock.acquire(blocking=False):
+        logger.warning("Another run is being profiled; %s runs without profiling.", name)
+        yield None
+        return
+    try:
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError as exc:  # A profiler outside profile_run is active
+            logger.warning("Could not profile %s: %s", name, exc)
+            yield None
+            return
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"{name}-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-"
+                                       f"{next(_profile_counter)}.prof")
+        try:
+            yield path
+        finally:
+            profiler.disable()
+            profiler.dump_stats(path)
+            logger.info("Profile for %s written to %s", name, path)
+    finally:
+        _profile_lock.release()
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path == "/metrics":
+            body, content_type = prometheus_text().encode("utf-8"), "text/plain; version=0.0.4"
+        elif self.path == "/metrics.json":
+            body, content_type = json.dumps(snapshot()).encode("utf-8"), "application/json"
+        else:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.debug("metrics %s - " + format, self.address_string(), *args)
+
+
+_server = None
+_server_lock = threading.Lock()
+
+def serve_metrics(port, host="127.0.0.1"):
+    """
+    Serve /metrics (Prometheus text) and /metrics.json from a daemon thread.
+    Calling it again returns the already-running server.
+    """
+    global _server
+    with _server_lock:
+        if _server is None:
+            _server = ThreadingHTTPServer((host, port), _MetricsHandler)
+            threading.Thread(target=_server.serve_forever, name="metrics", daemon=True).start()
+            logger.info("Serving metrics on http://%s:%d/metrics", host, _server.server_port)
+        return _server
+
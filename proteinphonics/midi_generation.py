@@ -1,75 +1,325 @@
 # proteinphonics/midi_generation.py
-import os
-import pretty_midi
-from proteinphonics.fetch import fetch_sequences
-from proteinphonics.alignment import perform_alignment, read_alignment
-from config import AA_PITCH_MAP, MIDIS_DIR
+import logging
+import numpy as np
+from proteinphonics import metrics
+from proteinphonics.alignment_store import StoredAlignment, residue_window
+from proteinphonics.smf import NoteTrack, channel_for_track, encode_midi, seconds_to_ticks
+from proteinphonics.utils import reference_record, write_file_atomic
+from config import AA_PITCH_MAP, PROFILE_RUNS
 
-def alignment_to_midi(alignment, aa_pitch_map, species_instrument_map, midi_filename, tempo_bpm=120, time_step=0.5):
+logger = logging.getLogger(__name__)
+
+GAP = ord('-')
+DEFAULT_PITCH = 60     # Middle C for residues missing from the pitch map
+DEFAULT_VELOCITY = 100
+CONSERVED_VELOCITY = 127  # Compact mode: a fully conserved column collapsed into one voice
+
+def alignment_to_matrix(alignment):
+    """
+    Convert an alignment to a row-major uint8 character matrix.
+
+    Parameters:
+        alignment: A StoredAlignment, a Biopython alignment object, or any
+                   iterable of records with `.id` and `.seq`.
+
+    Returns:
+        tuple: (list of record IDs, numpy uint8 array of shape (rows, columns)).
+    """
+    if isinstance(alignment, StoredAlignment):
+        # Already a (memory-mapped) matrix; nothing to copy.
+        return alignment.ids, alignment.matrix
+    records = list(alignment)
+    ids = [record.id for record in records]
+    data = "".join(str(record.seq) for record in records).encode("ascii")
+    matrix = np.frombuffer(data, dtype=np.uint8).reshape(len(records), -1)
+    return ids, matrix
+
+def select_window(alignment, ids, matrix, columns=None, residues=None, reference=None):
+    """
+    Restrict an alignment matrix to a region of interest.
+
+    Parameters:
+        columns (tuple): Half-open, 0-based column window (start, stop).
+        residues (tuple): 1-based inclusive residue range (first, last) in the
+                          coordinates of the `reference` record (default: first row).
+        reference (str): Record ID the residue range refers to.
+
+    Returns:
+        tuple: (column start, column stop, sub-matrix). For a StoredAlignment the
+               sub-matrix is a memory-mapped view; nothing outside it is read.
+    """
+    if columns is not None and residues is not None:
+        raise ValueError("Pass either a column window or a residue range, not both.")
+    total = matrix.shape[1]
+    if residues is not None:
+        reference = reference or ids[0]
+        if reference not in ids:
+            raise ValueError(f"Reference '{reference}' is not in the alignment.")
+        if isinstance(alignment, StoredAlignment):
+            start, stop = alignment.residue_window(reference, *residues)
+        else:
+            positions = np.flatnonzero(matrix[ids.index(reference)] != GAP)
+            start, stop = residue_window(positions, *residues, reference)
+    elif columns is not None:
+        start, stop = columns
+        start, stop = max(int(start), 0), min(int(stop), total)
+        if start >= stop:
+            raise ValueError(f"Empty column window {columns} for an alignment of {total} columns.")
+    else:
+        return 0, total, matrix
+    return start, stop, matrix[:, start:stop]
+
+def pitch_lookup_table(aa_pitch_map, default=DEFAULT_PITCH):
+    """
+    Build a 256-entry table mapping residue byte values to MIDI pitches.
+    """
+    table = np.full(256, default, dtype=np.uint8)
+    for aa, pitch in aa_pitch_map.items():
+        table[ord(aa)] = pitch
+    return table
+
+def species_name(record_id):
+    """
+    Convert a record ID back to a nicely formatted species name.
+    """
+    return record_id.replace('_', ' ').title()
+
+def conserved_columns(matrix):
+    """
+    Return a boolean mask of the columns where every row has the same residue
+    (no gaps). Alignments with fewer than two rows have no conserved columns.
+    """
+    if matrix.shape[0] < 2:
+        return np.zeros(matrix.shape[1], dtype=bool)
+    first = np.asarray(matrix[0])
+    return (first != GAP) & (np.asarray(matrix) == first).all(axis=0)
+
+def merge_runs(positions, pitches, velocities):
+    """
+    Merge notes in adjacent columns with the same pitch and velocity into one
+    sustained note.
+
+    Returns:
+        tuple: (first column, last column + 1, pitches, velocities) of the merged notes.
+    """
+    if not len(positions):
+        return positions, positions + 1, pitches, velocities
+    breaks = (np.diff(positions) != 1) | (np.diff(pitches) != 0) | (np.diff(velocities) != 0)
+    firsts = np.flatnonzero(np.concatenate(([True], breaks)))
+    lasts = np.append(firsts[1:] - 1, len(positions) - 1)
+    return positions[firsts], positions[lasts] + 1, pitches[firsts], velocities[firsts]
+
+def matrix_to_tracks(ids, matrix, aa_pitch_map, species_instrument_map, tempo_bpm=120, time_step=0.5,
+                     compact=False):
+    """
+    Turn an alignment matrix into one NoteTrack per row.
+    Every non-gap residue in column i becomes a note from i * time_step to
+    (i + 1) * time_step; gaps are rests.
+
+    With `compact`, fully conserved columns are played once, by the first row,
+    at CONSERVED_VELOCITY (the other rows rest), and runs of the same pitch in
+    adjacent columns of a row become one sustained note.
+    """
+    table = pitch_lookup_table(aa_pitch_map)
+    columns = matrix.shape[1]
+    # Tick of every column boundary, computed once and shared by all rows.
+    boundaries = seconds_to_ticks(np.arange(columns + 1) * time_step, tempo_bpm)
+    conserved = conserved_columns(matrix) if compact else None
+    tracks = []
+    for n, (record_id, row) in enumerate(zip(ids, matrix)):
+        species = species_name(record_id)
+        # Default to program 0 (Grand Piano) if the species is not mapped.
+        program = species_instrument_map.get(species, 0)
+        sounding = row != GAP
+        if compact and n > 0:
+            sounding &= ~conserved
+        positions = np.flatnonzero(sounding)
+        pitches = table[row[positions]]
+        velocities = np.full(len(positions), DEFAULT_VELOCITY, dtype=np.uint8)
+        stops = positions + 1
+        if compact:
+            if n == 0:
+                velocities[conserved[positions]] = CONSERVED_VELOCITY
+            positions, stops, pitches, velocities = merge_runs(positions, pitches, velocities)
+        tracks.append(NoteTrack(
+            name=species,
+            program=program,
+            channel=channel_for_track(n),
+            starts=boundaries[positions],
+            ends=boundaries[stops],
+            pitches=pitches,
+            velocities=velocities,
+        ))
+    return tracks
+
+def alignment_to_midi(alignment, aa_pitch_map, species_instrument_map, midi_filename=None, tempo_bpm=120, time_step=0.5,
+                      columns=None, residues=None, reference=None, compact=False, reduce=False, sections=None):
     """
     Convert the alignment to a MIDI file.
-    
+    The alignment is processed as a uint8 matrix and encoded straight to
+    Standard MIDI File bytes, with the same musical content as the pretty_midi path.
+
     Parameters:
-        alignment: A Biopython alignment object.
+        alignment: A StoredAlignment or Biopython alignment object.
         aa_pitch_map: Dictionary mapping amino acids to MIDI pitches.
         species_instrument_map: Dictionary mapping species to MIDI program numbers.
-        midi_filename (str): Path to save the generated MIDI file.
+        midi_filename (str): Path to save the generated MIDI file (None to keep it in memory only).
         tempo_bpm (int): Tempo in beats per minute.
         time_step (float): Duration per note in seconds.
+        columns (tuple): Optional 0-based, half-open column window (start, stop) to render.
+        residues (tuple): Optional 1-based inclusive residue range (first, last) in
+                          `reference` coordinates to render instead.
+        reference (str): Record ID for `residues` (defaults to the first record).
+        compact (bool): Merge repeated residues into sustained notes and play fully
+                        conserved columns once, louder (see `matrix_to_tracks`).
+        reduce (bool): Render consensus, runner-up and gap-density voices instead of
+                       one track per species (see `proteinphonics.reduction`).
+        sections (dict): Clade sections for `reduce`: {name: {"program": int, "species": [names]}}.
+
+    Returns:
+        bytes: The MIDI file contents. A window starts playing at time 0.
+    """
+    ids, matrix = alignment_to_matrix(alignment)
+    _, _, matrix = select_window(alignment, ids, matrix, columns, residues, reference)
+    if reduce:
+        from proteinphonics.reduction import reduced_tracks
+        tracks = reduced_tracks(ids, matrix, aa_pitch_map, sections, tempo_bpm, time_step, compact)
+    else:
+        tracks = matrix_to_tracks(ids, matrix, aa_pitch_map, species_instrument_map, tempo_bpm, time_step, compact)
+    return finish_midi(tracks, tempo_bpm, midi_filename)
+
+def finish_midi(tracks, tempo_bpm, midi_filename=None):
+    """
+    Encode NoteTracks, record render metrics and optionally write the file.
+
+    Returns:
+        bytes: The MIDI file contents.
     """
+    midi_bytes = encode_midi(tracks, tempo_bpm)
+    notes = sum(len(track.starts) for track in tracks)
+    metrics.increment("midi_renders_total")
+    metrics.increment("midi_notes_total", notes)
+    metrics.increment("midi_events_total", 2 * notes)  # One note-on and one note-off per note
+    metrics.observe("midi_bytes", len(midi_bytes))
+    if midi_filename:
+        write_file_atomic(midi_filename, midi_bytes)
+        logger.info("MIDI file written to: %s", midi_filename)
+    return midi_bytes
+
+def alignment_to_pretty_midi(alignment, aa_pitch_map, species_instrument_map, tempo_bpm=120, time_step=0.5):
+    """
+    Reference implementation building one pretty_midi.Note per residue.
+    Kept for comparison and benchmarking against the vectorized encoder.
+
+    Returns:
+        pretty_midi.PrettyMIDI: The composed MIDI object.
+    """
+    import pretty_midi
     midi = pretty_midi.PrettyMIDI(initial_tempo=tempo_bpm)
-    
+
     for record in alignment:
-        # Convert record ID back to a nicely formatted species name
-        species = record.id.replace('_', ' ').title()
-        # Get the instrument for this species; default to program 0 (Grand Piano) if not specified
+        species = species_name(record.id)
         instrument_program = species_instrument_map.get(species, 0)
         instrument = pretty_midi.Instrument(program=instrument_program, name=species)
-        
+
         # Iterate over the sequence and create notes for non-gap characters.
         for i, aa in enumerate(record.seq):
             if aa == '-':
                 continue  # Treat gaps as rests.
-            pitch = aa_pitch_map.get(aa, 60)  # Default to middle C if amino acid not mapped.
-            note = pretty_midi.Note(velocity=100, pitch=pitch, start=i * time_step, end=(i+1) * time_step)
+            pitch = aa_pitch_map.get(aa, DEFAULT_PITCH)
+            note = pretty_midi.Note(velocity=DEFAULT_VELOCITY, pitch=pitch, start=i * time_step, end=(i+1) * time_step)
             instrument.notes.append(note)
         midi.instruments.append(instrument)
-    
-    midi.write(midi_filename)
-    print(f"MIDI file written to: {midi_filename}")
+    return midi
+
+def prepare_alignment(gene_name, species_list, reference_species, progress=None):
+    """
+    Run the data stages of the pipeline: fetch sequences and align them.
+    `progress(stage, message, current=None, total=None)` is called between stages.
 
-def create_evolutionary_music(gene_name, species_list, reference_species, midi_filename, tempo_bpm=120, time_step=0.5, instrument_mapping=None):
+    Returns:
+        str: Path to the alignment file.
+    """
+    # The network and aligner stacks are only needed here; importing them lazily keeps startup light.
+    from proteinphonics.alignment import perform_alignment
+    from proteinphonics.fetch import fetch_sequences
+
+    # Fetch the sequences and write them to a FASTA file.
+    with metrics.stage("fetch"):
+        fasta_file = fetch_sequences(gene_name, species_list, reference_species, progress=progress)
+
+    # Perform sequence alignment (MUSCLE or the configured backend).
+    if progress:
+        progress("aligning", f"Aligning {gene_name} across {len(species_list)} species")
+    with metrics.stage("align"):
+        return perform_alignment(fasta_file, reference=reference_record(reference_species or species_list[0]))
+
+def render_alignment(alignment_file, midi_filename=None, tempo_bpm=120, time_step=0.5, instrument_mapping=None,
+                     progress=None, columns=None, residues=None, reference=None, compact=False,
+                     reduce=False, sections=None):
+    """
+    Run the musical stage of the pipeline on an existing alignment file,
+    optionally restricted to a column window or reference residue range,
+    compacted or reduced to consensus voices (see `alignment_to_midi`).
+
+    Returns:
+        bytes: The MIDI file contents.
+    """
+    if progress:
+        progress("rendering", "Rendering MIDI")
+
+    with metrics.stage("render"):
+        # Use provided instrument mapping or fall back to a default from config.
+        if instrument_mapping is None:
+            from config import INSTRUMENT_MAP
+            instrument_mapping = INSTRUMENT_MAP
+
+        if not reduce:
+            # Render from the precomputed feature index; only musical parameters are applied here.
+            from proteinphonics.features import load_features, render_features
+            return render_features(load_features(alignment_file, AA_PITCH_MAP), instrument_mapping, midi_filename,
+                                   tempo_bpm, time_step, columns=columns, residues=residues, reference=reference,
+                                   compact=compact)
+
+        # Read the alignment and generate the MIDI from it.
+        from proteinphonics.alignment import read_alignment
+        alignment = read_alignment(alignment_file)
+        return alignment_to_midi(alignment, AA_PITCH_MAP, instrument_mapping, midi_filename, tempo_bpm, time_step,
+                                 columns=columns, residues=residues, reference=reference, compact=compact,
+                                 reduce=reduce, sections=sections)
+
+def create_evolutionary_music(gene_name, species_list, reference_species, midi_filename=None, tempo_bpm=120, time_step=0.5, instrument_mapping=None, progress=None, profile=PROFILE_RUNS,
+                              columns=None, residues=None, compact=False, reduce=False, sections=None):
     """
     Orchestrate the pipeline: fetch sequences, perform alignment, and generate a MIDI file.
-    
+
     Parameters:
         gene_name (str): Gene name to process.
         species_list (list): List of species names.
         reference_species (str): Reference species used for fetching orthologs.
-        midi_filename (str): Path to save the generated MIDI file.
+        midi_filename (str): Path to save the generated MIDI file (None to skip writing).
         tempo_bpm (int): Tempo (beats per minute) for the MIDI file.
         time_step (float): Duration per note in seconds.
         instrument_mapping (dict): Custom mapping from species to MIDI program numbers.
                                    If None, defaults from configuration will be used.
+        progress (callable): Optional `progress(stage, message, current=None, total=None)`
+                             callback, e.g. `Job.report` from proteinphonics.jobs.
+        profile (bool): Run under cProfile and write the stats to PROFILE_DIR.
+        columns (tuple): Only render this 0-based, half-open column window (start, stop).
+        residues (tuple): Only render the columns covering this 1-based inclusive
+                          residue range of the reference species' protein.
+        compact (bool): Sustain repeated residues and collapse fully conserved columns
+                        into one louder voice, for much smaller MIDI files.
+        reduce (bool): Render a fixed set of consensus voices per clade section instead of
+                       one track per species, for panels of any size.
+        sections (dict): Clade sections for `reduce`: {name: {"program": int, "species": [names]}}.
+
+    Returns:
+        bytes: The MIDI file contents.
     """
-    # Fetch the sequences and write them to a FASTA file.
-    fasta_file = fetch_sequences(gene_name, species_list, reference_species)
-    
-    # Perform sequence alignment using MUSCLE.
-    alignment_file = perform_alignment(fasta_file)
-    
-    # Read the alignment.
-    alignment = read_alignment(alignment_file)
-    
-    # Use provided instrument mapping or fall back to a default from config.
-    if instrument_mapping is None:
-        from config import INSTRUMENT_MAP
-        instrument_mapping = INSTRUMENT_MAP
-    
-    # Ensure the directory for the MIDI file exists.
-    midi_dir = os.path.dirname(midi_filename)
-    if not os.path.exists(midi_dir):
-        os.makedirs(midi_dir)
-    
-    # Generate the MIDI file from the alignment.
-    alignment_to_midi(alignment, AA_PITCH_MAP, instrument_mapping, midi_filename, tempo_bpm, time_step)
+    with metrics.profile_run(gene_name, enabled=profile), metrics.stage("pipeline"):
+        alignment_file = prepare_alignment(gene_name, species_list, reference_species, progress)
+        return render_alignment(alignment_file, midi_filename, tempo_bpm, time_step, instrument_mapping, progress,
+                                columns=columns, residues=residues,
+                                reference=reference_record(reference_species or species_list[0]), compact=compact,
+                                reduce=reduce, sections=sections)
@@ -0,0 +1,153 @@
+# proteinphonics/reduction.py
+"""
+Consensus / chord reduction for large species panels.
+
+Instead of one track per species, the panel is split into clade sections and
+each section is reduced to per-column residue frequency profiles, rendered as
+a fixed set of voices:
+
+    consensus  - the most frequent residue of every column
+    second     - the runner-up residue, in columns that have one
+    gaps       - one low drone for the whole panel, louder where more rows are gapped
+
+Voice loudness follows the residue's frequency in its section, so conservation
+is still audible. The number of tracks and notes per column depends on the
+number of sections, not on the number of species.
+
+Sections are given as {name: {"program": int, "species": [names]}}; species not
+listed in any section are collected in an extra "Other species" section.
+"""
+import numpy as np
+
+from proteinphonics.midi_generation import DEFAULT_PITCH, GAP, merge_runs
+from proteinphonics.smf import MELODIC_CHANNELS, NoteTrack, channel_for_track, seconds_to_ticks
+from proteinphonics.utils import reference_record
+
+DEFAULT_SECTION = "All species"
+OTHER_SECTION = "Other species"
+GAP_DRONE_NAME = "Gap density"
+GAP_DRONE_PROGRAM = 89    # Pad 2 (warm)
+GAP_DRONE_PITCH = 36      # C2
+MIN_VELOCITY = 40         # Velocity of a voice whose residue occurs in almost no rows
+MAX_VELOCITY = 120        # ... and in every row
+VELOCITY_LEVELS = 8       # Frequencies are quantized so repeated notes can merge
+PROFILE_CHUNK_CELLS = 1 << 22  # Matrix cells counted per step
+
+
+def symbol_codes(aa_pitch_map, default=DEFAULT_PITCH):
+    """
+    Map residue bytes to dense symbol codes.
+
+    Returns:
+        tuple: (uint8 lookup table over byte values, pitch of every residue code).
+               Codes 0..n-1 are the mapped residues, n is any other residue and
+               n + 1 is the gap.
+    """
+    residues = list(aa_pitch_map)
+    other = len(residues)
+    table = np.full(256, other, dtype=np.uint8)
+    for code, aa in enumerate(residues):
+        table[ord(aa)] = code
+    table[GAP] = other + 1
+    pitches = np.array([aa_pitch_map[aa] for aa in residues] + [default], dtype=np.uint8)
+    return table, pitches
+
+def residue_profile(matrix, table, symbols):
+    """
+    Count every symbol in every column of `matrix`, a few rows at a time.
+
+    Returns:
+        numpy.ndarray: int64 counts of shape (columns, symbols).
+    """
+    rows, columns = matrix.shape
+    counts = np.zeros(columns * symbols, dtype=np.int64)
+    offsets = np.arange(columns, dtype=np.int64) * symbols
+    step = max(1, PROFILE_CHUNK_CELLS // max(columns, 1))
+    for start in range(0, rows, step):
+        codes = table[np.asarray(matrix[start:start + step])]
+        counts += np.bincount((codes + offsets).ravel(), minlength=columns * symbols)
+    return counts.reshape(columns, symbols)
+
+def frequency_velocity(frequency):
+    """
+    Quantized velocity for residue frequencies in [0, 1].
+    """
+    levels = np.ceil(frequency * VELOCITY_LEVELS) / VELOCITY_LEVELS
+    return np.round(MIN_VELOCITY + (MAX_VELOCITY - MIN_VELOCITY) * levels).astype(np.uint8)
+
+def section_rows(ids, sections=None):
+    """
+    Assign alignment rows to sections.
+
+    Returns:
+        list: (name, program, row indices) for every non-empty section, in order.
+    """
+    if not sections:
+        return [(DEFAULT_SECTION, 0, np.arange(len(ids)))]
+    positions = {record_id: row for row, record_id in enumerate(ids)}
+    assigned = np.zeros(len(ids), dtype=bool)
+    result = []
+    for name, section in sections.items():
+        rows = [positions[record] for record in map(reference_record, section["species"]) if record in positions]
+        rows = np.array(sorted(set(rows)), dtype=np.int64)
+        rows = rows[~assigned[rows]]  # A species listed twice plays in its first section only.
+        assigned[rows] = True
+        if len(rows):
+            result.append((name, int(section.get("program", 0)), rows))
+    if not assigned.all():
+        result.append((OTHER_SECTION, 0, np.flatnonzero(~assigned)))
+    return result
+
+def _voice(name, program, channel, positions, pitches, velocities, boundaries, compact):
+    stops = positions + 1
+    if compact:
+        positions, stops, pitches, velocities = merge_runs(positions, pitches, velocities)
+    return NoteTrack(name=name, program=program, channel=channel, starts=boundaries[positions],
+                     ends=boundaries[stops], pitches=pitches, velocities=velocities)
+
+def reduced_tracks(ids, matrix, aa_pitch_map, sections=None, tempo_bpm=120, time_step=0.5, compact=False):
+    """
+    Render an alignment matrix as consensus and runner-up voices per section
+    plus a gap-density drone.
+
+    Parameters:
+        ids (list): Record IDs, one per matrix row.
+        matrix (numpy.ndarray): uint8 alignment matrix (rows, columns).
+        aa_pitch_map (dict): Amino acid to MIDI pitch.
+        sections (dict): {name: {"program": int, "species": [names]}}; None plays
+                         the whole panel as one section on program 0.
+        tempo_bpm (int), time_step (float): Musical parameters, as in `matrix_to_tracks`.
+        compact (bool): Merge repeated notes of a voice into sustained notes.
+
+    Returns:
+        list: NoteTracks, two per section and the drone last.
+    """
+    groups = section_rows(ids, sections)
+    if 2 * len(groups) + 1 > len(MELODIC_CHANNELS):
+        raise ValueError(f"{len(groups)} sections need more than the {len(MELODIC_CHANNELS)} melodic MIDI channels.")
+    table, pitches = symbol_codes(aa_pitch_map)
+    residues = len(pitches)
+    columns = matrix.shape[1]
+    boundaries = seconds_to_ticks(np.arange(columns + 1) * time_step, tempo_bpm)
+    gaps = np.zeros(columns, dtype=np.int64)
+    tracks = []
+    for name, program, rows in groups:
+        section = matrix if len(rows) == matrix.shape[0] else matrix[rows]
+        profile = residue_profile(section, table, residues + 1)
+        gaps += profile[:, residues]
+        counts = profile[:, :residues]
+        first = np.argmax(counts, axis=1)
+        first_count = counts[np.arange(columns), first]
+        counts[np.arange(columns), first] = 0
+        second = np.argmax(counts, axis=1)
+        second_count = counts[np.arange(columns), second]
+        for voice, codes, found in ((name, first, first_count), (f"{name} (second)", second, second_count)):
+            positions = np.flatnonzero(found)
+            tracks.append(_voice(voice, program, channel_for_track(len(tracks)), positions, pitches[codes[positions]],
+                                 frequency_velocity(found[positions] / len(rows)), boundaries, compact))
+
+    positions = np.flatnonzero(gaps)
+    tracks.append(_voice(GAP_DRONE_NAME, GAP_DRONE_PROGRAM, channel_for_track(len(tracks)), positions,
+                         np.full(len(positions), GAP_DRONE_PITCH, dtype=np.uint8),
+                         frequency_velocity(gaps[positions] / matrix.shape[0]), boundaries, compact))
+    return tracks
@@ -0,0 +1,257 @@
+# proteinphonics/results.py
+"""
+Memoized pipeline results.
+
+`generate_music` keys every request on its full parameter set and keeps the
+MIDI bytes in a size-bounded LRU cache. The fetch + align stages are memoized
+separately on (gene, species, reference), so changing only tempo, time step or
+instruments re-renders from the cached alignment. Concurrent identical requests
+are coalesced: one caller computes, the others wait for its result.
+"""
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict, namedtuple
+from concurrent.futures import Future
+
+from config import (
+    MIDIS_DIR,
+    RESULT_CACHE_MAX_ENTRIES,
+    RESULT_CACHE_MAX_BYTES,
+    ALIGNMENT_MEMO_MAX_ENTRIES,
+    PROFILE_RUNS,
+)
+from proteinphonics import metrics
+from proteinphonics.jobs import JobCancelled
+from proteinphonics.midi_generation import prepare_alignment, render_alignment
+from proteinphonics.utils import reference_record, write_file_atomic
+
+# midi_bytes: the MIDI file; content_hash: SHA-256 of it; midi_path: where it
+# was written (None if it was kept in memory only); audio_path: rendered audio
+# file, if one was requested.
+GeneratedMusic = namedtuple("GeneratedMusic", ["midi_bytes", "content_hash", "midi_path", "audio_path"],
+                            defaults=(None,))
+
+
+class ResultCache:
+    """
+    Thread-safe LRU cache bounded by entry count and total size, with
+    coalescing of concurrent computations for the same key.
+
+    Parameters:
+        max_entries (int): Maximum number of cached values.
+        max_bytes (int): Maximum total size, as measured by `sizeof`.
+        sizeof (callable): Returns the size of a value (default: len for bytes, else 0).
+        name (str): Label for the cache's hit/miss metrics.
+    """
+
+    def __init__(self, max_entries, max_bytes=None, sizeof=None, name="result"):
+        self.name = name
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.sizeof = sizeof or (lambda value: len(value) if isinstance(value, (bytes, bytearray)) else 0)
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self._entries = OrderedDict()
+        self._total_bytes = 0
+        self._inflight = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def total_bytes(self):
+        return self._total_bytes
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return self._entries[key]
+        return default
+
+    def put(self, key, value):
+        size = self.sizeof(value)
+        with self._lock:
+            if key in self._entries:
+                self._total_bytes -= self.sizeof(self._entries.pop(key))
+            if self.max_bytes is not None and size > self.max_bytes:
+                return  # Too large to ever fit; don't evict everything else for it.
+            self._entries[key] = value
+            self._total_bytes += size
+            while len(self._entries) > self.max_entries or (
+                    self.max_bytes is not None and self._total_bytes > self.max_bytes):
+                _, evicted = self._entries.popitem(last=False)
+                self._total_bytes -= self.sizeof(evicted)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._total_bytes = 0
+
+    def get_or_compute(self, key, compute):
+        """
+        Return the cached value for `key`, computing it with `compute()` if needed.
+        If another thread is already computing the same key, wait for its result
+        instead of computing it again. If that computation is cancelled, a waiter
+        takes over and computes the value itself.
+        """
+        while True:
+            value, future, owner = self._claim(key)
+            if future is None:
+                return value
+            if owner:
+                break
+            try:
+                return future.result()
+            except JobCancelled:
+                continue  # The owning job was cancelled, not us; try again.
+
+        try:
+            value = compute()
+        except BaseException as exc:
+            self._release(key)
+            future.set_exception(exc)
+            raise
+        self.put(key, value)
+        self._release(key)
+        future.set_result(value)
+        return value
+
+    def _release(self, key):
+        with self._lock:
+            self._inflight.pop(key, None)
+
+    def _claim(self, key):
+        """
+        Return (value, None, False) on a hit, or (None, future, owner) where
+        `owner` says whether the caller must compute the value.
+        """
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                result = "hit"
+                value, future, owner = self._entries[key], None, False
+            else:
+                future = self._inflight.get(key)
+                owner = future is None
+                if owner:
+                    self.misses += 1
+                    result = "miss"
+                    future = Future()
+                    self._inflight[key] = future
+                else:
+                    self.coalesced += 1
+                    result = "coalesced"
+                value = None
+        metrics.increment("result_cache_total", cache=self.name, result=result)
+        return value, future, owner
+
+
+def parameter_key(**params):
+    """
+    Build a stable cache key from a parameter set.
+    """
+    encoded = json.dumps(params, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+def music_key(gene_name, species_list, reference_species, tempo_bpm=120, time_step=0.5, instrument_mapping=None,
+              columns=None, residues=None, compact=False, reduce=False, sections=None):
+    """
+    Cache key of a full `generate_music` parameter set.
+    """
+    return parameter_key(gene=gene_name, species=list(species_list), reference=reference_species,
+                         tempo=tempo_bpm, time_step=time_step, instruments=instrument_mapping,
+                         columns=columns, residues=residues, compact=compact, reduce=reduce, sections=sections)
+
+
+_midi_cache = ResultCache(RESULT_CACHE_MAX_ENTRIES, RESULT_CACHE_MAX_BYTES, name="midi")
+_alignment_cache = ResultCache(ALIGNMENT_MEMO_MAX_ENTRIES, name="alignment")
+
+def cached_alignment(gene_name, species_list, reference_species, progress=None):
+    """
+    Memoized fetch + align stages.
+
+    Returns:
+        str: Path to the alignment file.
+    """
+    key = parameter_key(gene=gene_name, species=list(species_list), reference=reference_species)
+
+    def compute():
+        return prepare_alignment(gene_name, species_list, reference_species, progress)
+
+    path = _alignment_cache.get_or_compute(key, compute)
+    if not os.path.exists(path):
+        # The artifact was removed behind our back; recompute it.
+        path = prepare_alignment(gene_name, species_list, reference_species, progress)
+        _alignment_cache.put(key, path)
+    return path
+
+def generate_music(gene_name, species_list, reference_species, tempo_bpm=120, time_step=0.5,
+                   instrument_mapping=None, write_file=False, progress=None, profile=PROFILE_RUNS,
+                   columns=None, residues=None, compact=False, reduce=False, sections=None):
+    """
+    Generate (or fetch from cache) the MIDI for a full parameter set.
+
+    Parameters:
+        gene_name (str): Gene name to process.
+        species_list (list): List of species names.
+        reference_species (str): Reference species used for fetching orthologs.
+        tempo_bpm (int): Tempo (beats per minute) for the MIDI file.
+        time_step (float): Duration per note in seconds.
+        instrument_mapping (dict): Custom mapping from species to MIDI program numbers.
+        write_file (bool): Also write the MIDI to MIDIS_DIR, named by its content hash.
+        progress (callable): Optional `progress(stage, message, current=None, total=None)` callback.
+        profile (bool): Run under cProfile and write the stats to PROFILE_DIR.
+        columns (tuple): Only render this 0-based, half-open column window (start, stop).
+        residues (tuple): Only render this 1-based inclusive residue range of the reference species.
+        compact (bool): Sustain repeated residues and collapse fully conserved columns.
+        reduce (bool): Render consensus voices per clade section instead of one track per species.
+        sections (dict): Clade sections for `reduce`: {name: {"program": int, "species": [names]}}.
+
+    Returns:
+        GeneratedMusic: The MIDI bytes, their content hash and the file path (if written).
+    """
+    key = music_key(gene_name, species_list, reference_species, tempo_bpm, time_step, instrument_mapping,
+                    columns, residues, compact, reduce, sections)
+
+    def compute():
+        alignment_file = cached_alignment(gene_name, species_list, reference_species, progress)
+        return render_alignment(alignment_file, None, tempo_bpm, time_step, instrument_mapping, progress,
+                                columns=columns, residues=residues,
+                                reference=reference_record(reference_species or species_list[0]), compact=compact,
+                                reduce=reduce, sections=sections)
+
+    with metrics.profile_run(gene_name, enabled=profile), metrics.stage("pipeline"):
+        midi_bytes = _midi_cache.get_or_compute(key, compute)
+    content_hash = hashlib.sha256(midi_bytes).hexdigest()
+    midi_path = None
+    if write_file:
+        midi_path = os.path.join(MIDIS_DIR, f"{content_hash[:16]}.mid")
+        if not os.path.exists(midi_path):
+            write_file_atomic(midi_path, midi_bytes)
+    return GeneratedMusic(midi_bytes, content_hash, midi_path)
+
+def cached_music(key):
+    """
+    Return the cached MIDI bytes for a `music_key`, or None. Never waits for in-flight work.
+    """
+    return _midi_cache.get(key)
+
+def remember_music(key, midi_bytes):
+    """
+    Add MIDI bytes rendered outside `generate_music` (e.g. by proteinphonics.service) to its cache.
+    """
+    _midi_cache.put(key, midi_bytes)
+
+def clear_caches():
+    """
+    Drop all memoized results (on-disk caches are untouched).
+    """
+    _midi_cache.clear()
+    _alignment_cache.clear()
@@ -0,0 +1,479 @@
+# proteinphonics/service.py
+"""
+Headless HTTP API for generating music from other services.
+
+    POST /generate   JSON parameters (below) -> the MIDI file (audio/midi), or the
+                     rendered audio file with "audio": "wav" | "ogg"
+    GET  /health     JSON: generations in flight, running, and the limits
+    GET  /metrics    Prometheus text (proteinphonics.metrics)
+
+Request body (only "gene" is required; "species" defaults to INSTRUMENT_MAP's
+species and "reference" to the first species):
+
+    {"gene": "HOXA5", "species": [...], "reference": "Homo sapiens",
+     "tempo": 120, "time_step": 0.5, "instruments": {species: program},
+     "columns": [start, stop], "residues": [first, last], "compact": false,
+     "reduce": false, "sections": {...}, "audio": null}
+
+The server is one asyncio event loop that never runs pipeline work itself:
+fetching (Ensembl and SQLite) runs on threads, alignment and rendering run in
+a pool of SERVICE_WORKERS processes, and audio synthesis (the shared audio
+process pool) is started from a thread. Identical requests share one in-flight
+generation, requests for the same panel share its fetch and alignment, and
+results go into the same MIDI cache as `generate_music`.
+Once SERVICE_MAX_PENDING distinct generations are in flight, new ones are
+refused with 429, Retry-After and the queue headers X-Queue-Depth,
+X-Queue-Limit and X-Running; requests that hit the cache or join an
+in-flight generation are always served.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import math
+import os
+import re
+import signal
+import time
+from concurrent.futures import ProcessPoolExecutor
+from http import HTTPStatus
+
+from config import (
+    INSTRUMENT_MAP,
+    SERVICE_HOST,
+    SERVICE_MAX_BODY,
+    SERVICE_MAX_PENDING,
+    SERVICE_PORT,
+    SERVICE_READ_TIMEOUT,
+    SERVICE_WORKERS,
+)
+from proteinphonics import metrics
+from proteinphonics.audio import AUDIO_FORMATS
+from proteinphonics.batch import init_align_worker
+from proteinphonics.results import cached_music, music_key, remember_music
+from proteinphonics.utils import reference_record
+from proteinphonics.warm import worker_context
+
+REQUEST_FIELDS = ("gene", "species", "reference", "tempo", "time_step", "instruments", "columns", "residues",
+                  "compact", "reduce", "sections", "audio")
+AUDIO_CONTENT_TYPES = {"wav": "audio/wav", "ogg": "audio/ogg"}
+# Gene symbols and species names go into Ensembl URLs and FASTA file names.
+GENE_PATTERN = re.compile(r"[A-Za-z0-9][A-Za-z0-9._-]*")
+SPECIES_PATTERN = re.compile(r"[A-Za-z][A-Za-z ]*")
+
+logger = logging.getLogger(__name__)
+
+
+class HTTPError(Exception):
+    """An error answered with `status` and a JSON {"error": message} body."""
+
+    def __init__(self, status, message, headers=None):
+        super().__init__(message)
+        self.status = status
+        self.headers = headers or {}
+
+
+def _window(payload, name):
+    value = payload.get(name)
+    if value is None:
+        return None
+    if not (isinstance(value, list) and len(value) == 2 and all(isinstance(v, int) for v in value)):
+        raise ValueError(f'"{name}" must be a list of two integers.')
+    return tuple(value)
+
+def _positive(payload, name, default):
+    value = payload.get(name, default)
+    if isinstance(value, bool) or not isinstance(value, (int, float)) or value <= 0:
+        raise ValueError(f'"{name}" must be a positive number.')
+    return value
+
+def parse_request(payload):
+    """
+    Validate a /generate request body.
+
+    Returns:
+        tuple: (keyword arguments for `music_key` / the pipeline, audio format or None).
+    """
+    if not isinstance(payload, dict):
+        raise ValueError("The request body must be a JSON object.")
+    unknown = sorted(set(payload) - set(REQUEST_FIELDS))
+    if unknown:
+        raise ValueError(f"Unknown field(s): {', '.join(unknown)}.")
+    gene = payload.get("gene")
+    if not isinstance(gene, str) or not gene.strip():
+        raise ValueError('"gene" (a gene symbol) is required.')
+    if not GENE_PATTERN.fullmatch(gene.strip()):
+        raise ValueError('"gene" must be a gene symbol (letters, digits, ".", "_" and "-").')
+    species = payload.get("species") or list(INSTRUMENT_MAP)
+    if not isinstance(species, list) or not all(isinstance(name, str) for name in species):
+        raise ValueError('"species" must be a list of species names.')
+    invalid = [name for name in species if name not in INSTRUMENT_MAP and not SPECIES_PATTERN.fullmatch(name)]
+    if invalid:
+        raise ValueError(f"Invalid species name(s): {', '.join(map(repr, invalid))}.")
+    reference = payload.get("reference")
+    if reference is not None and reference not in species:
+        raise ValueError(f"Reference species '{reference}' must be in species.")
+    instruments = payload.get("instruments")
+    if instruments is not None and not (isinstance(instruments, dict)
+                                        and all(isinstance(p, int) for p in instruments.values())):
+        raise ValueError('"instruments" must map species names to MIDI program numbers.')
+    sections = payload.get("sections")
+    if sections is not None and not isinstance(sections, dict):
+        raise ValueError('"sections" must be an object of clade sections.')
+    audio = payload.get("audio")
+    if audio is not None and audio not in AUDIO_FORMATS:
+        raise ValueError(f'"audio" must be one of: {", ".join(AUDIO_FORMATS)}.')
+    params = dict(
+        gene_name=gene.strip(), species_list=species, reference_species=reference,
+        tempo_bpm=_positive(payload, "tempo", 120), time_step=_positive(payload, "time_step", 0.5),
+        instrument_mapping=instruments, columns=_window(payload, "columns"), residues=_window(payload, "residues"),
+        compact=bool(payload.get("compact", False)), reduce=bool(payload.get("reduce", False) or sections),
+        sections=sections,
+    )
+    return params, audio
+
+
+def _fetch(gene_name, species_list, reference_species):
+    from proteinphonics.fetch import fetch_sequences
+    with metrics.stage("fetch"):
+        return fetch_sequences(gene_name, species_list, reference_species)
+
+def _align_job(fasta_file, reference, backend):
+    """
+    Align one panel in a worker process.
+
+    Returns:
+        tuple: (alignment file path, (wall seconds, CPU seconds)).
+    """
+    from proteinphonics.alignment import perform_alignment
+    wall, cpu = time.perf_counter(), time.process_time()
+    alignment_file = perform_alignment(fasta_file, backend=backend, reference=reference)
+    return alignment_file, (time.perf_counter() - wall, time.process_time() - cpu)
+
+def _render_job(alignment_file, reference, render):
+    """
+    Render one request's MIDI from its panel alignment in a worker process.
+
+    Returns:
+        tuple: (MIDI bytes, (wall seconds, CPU seconds)).
+    """
+    from proteinphonics.midi_generation import render_alignment
+    wall, cpu = time.perf_counter(), time.process_time()
+    midi_bytes = render_alignment(alignment_file, None, reference=reference, **render)
+    return midi_bytes, (time.perf_counter() - wall, time.process_time() - cpu)
+
+def _observe(stage, timing):
+    # The worker's own metrics stay in its process; record its timings here.
+    wall, cpu = timing
+    metrics.observe("stage_wall_seconds", wall, stage=stage)
+    metrics.observe("stage_cpu_seconds", cpu, stage=stage)
+
+
+class GenerationService:
+    """
+    Coalescing, admission control and bounded execution of /generate requests.
+    Create and use it on the event loop that serves the requests.
+
+    Parameters:
+        workers (int): Processes aligning and rendering at once (None = CPU count).
+        max_pending (int): Distinct generations in flight before new ones get 429.
+        backend (str): Alignment backend name; defaults to ALIGNMENT_BACKEND.
+    """
+
+    def __init__(self, workers=SERVICE_WORKERS, max_pending=SERVICE_MAX_PENDING, backend=None):
+        self.workers = workers or os.cpu_count() or 1
+        self.max_pending = max_pending
+        self.backend = backend
+        self.running = 0
+        self._inflight = {}
+        self._panels = {}  # In-flight fetch + align per panel, shared by requests that differ only in rendering
+        self._slots = asyncio.Semaphore(self.workers)
+        self._seconds = None  # Moving average of a generation's duration, for Retry-After
+        self._pool = ProcessPoolExecutor(self.workers, mp_context=worker_context(), initializer=init_align_worker)
+
+    def close(self):
+        """Stop the worker processes; running generations are abandoned."""
+        for task in list(self._inflight.values()) + list(self._panels.values()):
+            task.cancel()
+        self._pool.shutdown(wait=True, cancel_futures=True)
+
+    def status(self):
+        """Queue state, as reported by /health and the X-Queue-* headers."""
+        return {"in_flight": len(self._inflight), "running": self.running, "workers": self.workers,
+                "max_pending": self.max_pending}
+
+    def queue_headers(self):
+        return {"X-Queue-Depth": str(len(self._inflight)), "X-Queue-Limit": str(self.max_pending),
+                "X-Running": str(self.running)}
+
+    def _retry_after(self):
+        seconds = self._seconds or 1.0
+        return max(1, math.ceil(seconds * len(self._inflight) / self.workers))
+
+    async def _coalesced(self, key, make):
+        """
+        Await the in-flight task for `key`, starting `make()` if there is none.
+
+        Returns:
+            tuple: (result, whether an in-flight task was joined).
+        """
+        task = self._inflight.get(key)
+        joined = task is not None
+        if not joined:
+            if len(self._inflight) >= self.max_pending:
+                metrics.increment("service_requests_total", result="rejected")
+                raise HTTPError(HTTPStatus.TOO_MANY_REQUESTS, "Too many generations in flight; retry later.",
+                                dict(self.queue_headers(), **{"Retry-After": str(self._retry_after())}))
+            task = asyncio.ensure_future(make())
+            self._inflight[key] = task
+            task.add_done_callback(lambda done: self._finished(self._inflight, key, done))
+        # A client going away must not cancel work other requests are waiting for.
+        return await asyncio.shield(task), joined
+
+    def _finished(self, tasks, key, task):
+        tasks.pop(key, None)
+        if not task.cancelled():
+            task.exception()  # Retrieved here so an unawaited failure is not logged as lost.
+
+    async def _run(self, fn, *args):
+        """Run `fn(*args)` in the process pool, at most `workers` at a time."""
+        async with self._slots:
+            self.running += 1
+            try:
+                return await asyncio.get_running_loop().run_in_executor(self._pool, fn, *args)
+            finally:
+                self.running -= 1
+
+    async def _align_panel(self, gene_name, species_list, reference_species):
+        fasta_file = await asyncio.to_thread(_fetch, gene_name, species_list, reference_species)
+        alignment_file, timing = await self._run(_align_job, fasta_file, reference_record(reference_species),
+                                                 self.backend)
+        _observe("align", timing)
+        return alignment_file
+
+    async def _panel(self, params):
+        """
+        Return the alignment file of a request's panel, fetching and aligning it
+        once for all in-flight requests with the same gene, species and reference.
+        """
+        reference_species = params["reference_species"] or params["species_list"][0]
+        key = (params["gene_name"], tuple(params["species_list"]), reference_species)
+        task = self._panels.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._align_panel(params["gene_name"], params["species_list"],
+                                                           reference_species))
+            self._panels[key] = task
+            task.add_done_callback(lambda done: self._finished(self._panels, key, done))
+        return await asyncio.shield(task)
+
+    async def _generate(self, key, params):
+        start = time.perf_counter()
+        reference = reference_record(params["reference_species"] or params["species_list"][0])
+        alignment_file = await self._panel(params)
+        render = {name: params[name] for name in ("tempo_bpm", "time_step", "instrument_mapping", "columns",
+                                                  "residues", "compact", "reduce", "sections")}
+        midi_bytes, timing = await self._run(_render_job, alignment_file, reference, render)
+        _observe("render", timing)
+        remember_music(key, midi_bytes)
+        seconds = time.perf_counter() - start
+        self._seconds = seconds if self._seconds is None else 0.8 * self._seconds + 0.2 * seconds
+        return midi_bytes
+
+    async def generate(self, params):
+        """
+        Return (MIDI bytes, cache result) for a parsed request; the cache result
+        is "hit", "coalesced" or "miss".
+        """
+        key = music_key(**params)
+        midi_bytes = cached_music(key)
+        if midi_bytes is not None:
+            result = "hit"
+        else:
+            midi_bytes, joined = await self._coalesced(key, lambda: self._generate(key, params))
+            result = "coalesced" if joined else "miss"
+        metrics.increment("service_requests_total", result=result)
+        return midi_bytes, result
+
+    async def audio(self, midi_bytes, audio_format):
+        """Return the rendered audio file path for MIDI bytes (coalesced per content and format)."""
+        from proteinphonics.audio import audio_available, render_audio
+        if not await asyncio.to_thread(audio_available):  # May import FluidSynth
+            raise HTTPError(HTTPStatus.NOT_IMPLEMENTED, "Audio rendering is not available on this server.")
+        key = ("audio", hashlib.sha256(midi_bytes).hexdigest(), audio_format)
+
+        async def render():
+            # The thread only coordinates: tracks are synthesized in audio.py's shared
+            # pool of AUDIO_WORKERS forkserver processes, never forked from this one.
+            async with self._slots:
+                return await asyncio.to_thread(render_audio, midi_bytes, audio_format)
+
+        path, _ = await self._coalesced(key, render)
+        return path
+
+
+async def _read_request(reader):
+    """
+    Read one HTTP/1.1 request.
+
+    Returns:
+        tuple: (method, path, headers with lower-case names, body), or None at end of stream.
+    """
+    line = await asyncio.wait_for(reader.readline(), SERVICE_READ_TIMEOUT)
+    if not line.strip():
+        return None
+    try:
+        method, path, _ = line.decode("latin-1").split()
+    except ValueError:
+        raise HTTPError(HTTPStatus.BAD_REQUEST, "Malformed request line.")
+    headers = {}
+    while True:
+        line = await asyncio.wait_for(reader.readline(), SERVICE_READ_TIMEOUT)
+        if line in (b"\r\n", b"\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+    if "chunked" in headers.get("transfer-encoding", ""):
+        raise HTTPError(HTTPStatus.LENGTH_REQUIRED, "Send the body with a Content-Length.")
+    try:
+        length = int(headers.get("content-length") or 0)
+    except ValueError:
+        length = -1
+    if length < 0:
+        raise HTTPError(HTTPStatus.BAD_REQUEST, "Content-Length must be a non-negative integer.")
+    if length > SERVICE_MAX_BODY:
+        raise HTTPError(HTTPStatus.REQUEST_ENTITY_TOO_LARGE, f"Request bodies are limited to {SERVICE_MAX_BODY} bytes.")
+    body = await asyncio.wait_for(reader.readexactly(length), SERVICE_READ_TIMEOUT) if length else b""
+    return method, path, headers, body
+
+def _response(status, body, content_type="application/json", headers=None, keep_alive=True):
+    status = HTTPStatus(status)
+    lines = [f"HTTP/1.1 {status.value} {status.phrase}", f"Content-Type: {content_type}",
+             f"Content-Length: {len(body)}", f"Connection: {'keep-alive' if keep_alive else 'close'}"]
+    lines += [f"{name}: {value}" for name, value in (headers or {}).items()]
+    return ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1") + body
+
+def _json(value):
+    return json.dumps(value).encode("utf-8")
+
+def _read_file(path):
+    with open(path, "rb") as f:
+        return f.read()
+
+
+class GenerationServer:
+    """
+    The HTTP front end of a GenerationService (see the module docstring).
+    """
+
+    def __init__(self, service):
+        self.service = service
+
+    async def dispatch(self, method, path, body):
+        """
+        Answer one request.
+
+        Returns:
+            tuple: (status, body, content type, extra headers).
+        """
+        path = path.split("?", 1)[0]
+        if method == "GET" and path == "/health":
+            return HTTPStatus.OK, _json(self.service.status()), "application/json", {}
+        if method == "GET" and path == "/metrics":
+            return HTTPStatus.OK, metrics.prometheus_text().encode("utf-8"), "text/plain; version=0.0.4", {}
+        if path != "/generate":
+            raise HTTPError(HTTPStatus.NOT_FOUND, f"Unknown endpoint {path}.")
+        if method != "POST":
+            raise HTTPError(HTTPStatus.METHOD_NOT_ALLOWED, "Use POST /generate.", {"Allow": "POST"})
+
+        try:
+            params, audio_format = parse_request(json.loads(body or b"null"))
+            midi_bytes, result = await self.service.generate(params)
+        except ValueError as exc:  # Including json.JSONDecodeError
+            raise HTTPError(HTTPStatus.BAD_REQUEST, str(exc))
+        except OSError as exc:  # Includes requests.RequestException
+            logger.warning("Generation failed upstream: %s", exc)
+            raise HTTPError(HTTPStatus.BAD_GATEWAY, f"Upstream error: {exc}")
+        except RuntimeError as exc:  # e.g. sequences Ensembl did not return
+            raise HTTPError(HTTPStatus.BAD_GATEWAY, str(exc))
+
+        headers = dict(self.service.queue_headers(), **{
+            "X-Content-Hash": hashlib.sha256(midi_bytes).hexdigest(), "X-Cache": result})
+        if audio_format is None:
+            return HTTPStatus.OK, midi_bytes, "audio/midi", headers
+        try:
+            path = await self.service.audio(midi_bytes, audio_format)
+            audio_bytes = await asyncio.to_thread(_read_file, path)
+        except HTTPError:
+            raise
+        except (FileNotFoundError, ImportError, RuntimeError) as exc:  # SoundFont, FluidSynth or soundfile missing
+            logger.warning("Audio rendering is unavailable: %s", exc)
+            raise HTTPError(HTTPStatus.NOT_IMPLEMENTED, "Audio rendering is not available on this server.")
+        except Exception:
+            logger.exception("Audio rendering failed")
+            raise HTTPError(HTTPStatus.INTERNAL_SERVER_ERROR, "Audio rendering failed.")
+        return HTTPStatus.OK, audio_bytes, AUDIO_CONTENT_TYPES[audio_format], headers
+
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                keep_alive, request = True, None
+                try:
+                    request = await _read_request(reader)
+                    if request is None:
+                        break
+                    method, path, headers, body = request
+                    keep_alive = headers.get("connection", "").lower() != "close"
+                    status, body, content_type, extra = await self.dispatch(method, path, body)
+                except HTTPError as exc:
+                    status, body, content_type, extra = exc.status, _json({"error": str(exc)}), "application/json", \
+                        exc.headers
+                except Exception:
+                    logger.exception("Request failed")
+                    status, body, content_type, extra = (HTTPStatus.INTERNAL_SERVER_ERROR,
+                                                         _json({"error": "Internal server error."}),
+                                                         "application/json", {})
+                if request is None:
+                    keep_alive = False  # Failed before the body was read: the stream is unusable.
+                writer.write(_response(status, body, content_type, extra, keep_alive))
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (asyncio.TimeoutError, asyncio.IncompleteReadError, ConnectionError):
+            pass  # Idle, truncated or dropped connection.
+        finally:
+            writer.close()
+
+
+async def serve(host=SERVICE_HOST, port=SERVICE_PORT, workers=SERVICE_WORKERS, max_pending=SERVICE_MAX_PENDING,
+                backend=None):
+    """
+    Serve the generation API until cancelled, SIGINT or SIGTERM.
+    """
+    service = GenerationService(workers, max_pending, backend)
+    server = await asyncio.start_server(GenerationServer(service).handle, host, port)
+    address = server.sockets[0].getsockname()
+    logger.info("Serving the generation API on http://%s:%d/ (%d workers, %d pending)", address[0], address[1],
+                service.workers, service.max_pending)
+    loop = asyncio.get_running_loop()
+    serving = asyncio.ensure_future(server.serve_forever())
+    for signum in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(signum, serving.cancel)
+        except (NotImplementedError, RuntimeError):
+            pass  # No signal handlers on this platform; Ctrl-C still stops asyncio.run.
+    try:
+        async with server:
+            await serving
+    except asyncio.CancelledError:
+        logger.info("Generation API stopped.")
+    finally:
+        service.close()
+
+def run_service(**kwargs):
+    """
+    Blocking entry point for `python -m proteinphonics serve`; stops on Ctrl-C.
+    """
+    try:
+        asyncio.run(serve(**kwargs))
+    except KeyboardInterrupt:
+        pass
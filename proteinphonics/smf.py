@@ -0,0 +1,139 @@
+# proteinphonics/smf.py
+"""
+Direct Standard MIDI File (SMF) encoder working on NumPy note arrays.
+
+The byte layout matches what `pretty_midi.PrettyMIDI.write` produces through
+mido (format 1, a timing track followed by one track per instrument, note-offs
+as velocity-0 note-ons, running status), so files are interchangeable with the
+original pipeline, but no per-note Python objects are created.
+"""
+import struct
+from collections import namedtuple
+
+import numpy as np
+
+DEFAULT_RESOLUTION = 220  # Ticks per quarter note (pretty_midi's default)
+
+# One instrument track. `starts`, `ends` are absolute ticks; `pitches` and
+# `velocities` are integer arrays of the same length, in time order.
+NoteTrack = namedtuple("NoteTrack", ["name", "program", "channel", "starts", "ends", "pitches", "velocities"])
+
+# MIDI channel 9 is reserved for drums; instruments cycle over the other 15.
+MELODIC_CHANNELS = [c for c in range(16) if c != 9]
+
+def channel_for_track(index):
+    """
+    Return the MIDI channel pretty_midi assigns to the `index`-th instrument.
+    """
+    return MELODIC_CHANNELS[index % len(MELODIC_CHANNELS)]
+
+def tick_scale(tempo_bpm, resolution=DEFAULT_RESOLUTION):
+    """
+    Seconds per tick at a constant tempo.
+    """
+    return 60.0 / (tempo_bpm * resolution)
+
+def seconds_to_ticks(times, tempo_bpm, resolution=DEFAULT_RESOLUTION):
+    """
+    Convert times in seconds to absolute ticks, rounding half to even like pretty_midi.
+    """
+    return np.round(np.asarray(times, dtype=np.float64) / tick_scale(tempo_bpm, resolution)).astype(np.int64)
+
+def _vlq(value):
+    """
+    Encode one non-negative integer as a MIDI variable-length quantity.
+    """
+    out = [value & 0x7F]
+    value >>= 7
+    while value:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    return bytes(reversed(out))
+
+def _chunk(tag, data):
+    return tag + struct.pack(">I", len(data)) + bytes(data)
+
+def _meta(delta, meta_type, payload):
+    return _vlq(delta) + bytes([0xFF, meta_type]) + _vlq(len(payload)) + payload
+
+def timing_track(tempo_bpm, resolution=DEFAULT_RESOLUTION):
+    """
+    Encode the timing track: tempo and a 4/4 time signature at tick 0.
+    """
+    microseconds_per_beat = int(6e7 / (60. / (tick_scale(tempo_bpm, resolution) * resolution)))
+    data = _meta(0, 0x51, microseconds_per_beat.to_bytes(3, "big"))
+    data += _meta(0, 0x58, bytes([4, 2, 24, 8]))
+    data += _meta(1, 0x2F, b"")
+    return _chunk(b"MTrk", data)
+
+def note_events(track):
+    """
+    Build the time-sorted note-on/note-off event arrays of a track.
+
+    Returns:
+        tuple: (ticks, pitches, velocities) arrays, sorted the way pretty_midi
+               sorts them: by tick, then pitch, with note-offs before note-ons.
+    """
+    count = len(track.pitches)
+    ticks = np.empty(2 * count, dtype=np.int64)
+    pitches = np.empty(2 * count, dtype=np.int64)
+    velocities = np.zeros(2 * count, dtype=np.int64)
+    ticks[0::2] = track.starts
+    ticks[1::2] = track.ends
+    pitches[0::2] = track.pitches
+    pitches[1::2] = track.pitches
+    velocities[0::2] = track.velocities
+    order = np.argsort(ticks * 65536 + pitches * 256 + velocities, kind="stable")
+    return ticks[order], pitches[order], velocities[order]
+
+def _encode_note_events(ticks, pitches, velocities, status):
+    """
+    Vectorized byte encoding of delta-timed note-on events with running status.
+    """
+    deltas = np.diff(ticks, prepend=0)
+    vlq_len = 1 + (deltas >= 1 << 7) + (deltas >= 1 << 14) + (deltas >= 1 << 21)
+    sizes = vlq_len + 2
+    sizes[0] += 1  # The first event carries the status byte; the rest use running status.
+    offsets = np.concatenate(([0], np.cumsum(sizes)[:-1]))
+    out = np.empty(int(sizes.sum()), dtype=np.uint8)
+    for k in range(4):
+        mask = vlq_len > k
+        remaining = vlq_len[mask] - 1 - k
+        byte = (deltas[mask] >> (7 * remaining)) & 0x7F
+        out[offsets[mask] + k] = byte | np.where(remaining > 0, 0x80, 0)
+    data_offsets = offsets + vlq_len
+    out[data_offsets[0]] = status
+    data_offsets[0] += 1
+    out[data_offsets] = pitches
+    out[data_offsets + 1] = velocities
+    return out.tobytes()
+
+def instrument_track(track):
+    """
+    Encode one instrument track: name, program change, notes and end of track.
+    """
+    data = bytearray()
+    if track.name:
+        data += _meta(0, 0x03, track.name.encode("latin1"))
+    data += bytes([0x00, 0xC0 | track.channel, track.program])
+    if len(track.pitches):
+        ticks, pitches, velocities = note_events(track)
+        data += _encode_note_events(ticks, pitches, velocities, 0x90 | track.channel)
+    # End of track one tick after the last event.
+    data += _meta(1, 0x2F, b"")
+    return _chunk(b"MTrk", data)
+
+def encode_midi(tracks, tempo_bpm=120, resolution=DEFAULT_RESOLUTION):
+    """
+    Encode NoteTracks as a format-1 Standard MIDI File.
+
+    Parameters:
+        tracks (list): NoteTrack tuples, one per instrument.
+        tempo_bpm (float): Tempo in beats per minute.
+        resolution (int): Ticks per quarter note.
+
+    Returns:
+        bytes: The complete .mid file contents.
+    """
+    header = _chunk(b"MThd", struct.pack(">hhh", 1, len(tracks) + 1, resolution))
+    return b"".join([header, timing_track(tempo_bpm, resolution)] + [instrument_track(t) for t in tracks])
@@ -0,0 +1,175 @@
+# proteinphonics/streaming.py
+"""
+Progressive playback: stream rendered notes to the browser in time order.
+
+`stream_chunks` renders a feature index (see proteinphonics.features) a few
+seconds of music at a time and yields each chunk as soon as it is ready, so
+the first notes are available after rendering one chunk, whatever the length
+of the protein. `serve_streams` exposes registered streams from a daemon
+thread:
+
+    GET /stream/<token>   newline-delimited JSON, sent with chunked transfer encoding:
+                          a header line (tempo, duration, tracks), then one line
+                          per chunk with its notes as [track, start, end, pitch, velocity]
+                          (seconds), in start-time order
+    GET /midi/<token>     the complete .mid file, rendered on request
+
+Streams are registered by alignment file and render parameters, so nothing is
+rendered until a player connects and the whole file is never held as a string.
+"""
+import json
+import logging
+import secrets
+import threading
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from config import STREAM_CHUNK_SECONDS, STREAM_MAX_REGISTERED, STREAM_PUBLIC_URL
+from proteinphonics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+def stream_chunks(features, species_instrument_map, tempo_bpm=120, time_step=0.5, columns=None, residues=None,
+                  reference=None, compact=False, chunk_seconds=STREAM_CHUNK_SECONDS):
+    """
+    Render a feature index as a sequence of time-ordered note chunks.
+
+    Parameters:
+        features (AlignmentFeatures): The alignment's feature index.
+        species_instrument_map (dict), tempo_bpm, time_step, columns, residues,
+        reference, compact: As for `render_features`.
+        chunk_seconds (float): Music per chunk.
+
+    Yields:
+        dict: First {"type": "header", ...}, then {"type": "notes", "index", "start",
+              "end", "notes"} per chunk. Notes held across a chunk boundary
+              (compact mode) are split at the boundary.
+    """
+    # NumPy and the renderer load on first use, not when the app starts the server.
+    import numpy as np
+    from proteinphonics.features import features_to_tracks, resolve_window
+    from proteinphonics.smf import tick_scale
+    start, stop = resolve_window(features, columns, residues, reference)
+    step = max(1, int(round(chunk_seconds / time_step)))
+    seconds_per_tick = tick_scale(tempo_bpm)
+    tracks = features_to_tracks(features, species_instrument_map, tempo_bpm, time_step, start, start, compact)
+    yield {
+        "type": "header",
+        "tempo": tempo_bpm,
+        "duration": (stop - start) * time_step,
+        "tracks": [{"name": t.name, "program": int(t.program), "channel": int(t.channel)} for t in tracks],
+    }
+    for index, first in enumerate(range(start, stop, step)):
+        last = min(first + step, stop)
+        offset = (first - start) * time_step
+        tracks = features_to_tracks(features, species_instrument_map, tempo_bpm, time_step, first, last, compact)
+        numbers = np.concatenate([np.full(len(t.starts), n) for n, t in enumerate(tracks)])
+        starts = np.concatenate([t.starts for t in tracks]) * seconds_per_tick + offset
+        ends = np.concatenate([t.ends for t in tracks]) * seconds_per_tick + offset
+        pitches = np.concatenate([t.pitches for t in tracks])
+        velocities = np.concatenate([t.velocities for t in tracks])
+        order = np.lexsort((numbers, starts))
+        notes = [[int(n), round(float(s), 4), round(float(e), 4), int(p), int(v)]
+                 for n, s, e, p, v in zip(numbers[order], starts[order], ends[order], pitches[order],
+                                          velocities[order])]
+        yield {"type": "notes", "index": index, "start": offset, "end": (last - start) * time_step, "notes": notes}
+
+
+_streams = OrderedDict()
+_streams_lock = threading.Lock()
+
+def register_stream(alignment_file, instrument_mapping, tempo_bpm=120, time_step=0.5, columns=None, residues=None,
+                    reference=None, compact=False):
+    """
+    Register render parameters for an alignment and return the stream token.
+    The oldest registrations are forgotten beyond STREAM_MAX_REGISTERED.
+    """
+    token = secrets.token_urlsafe(16)
+    params = dict(instrument_mapping=instrument_mapping, tempo_bpm=tempo_bpm, time_step=time_step, columns=columns,
+                  residues=residues, reference=reference, compact=compact)
+    with _streams_lock:
+        _streams[token] = (alignment_file, params)
+        while len(_streams) > STREAM_MAX_REGISTERED:
+            _streams.popitem(last=False)
+    return token
+
+def _lookup(token):
+    with _streams_lock:
+        return _streams.get(token)
+
+def stream_url(token, kind="stream"):
+    """
+    Return the browser-facing URL of a registered stream (`kind` "stream" or "midi").
+    """
+    base = STREAM_PUBLIC_URL or f"http://127.0.0.1:{_server.server_port}"
+    return f"{base.rstrip('/')}/{kind}/{token}"
+
+
+class _StreamHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        parts = self.path.strip("/").split("/")
+        entry = _lookup(parts[1]) if len(parts) == 2 else None
+        if entry is None or parts[0] not in ("stream", "midi"):
+            self.send_error(404)
+            return
+        from proteinphonics.features import load_features, render_features, resolve_window
+        alignment_file, params = entry
+        params = dict(params)
+        instrument_mapping = params.pop("instrument_mapping")
+        features = load_features(alignment_file)
+        try:
+            # Reject a bad window before the 200: a chunked stream cannot report it later.
+            resolve_window(features, params["columns"], params["residues"], params["reference"])
+        except ValueError as exc:
+            self.send_error(400, explain=str(exc))
+            return
+        if parts[0] == "midi":
+            body = render_features(features, instrument_mapping, **params)
+            self.send_response(200)
+            self.send_header("Content-Type", "audio/midi")
+            self.send_header("Content-Length", str(len(body)))
+            self.send_header("Access-Control-Allow-Origin", "*")
+            self.end_headers()
+            self.wfile.write(body)
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.send_header("Cache-Control", "no-store")
+        self.send_header("Access-Control-Allow-Origin", "*")
+        self.end_headers()
+        try:
+            with metrics.stage("stream"):
+                for chunk in stream_chunks(features, instrument_mapping, **params):
+                    line = json.dumps(chunk, separators=(",", ":")).encode("utf-8") + b"\n"
+                    self.wfile.write(b"%x\r\n%s\r\n" % (len(line), line))
+                    self.wfile.flush()
+                    metrics.increment("stream_chunks_total")
+            self.wfile.write(b"0\r\n\r\n")
+        except (BrokenPipeError, ConnectionResetError):
+            logger.debug("Stream client went away")
+
+    def log_message(self, format, *args):
+        logger.debug("stream %s - " + format, self.address_string(), *args)
+
+
+_server = None
+_server_lock = threading.Lock()
+
+def serve_streams(port, host="127.0.0.1"):
+    """
+    Serve /stream/<token> and /midi/<token> from a daemon thread.
+    Calling it again returns the already-running server. Raises OSError if
+    the port cannot be bound (a later call retries).
+    """
+    global _server
+    with _server_lock:
+        if _server is None:
+            _server = ThreadingHTTPServer((host, port), _StreamHandler)
+            threading.Thread(target=_server.serve_forever, name="streams", daemon=True).start()
+            logger.info("Serving MIDI streams on http://%s:%d/", host, _server.server_port)
+        return _server
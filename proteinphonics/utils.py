@@ -1,5 +1,8 @@
 # proteinphonics/utils.py
+import hashlib
+import logging
 import os
+import tempfile
 
 def ensure_directory_exists(directory):
     """
@@ -7,4 +10,74 @@ def ensure_directory_exists(directory):
     If it does not, create it.
     """
     if not os.path.exists(directory):
-        os.makedirs(directory)
+        os.makedirs(directory, exist_ok=True)
+
+def configure_logging(level=None):
+    """
+    Configure root logging for the command-line and app entry points.
+    `level` defaults to LOG_LEVEL from config (PROTEINPHONICS_LOG_LEVEL).
+    """
+    from config import LOG_LEVEL
+    logging.basicConfig(level=(level or LOG_LEVEL).upper(),
+                        format="%(asctime)s %(levelname)s %(name)s: %(message)s")
+
+def reference_record(species):
+    """
+    Convert a species name to its record ID in FASTA and alignment files.
+    """
+    return species.lower().replace(" ", "_")
+
+def sequence_hash(sequence):
+    """
+    Return the content address (SHA-256 hex digest) of a sequence string.
+    """
+    return hashlib.sha256(sequence.encode("ascii")).hexdigest()
+
+def write_file_atomic(path, data):
+    """
+    Write `data` (str or bytes) to `path` atomically.
+    The content goes to a temporary file in the same directory which is then
+    renamed over the target, so readers never observe a partial file.
+    """
+    directory = os.path.dirname(path) or "."
+    ensure_directory_exists(directory)
+    mode = "wb" if isinstance(data, (bytes, bytearray)) else "w"
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-", suffix=os.path.basename(path))
+    try:
+        with os.fdopen(fd, mode) as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+def read_fasta(path):
+    """
+    Read a (possibly aligned) FASTA file.
+
+    Returns:
+        list: (name, sequence) tuples in file order; names are the header up to the first space.
+    """
+    records = []
+    name, chunks = None, []
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            if line.startswith(">"):
+                if name is not None:
+                    records.append((name, "".join(chunks)))
+                name, chunks = line[1:].split(" ", 1)[0], []
+            else:
+                chunks.append(line)
+    if name is not None:
+        records.append((name, "".join(chunks)))
+    return records
+
+def write_fasta(path, records):
+    """
+    Atomically write (name, sequence) tuples to a FASTA file.
+    """
+    write_file_atomic(path, "".join(f">{name}\n{sequence}\n" for name, sequence in records))
@@ -0,0 +1,97 @@
+# proteinphonics/warm.py
+"""
+Warm-up worker for the app process.
+
+The app imports only light modules at startup; NumPy, requests, the Ensembl
+client, the aligners and the renderers load on first use. `start_warm_worker`
+moves that first-use cost off the first request: a daemon thread imports the
+heavy modules, opens the Ensembl session and loads the feature indexes of the
+most recently used alignments into the resident cache while the UI renders.
+
+The process pools (star aligner, audio synthesis, batch and service workers)
+all start from `worker_context()`, which preloads the same modules in the
+fork server, so their workers start warm too.
+"""
+import glob
+import importlib
+import logging
+import multiprocessing
+import os
+import threading
+import time
+
+from config import ALIGNMENTS_DIR, WARM_PRELOAD_ALIGNMENTS
+
+logger = logging.getLogger(__name__)
+
+# Modules the pipeline needs for a request, heaviest dependencies first.
+HEAVY_MODULES = (
+    "numpy",
+    "requests",
+    "proteinphonics.ensembl",
+    "proteinphonics.fetch",
+    "proteinphonics.alignment",
+    "proteinphonics.midi_generation",
+    "proteinphonics.features",
+    "proteinphonics.reduction",
+    "proteinphonics.results",
+)
+
+
+def recent_alignments(limit=WARM_PRELOAD_ALIGNMENTS, directory=ALIGNMENTS_DIR):
+    """
+    Return the `limit` most recently modified aligned FASTA files, newest first.
+    """
+    paths = glob.glob(os.path.join(directory, "aligned_*.fasta"))
+    return sorted(paths, key=os.path.getmtime, reverse=True)[:limit]
+
+def warm_up(preload=WARM_PRELOAD_ALIGNMENTS):
+    """
+    Import the heavy modules, open the Ensembl session and load the feature
+    indexes of the `preload` most recent alignments.
+
+    Returns:
+        float: Seconds spent.
+    """
+    start = time.perf_counter()
+    for name in HEAVY_MODULES:
+        importlib.import_module(name)
+    from proteinphonics.ensembl import get_client
+    from proteinphonics.features import load_features
+    get_client()
+    for path in recent_alignments(preload):
+        try:
+            load_features(path)
+        except (OSError, ValueError) as exc:
+            logger.warning("Could not preload %s: %s", path, exc)
+    seconds = time.perf_counter() - start
+    logger.info("Warm-up finished in %.2f s", seconds)
+    return seconds
+
+def worker_context():
+    """
+    Return the multiprocessing context for worker process pools: "forkserver"
+    with HEAVY_MODULES preloaded where available, otherwise "spawn". Pools are
+    created from processes that run threads, so workers must not be forked
+    from them (a child can inherit a lock held by another thread).
+    """
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context("forkserver")
+        context.set_forkserver_preload(list(HEAVY_MODULES))
+        return context
+    return multiprocessing.get_context("spawn")
+
+_worker = None
+_worker_lock = threading.Lock()
+
+def start_warm_worker(preload=WARM_PRELOAD_ALIGNMENTS):
+    """
+    Run `warm_up` once per process on a daemon thread; later calls return the
+    same thread.
+    """
+    global _worker
+    with _worker_lock:
+        if _worker is None:
+            _worker = threading.Thread(target=warm_up, args=(preload,), name="warm-up", daemon=True)
+            _worker.start()
+        return _worker
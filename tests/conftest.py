@@ -0,0 +1,53 @@
+# tests/conftest.py
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [ROOT, os.path.join(ROOT, "benchmarks")]
+
+from ensembl_stub import EnsemblStub  # noqa: E402
+from proteinphonics import ensembl, results  # noqa: E402
+
+
+@pytest.fixture(autouse=True)
+def workdir(tmp_path, monkeypatch):
+    """Run every test in an empty directory, so data/ and the cache database start empty."""
+    monkeypatch.chdir(tmp_path)
+    results.clear_caches()
+    yield tmp_path
+    results.clear_caches()
+
+
+@pytest.fixture(scope="session")
+def _stub():
+    with EnsemblStub(synthetic=True) as stub:
+        yield stub
+
+
+@pytest.fixture
+def stub(_stub, monkeypatch):
+    """The Ensembl stub, with fresh counters, serving the process-wide client."""
+    _stub.reset_stats()
+    client = ensembl.EnsemblClient(server=_stub.url)
+    monkeypatch.setattr(ensembl, "_default_client", client)
+    yield _stub
+    client.close()
+
+
+@pytest.fixture
+def fake_backend(monkeypatch):
+    """Make the `fake` backend the default and count its align / profile_align calls."""
+    from fixtures import FakeBackend
+    from proteinphonics import alignment
+    calls = {"align": 0, "profile_align": 0}
+    for method in calls:
+        original = getattr(FakeBackend, method)
+
+        def counted(self, *args, _method=method, _original=original, **kwargs):
+            calls[_method] += 1
+            return _original(self, *args, **kwargs)
+        monkeypatch.setattr(FakeBackend, method, counted)
+    monkeypatch.setattr(alignment, "ALIGNMENT_BACKEND", "fake")
+    return calls
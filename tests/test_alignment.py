@@ -0,0 +1,38 @@
+# tests/test_alignment.py
+import os
+
+import pytest
+
+from config import UNIQUE_ALIGNMENTS_DIR
+from proteinphonics.alignment import StarBackend, perform_alignment
+from proteinphonics.utils import read_fasta, write_fasta
+
+A, B, C = "MKTAYIAKQRQISFVKSHFSRQ", "MKTAYIAKQRQISFVKSHFSRQLEERLGLIEVQ", "MKAYIAKQRQWSFVKSHFSRQ"
+DUPLICATED = [("a", A), ("b", B), ("c", A), ("d", C), ("e", B)]
+
+
+@pytest.mark.parametrize("reference", ["a", "b", "d"])
+def test_duplicate_panel_matches_realigning_every_row(reference):
+    write_fasta("dup.fasta", DUPLICATED)
+    aligned = read_fasta(perform_alignment("dup.fasta", backend="star", reference=reference))
+    assert aligned == StarBackend().align(DUPLICATED, reference=reference)
+
+
+def test_duplicate_panel_aligns_distinct_sequences_once(fake_backend):
+    write_fasta("dup.fasta", DUPLICATED)
+    first = perform_alignment("dup.fasta")
+    assert fake_backend["align"] == 1
+    (unique,) = os.listdir(UNIQUE_ALIGNMENTS_DIR)
+    assert len(read_fasta(os.path.join(UNIQUE_ALIGNMENTS_DIR, unique))) == 3
+
+    # Same sequences under other names: shares the distinct-sequence alignment.
+    write_fasta("renamed.fasta", [(name.upper(), seq) for name, seq in DUPLICATED])
+    renamed = perform_alignment("renamed.fasta")
+    assert renamed != first and fake_backend["align"] == 1
+    assert perform_alignment("dup.fasta") == first and fake_backend["align"] == 1
+
+
+def test_panel_without_duplicates_is_written_once(fake_backend):
+    write_fasta("plain.fasta", [("a", A), ("b", B), ("c", C)])
+    perform_alignment("plain.fasta")
+    assert not os.path.exists(UNIQUE_ALIGNMENTS_DIR) or not os.listdir(UNIQUE_ALIGNMENTS_DIR)
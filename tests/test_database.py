@@ -0,0 +1,35 @@
+# tests/test_database.py
+from proteinphonics import database
+from proteinphonics.alignment import perform_alignment
+from proteinphonics.utils import read_fasta, write_fasta
+
+A, B, C = "MKTAYIAKQRQISFVKSHFSRQ", "MKTAYIAKQRQISFVKSHFSRQLEERLGLIEVQ", "MKAYIAKQRQWSFVKSHFSRQ"
+
+
+def test_overlapping_alignments_by_member():
+    database.register_alignment("small", "fake", "small.fasta", [("a", "1"), ("b", "2")])
+    database.register_alignment("large", "fake", "large.fasta", [("a", "1"), ("b", "2"), ("c", "3")])
+    database.register_alignment("other", "star", "other.fasta", [("a", "1"), ("b", "2")])
+    assert database.find_containing_alignments([("a", "1"), ("b", "2")], "fake") == [
+        ("small", "small.fasta", 2), ("large", "large.fasta", 3)]
+    assert database.find_containing_alignments([("a", "1"), ("b", "9")], "fake") == []
+    assert database.find_contained_alignments([("a", "1"), ("b", "2"), ("c", "3"), ("d", "4")], "fake") == [
+        ("large", "large.fasta", 3), ("small", "small.fasta", 2)]
+    assert database.find_contained_alignments([], "fake") == []
+
+
+def test_subset_is_projected_and_superset_extended(fake_backend):
+    write_fasta("full.fasta", [("a", A), ("b", B), ("c", C)])
+    full = read_fasta(perform_alignment("full.fasta"))
+    assert fake_backend == {"align": 1, "profile_align": 0}
+
+    write_fasta("subset.fasta", [("a", A), ("c", C)])
+    subset = read_fasta(perform_alignment("subset.fasta"))
+    assert fake_backend == {"align": 1, "profile_align": 0}
+    assert [name for name, _ in subset] == ["a", "c"]
+    assert subset[0][1].replace("-", "") == A and len(subset[0][1]) <= len(full[0][1])
+
+    write_fasta("superset.fasta", [("a", A), ("b", B), ("c", C), ("d", A + "W")])
+    superset = read_fasta(perform_alignment("superset.fasta"))
+    assert fake_backend == {"align": 1, "profile_align": 1}
+    assert [name for name, _ in superset] == ["a", "b", "c", "d"]
@@ -0,0 +1,79 @@
+# tests/test_ensembl.py
+import json
+
+import pytest
+
+from proteinphonics.ensembl import iter_json_array
+from proteinphonics.fetch import _longest_translation_id, best_orthologs
+
+DOCUMENT = json.dumps({
+    "data": [{"id": "ENSG1", "homologies": [
+        {"species": "mus_musculus", "protein_id": "ENSMUSP2", "type": "ortholog_one2many"},
+        1234567,
+        "split é string",
+        [10, 20.5, None, True],
+        {"species": "danio_rerio", "protein_id": "ENSDARP1", "nested": {"homologies": []}},
+    ]}],
+}).encode("utf-8")
+EXPECTED = json.loads(DOCUMENT)["data"][0]["homologies"]
+
+
+def chunked(data, size):
+    return [data[i:i + size] for i in range(0, len(data), size)]
+
+
+@pytest.mark.parametrize("size", [1, 2, 3, 7, 64, len(DOCUMENT)])
+def test_iter_json_array_splits_anywhere(size):
+    assert list(iter_json_array(chunked(DOCUMENT, size), "homologies")) == EXPECTED
+
+
+def test_iter_json_array_does_not_cut_numbers_at_chunk_boundaries():
+    assert list(iter_json_array([b'{"homologies": [12', b'34, 5', b'6]}'], "homologies")) == [1234, 56]
+
+
+def test_iter_json_array_rejects_truncated_documents():
+    with pytest.raises(ValueError):
+        list(iter_json_array([b'{"homologies": [1, 2'], "homologies"))
+
+
+def test_best_orthologs_prefers_one_to_one_then_lowest_protein_id():
+    homologies = [
+        {"species": "mus_musculus", "protein_id": "ENSMUSP3", "type": "ortholog_one2many"},
+        {"species": "mus_musculus", "protein_id": "ENSMUSP2", "type": "ortholog_one2one"},
+        {"species": "mus_musculus", "protein_id": "ENSMUSP1", "type": "ortholog_one2many"},
+        {"species": "danio_rerio", "protein_id": "ENSDARP9", "type": "ortholog_one2many"},
+        {"species": "danio_rerio", "protein_id": "ENSDARP4", "type": "ortholog_one2many"},
+        {"species": "gallus_gallus", "protein_id": None, "type": "ortholog_one2one"},
+    ]
+    assert best_orthologs(homologies) == {"mus_musculus": "ENSMUSP2", "danio_rerio": "ENSDARP4"}
+    assert best_orthologs(reversed(homologies)) == best_orthologs(homologies)
+
+
+def test_reference_protein_is_the_longest_translation_like_the_local_index():
+    gene = {"Transcript": [
+        {"id": "ENST3", "Translation": {"id": "ENSP3", "length": 250}},
+        {"id": "ENST1"},  # Non-coding
+        {"id": "ENST2", "Translation": {"id": "ENSP9", "length": 338}},
+        {"id": "ENST4", "Translation": {"id": "ENSP5", "length": 338}},
+    ]}
+    assert _longest_translation_id(gene) == "ENSP5"
+    assert _longest_translation_id({"Transcript": [{"id": "ENST1"}]}) is None
+
+
+def test_ortholog_map_is_reused_by_later_panels(stub):
+    from contextlib import closing
+    from proteinphonics import database
+    from proteinphonics.fetch import fetch_sequences
+    fetch_sequences("HOXA5", ["Homo sapiens", "Mus musculus", "Danio rerio"])
+    assert stub.stats["/homology/symbol"] == 1
+
+    stub.reset_stats()
+    fetch_sequences("HOXA5", ["Homo sapiens", "Danio rerio"])
+    assert stub.stats["requests"] == 0
+
+    # Without the cached proteins, the panel is rebuilt from the persisted ortholog map.
+    with closing(database.connect()) as conn, conn:
+        conn.execute("DELETE FROM proteins")
+    stub.reset_stats()
+    fetch_sequences("HOXA5", ["Homo sapiens", "Mus musculus", "Danio rerio"])
+    assert stub.stats["/homology/symbol"] == 0 and stub.stats["/lookup/symbol"] == 0
@@ -0,0 +1,30 @@
+# tests/test_pipeline_cache.py
+from proteinphonics import results
+from proteinphonics.utils import read_fasta
+
+PANEL = ["Homo sapiens", "Mus musculus", "Danio rerio"]
+
+
+def test_alignment_memo_skips_fetch_and_align(stub, fake_backend):
+    first = results.cached_alignment("HOXA5", PANEL, "Homo sapiens")
+    assert stub.stats["requests"] > 0 and fake_backend["align"] == 1
+    stub.reset_stats()
+    assert results.cached_alignment("HOXA5", PANEL, "Homo sapiens") == first
+    assert stub.stats["requests"] == 0 and fake_backend["align"] == 1
+
+
+def test_identical_panel_is_served_from_the_on_disk_caches(stub, fake_backend):
+    first = results.cached_alignment("HOXA5", PANEL, "Homo sapiens")
+    results.clear_caches()  # Only the SQLite sequence and alignment caches are left.
+    stub.reset_stats()
+    assert results.cached_alignment("HOXA5", PANEL, "Homo sapiens") == first
+    assert stub.stats["requests"] == 0 and fake_backend["align"] == 1
+
+
+def test_panels_of_one_gene_get_their_own_fasta(stub, fake_backend):
+    from proteinphonics.fetch import fetch_sequences
+    small = fetch_sequences("HOXA5", PANEL[:2])
+    large = fetch_sequences("HOXA5", PANEL)
+    assert small != large
+    assert [name for name, _ in read_fasta(small)] == ["homo_sapiens", "mus_musculus"]
+    assert len(read_fasta(large)) == 3
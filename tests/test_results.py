@@ -0,0 +1,46 @@
+# tests/test_results.py
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from proteinphonics.results import ResultCache
+
+
+def test_concurrent_identical_requests_compute_once():
+    cache = ResultCache(8)
+    calls = []
+    started = threading.Event()
+
+    def compute():
+        calls.append(1)
+        started.set()
+        time.sleep(0.2)  # Long enough for every other caller to arrive while in flight.
+        return b"midi"
+
+    with ThreadPoolExecutor(8) as pool:
+        first = pool.submit(cache.get_or_compute, "key", compute)
+        started.wait()
+        others = [pool.submit(cache.get_or_compute, "key", compute) for _ in range(7)]
+        values = [first.result()] + [future.result() for future in others]
+    assert values == [b"midi"] * 8
+    assert len(calls) == 1
+    assert (cache.misses, cache.coalesced) == (1, 7)
+    assert cache.get_or_compute("key", compute) == b"midi" and cache.hits == 1 and len(calls) == 1
+
+
+def test_eviction_respects_entry_and_byte_limits():
+    cache = ResultCache(3, max_bytes=10)
+    for key in "abc":
+        cache.put(key, b"xx")
+    cache.get("a")  # Now the most recently used.
+    cache.put("d", b"xx")  # Four entries: the least recently used ("b") goes.
+    assert list(cache._entries) == ["c", "a", "d"] and cache.total_bytes == 6
+
+    cache.put("e", b"xxxx")  # 10 bytes fit, but four entries do not: "c" goes.
+    assert list(cache._entries) == ["a", "d", "e"] and cache.total_bytes == 8
+
+    cache.put("f", b"xxxxxx")  # 14 bytes: evict from the old end until both limits hold.
+    assert list(cache._entries) == ["e", "f"] and cache.total_bytes == 10
+
+    cache.put("huge", b"x" * 11)  # Can never fit: not cached, and nothing else is evicted for it.
+    assert list(cache._entries) == ["e", "f"] and cache.total_bytes == 10
@@ -0,0 +1,94 @@
+import asyncio
+import re
+
+import pytest
+
+from proteinphonics.fetch import write_panel_fasta
+from proteinphonics.service import GenerationServer, HTTPError, parse_request
+
+
+class _Writer:
+    def __init__(self):
+        self.data = b""
+
+    def write(self, data):
+        self.data += data
+
+    async def drain(self):
+        pass
+
+    def close(self):
+        pass
+
+
+def _exchange(raw):
+    """Feed raw requests to one connection; return the responses' status lines and Connection headers."""
+    async def run():
+        reader, writer = asyncio.StreamReader(), _Writer()
+        reader.feed_data(raw)
+        reader.feed_eof()
+        await GenerationServer(None).handle(reader, writer)
+        return writer.data
+    responses = re.findall(rb"(HTTP/1.1 [^\r]*)\r\n.*?Connection: (\S+)", asyncio.run(run()), re.S)
+    return [(status.decode(), connection == b"close") for status, connection in responses]
+
+
+@pytest.mark.parametrize("payload", [
+    {"gene": "../../x"},
+    {"gene": "HOXA5/x"},
+    {"gene": "HOXA5?species=x"},
+    {"gene": "HOXA5", "species": ["Homo sapiens", "../x"]},
+    {"gene": "HOXA5", "species": ["Homo sapiens", "mus_musculus?x"]},
+])
+def test_unsafe_names_are_rejected(payload):
+    with pytest.raises(ValueError):
+        parse_request(payload)
+
+
+def test_gene_symbols_and_species_names_are_accepted():
+    params, _ = parse_request({"gene": " MT-CO1 ", "species": ["Homo sapiens", "Mus musculus"]})
+    assert params["gene_name"] == "MT-CO1"
+
+
+@pytest.mark.parametrize("gene", ["../x", "a/b", ".."])
+def test_panel_fasta_names_stay_under_fasta_dir(gene):
+    with pytest.raises(ValueError):
+        write_panel_fasta(gene, ["Homo sapiens"], {"Homo sapiens": ("P1", "MKV")})
+
+
+@pytest.mark.parametrize("length", [b"abc", b"-5"])
+def test_bad_content_length_closes_the_connection(length):
+    second = b"GET /nowhere HTTP/1.1\r\n\r\n"
+    raw = b"POST /generate HTTP/1.1\r\nContent-Length: " + length + b"\r\n\r\n{}" + second
+    assert _exchange(raw) == [("HTTP/1.1 400 Bad Request", True)]
+
+
+def test_errors_after_the_body_keep_the_connection():
+    raw = b"POST /nowhere HTTP/1.1\r\nContent-Length: 2\r\n\r\n{}" + b"GET /nowhere HTTP/1.1\r\n\r\n"
+    assert _exchange(raw) == [("HTTP/1.1 404 Not Found", False), ("HTTP/1.1 404 Not Found", False)]
+
+
+class _AudioService:
+    def __init__(self, error):
+        self.error = error
+
+    async def generate(self, params):
+        return b"MThd", "hit"
+
+    def queue_headers(self):
+        return {}
+
+    async def audio(self, midi_bytes, audio_format):
+        raise self.error
+
+
+@pytest.mark.parametrize("error, status, message", [
+    (FileNotFoundError("/srv/GeneralUser.sf2"), 501, "Audio rendering is not available on this server."),
+    (ImportError("fluidsynth"), 501, "Audio rendering is not available on this server."),
+    (KeyError("/srv/audio/secret"), 500, "Audio rendering failed."),
+])
+def test_audio_failures_are_mapped(error, status, message):
+    server = GenerationServer(_AudioService(error))
+    with pytest.raises(HTTPError) as exc_info:
+        asyncio.run(server.dispatch("POST", "/generate", b'{"gene": "HOXA5", "audio": "wav"}'))
+    assert exc_info.value.status == status and str(exc_info.value) == message
@@ -0,0 +1,31 @@
+# tests/test_smf.py
+import io
+import os
+from types import SimpleNamespace
+
+import pytest
+
+from config import AA_PITCH_MAP, INSTRUMENT_MAP
+from proteinphonics.midi_generation import alignment_to_matrix, alignment_to_pretty_midi, matrix_to_tracks
+from proteinphonics.smf import encode_midi
+from proteinphonics.utils import read_fasta
+
+FASTA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "fasta")
+
+
+def bundled_alignment(gene):
+    """The bundled panel, padded to equal length so both encoders see the same gapped rows."""
+    records = read_fasta(os.path.join(FASTA_DIR, f"{gene}.fasta"))
+    width = max(len(seq) for _, seq in records)
+    return [SimpleNamespace(id=name, seq=seq.ljust(width, "-")) for name, seq in records]
+
+
+@pytest.mark.parametrize("gene", ["HOXA5", "MT-CO1", "RPLP0"])
+@pytest.mark.parametrize("tempo_bpm, time_step", [(120, 0.5), (90, 0.1), (200, 0.25)])
+def test_encode_midi_matches_pretty_midi(gene, tempo_bpm, time_step):
+    alignment = bundled_alignment(gene)
+    reference = io.BytesIO()
+    alignment_to_pretty_midi(alignment, AA_PITCH_MAP, INSTRUMENT_MAP, tempo_bpm, time_step).write(reference)
+    ids, matrix = alignment_to_matrix(alignment)
+    tracks = matrix_to_tracks(ids, matrix, AA_PITCH_MAP, INSTRUMENT_MAP, tempo_bpm, time_step)
+    assert encode_midi(tracks, tempo_bpm) == reference.getvalue()